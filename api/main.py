@@ -1,27 +1,41 @@
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, status, Request, BackgroundTasks
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from datetime import timedelta, datetime
 import time
 import asyncio
-from typing import Dict, List
+import hmac
+from typing import Dict, List, Optional
 from jose.exceptions import ExpiredSignatureError, JWTError
 from app.config import Config
 from app.line_service import send_line_notification
-from app import models, schemas, crud, auth
-from app.database import SessionLocal, engine
+from app import models, schemas, crud, auth, metrics, task_archive
+from app import image_processing
+from app.database import SessionLocal
+from app.health import HEALTHY, HealthMonitor
+from app.log import get_logger, setup_logging
 from app.task_notify import TaskNotify
+from app.image_upload_worker import ImageUploadWorker
+from app.image_deletion import ImageDeletionWorker, delete_pending_images
+from app.retention import RetentionWorker, run_retention
 from contextlib import asynccontextmanager
 
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import json
 from app.connections import connections
 import pytz
 
-task_notify_service = None
 NO_LIFESPAN_ENVS = ["vercel", "development", "test"]
+# 不启动后台服务的环境(serverless)同步写日志，进程冻结前不会遗留未写出的日志
+setup_logging(queued=Config.ENV not in NO_LIFESPAN_ENVS)
+logger = get_logger(__name__)
+
+task_notify_service = None
+image_upload_worker = None
+image_deletion_worker = None
+retention_worker = None
 
 
 def get_local_date_str():
@@ -29,7 +43,7 @@ def get_local_date_str():
     try:
         local_tz = pytz.timezone(Config.TIMEZONE)
     except pytz.UnknownTimeZoneError:
-        print(f"未知的时区: {Config.TIMEZONE}，使用 Asia/Taipei")
+        logger.warning("未知的时区: %s，使用 Asia/Taipei", Config.TIMEZONE)
         local_tz = pytz.timezone('Asia/Taipei')
     now = datetime.now(local_tz)
     return now.strftime("%m%d")
@@ -39,14 +53,31 @@ def get_local_date_str():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 启动时执行
-    global task_notify_service
+    global task_notify_service, image_upload_worker, image_deletion_worker
+    global retention_worker
     db = SessionLocal()
     task_notify_service = TaskNotify(db)
     asyncio.create_task(task_notify_service.start())
+    image_deletion_worker = ImageDeletionWorker()
+    asyncio.create_task(image_deletion_worker.start())
+    if Config.DEFERRED_IMAGE_UPLOAD:
+        image_upload_worker = ImageUploadWorker(image_deletion_worker)
+        asyncio.create_task(image_upload_worker.start())
+    retention_worker = RetentionWorker()
+    asyncio.create_task(retention_worker.start())
+    asyncio.create_task(health_monitor.start())
     yield
     # 关闭时执行
     if task_notify_service:
         task_notify_service.stop()
+    if image_upload_worker:
+        image_upload_worker.stop()
+    image_processing.shutdown()
+    if image_deletion_worker:
+        image_deletion_worker.stop()
+    if retention_worker:
+        retention_worker.stop()
+    health_monitor.stop()
 
 
 app_kwargs = {
@@ -99,8 +130,11 @@ app.add_middleware(
     allow_methods=["*"],  # 允许所有方法
     allow_headers=["*"],  # 允许所有头部
 )
+# 请求耗时、查询次数统计(最外层，包含 CORS 处理时间)
+app.add_middleware(metrics.MetricsMiddleware)
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 
 def check_config():
@@ -126,6 +160,9 @@ def check_config():
         raise ValueError(f"缺少必要的環境變數： {', '.join(missing_vars)}")
 
 
+health_monitor = HealthMonitor(check_config)
+
+
 def get_token_user(
         credentials: HTTPAuthorizationCredentials = Depends(security)):
     """从token中获取用户信息"""
@@ -161,7 +198,7 @@ def get_db_for_login(max_retries=3, delay=1):
         db = None  # 初始化 db 变量
         while retries < max_retries:
             try:
-                print(f"---------数据库连接 (尝试 {retries}/{max_retries})")
+                logger.debug("---------数据库连接 (尝试 %s/%s)", retries, max_retries)
                 db = SessionLocal()
                 yield db
                 return
@@ -171,8 +208,8 @@ def get_db_for_login(max_retries=3, delay=1):
                     raise
                 # 其他异常才重试
                 retries += 1
-                print(
-                    f"---------数据库连接失败 (尝试 {retries}/{max_retries}): {str(e)}")
+                logger.warning("---------数据库连接失败 (尝试 %s/%s): %s", retries,
+                               max_retries, e)
                 if retries == max_retries:
                     raise HTTPException(
                         status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -180,7 +217,7 @@ def get_db_for_login(max_retries=3, delay=1):
                     )
                 time.sleep(delay)
             finally:
-                print(f"---------数据库關閉 (尝试 {retries}/{max_retries})")
+                logger.debug("---------数据库關閉 (尝试 %s/%s)", retries, max_retries)
                 if db:
                     db.close()
 
@@ -272,6 +309,44 @@ def get_current_user(
                             detail="伺服器內部錯誤")
 
 
+def require_monitoring_access(
+        credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """
+    监控端点的存取验证：Config.METRICS_TOKEN(供 Prometheus 等抓取)
+    或管理员的登入 token
+    """
+    token = credentials.credentials
+    if Config.METRICS_TOKEN and hmac.compare_digest(
+            token.encode(), Config.METRICS_TOKEN.encode()):
+        return
+    db = SessionLocal()
+    try:
+        user = get_current_user(credentials, db)
+    finally:
+        db.close()
+    if not user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="僅限管理員查看監控資料")
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """检查请求的 If-None-Match 是否与 ETag 相符(弱比较)"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(
+        tag.removeprefix("W/") == etag.removeprefix("W/")
+        for tag in candidates)
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                    headers={"ETag": etag})
+
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Message Board API"}
@@ -332,7 +407,7 @@ async def login_for_access_token(form_data: dict,
                     user_id=Config.LINE_MESSAGING_ADMIN_ID,
                     message="使用者登入訊息系統")
             except Exception as e:
-                print(f"LINE 通知發送失敗: {str(e)}")
+                logger.error("LINE 通知發送失敗: %s", e)
                 # 不抛出异常，继续执行登录流程
 
         # 更新 displayname(有時間時，修改此段挪到 crud)
@@ -343,6 +418,9 @@ async def login_for_access_token(form_data: dict,
                 models.DisplayName.user_id == user.id).first()
 
             if existing_display_name:
+                # 留言列表包含 display_name，名称变更时需要让留言的 ETag 失效
+                if existing_display_name.displayname != display_name:
+                    crud.bump_sync_version(db, crud.MESSAGES_SCOPE)
                 # 更新现有的 displayname
                 existing_display_name.displayname = display_name
                 existing_display_name.updated_at = func.now()
@@ -351,6 +429,7 @@ async def login_for_access_token(form_data: dict,
                 new_display_name = models.DisplayName(user_id=user.id,
                                                       displayname=display_name)
                 db.add(new_display_name)
+                crud.bump_sync_version(db, crud.MESSAGES_SCOPE)
 
             db.commit()
 
@@ -397,16 +476,28 @@ def read_users_me(current_user: models.User = Depends(get_current_user)):
 
 
 @app.get("/messages/", response_model=list[schemas.Message])
-def get_messages(skip: int = 0,
+def get_messages(request: Request,
+                 response: Response,
+                 skip: int = 0,
                  limit: int = 100,
                  current_user: models.User = Depends(get_current_user),
                  db: Session = Depends(get_db_with_retry())):
     try:
+        # 留言版本号未变时直接返回 304，不查询留言表
+        version = crud.get_sync_version(db, crud.MESSAGES_SCOPE)
+        etag = f'W/"messages-{version}"'
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response.headers["ETag"] = etag
+
         messages = db.query(models.Message).order_by(
             models.Message.created_at.desc()).offset(skip).limit(limit).all()
 
+        image_statuses = crud.get_image_statuses(db, [m.id for m in messages])
+
         # 为每条消息添加display_name和is_admin
         for message in messages:
+            message.image_status = image_statuses.get(message.id)
             user = db.query(
                 models.User).filter(models.User.id == message.user_id).first()
             display_name = db.query(models.DisplayName).filter(
@@ -421,8 +512,51 @@ def get_messages(skip: int = 0,
                             detail="獲取留言失敗")
 
 
+MESSAGE_SEARCH_ORDERS = ("rank", "recent")
+
+
+@app.get("/messages/search", response_model=schemas.MessageSearchResult)
+def search_messages(q: str,
+                    user_id: Optional[int] = None,
+                    order: str = "rank",
+                    cursor: Optional[str] = None,
+                    limit: int = 20,
+                    current_user: models.User = Depends(get_current_user),
+                    db: Session = Depends(get_db_with_retry())):
+    """
+    全文检索留言
+    order=rank 按相关度排序，order=recent 按时间倒序；user_id 限定作者；
+    翻页时传入上一页返回的 next_cursor
+    """
+    if order not in MESSAGE_SEARCH_ORDERS:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="不支援的排序方式")
+    limit = max(1, min(limit, 100))
+
+    try:
+        messages, next_cursor = crud.search_messages(db,
+                                                     q,
+                                                     user_id=user_id,
+                                                     order=order,
+                                                     cursor=cursor,
+                                                     limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="無效的分頁游標")
+    except Exception as e:
+        logger.error("Error searching messages: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="搜尋留言失敗")
+
+    image_statuses = crud.get_image_statuses(db, [m.id for m in messages])
+    for message in messages:
+        message.image_status = image_statuses.get(message.id)
+    return {"items": messages, "next_cursor": next_cursor}
+
+
 @app.post("/messages/")
 async def create_message(request: Request,
+                         background_tasks: BackgroundTasks,
                          current_user: models.User = Depends(get_current_user),
                          db: Session = Depends(get_db_with_retry())):
     """
@@ -438,16 +572,24 @@ async def create_message(request: Request,
         message = schemas.MessageCreate(content=content)
 
         # 调用 crud.py 的 create_user_message 处理验证和上传
-        result = await crud.create_user_message(db=db,
-                                                message=message,
-                                                user_id=current_user.id,
-                                                file=file)
+        # 后台上传服务运行时，留言先写入，图片稍后上传
+        result = await crud.create_user_message(
+            db=db,
+            message=message,
+            user_id=current_user.id,
+            file=file,
+            defer_upload=image_upload_worker is not None)
 
         if result is None:
             raise HTTPException(
                 status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                 detail="留言新增失敗")
 
+        if result.pending_upload_id:
+            image_upload_worker.enqueue(result.pending_upload_id)
+        if result.image_deletion_queued:
+            schedule_image_deletions(background_tasks)
+
         # 如果不是管理员，发送 LINE 通知
         if not current_user.is_admin:
 
@@ -464,7 +606,7 @@ async def create_message(request: Request,
                 await send_line_notification(
                     user_id=Config.LINE_MESSAGING_ADMIN_ID, message="使用者新增訊息")
             except Exception as e:
-                print(f"LINE 通知發送失敗: {str(e)}")
+                logger.error("LINE 通知發送失敗: %s", e)
                 # 不抛出异常，继续执行登录流程
 
         return {"ok": True, "message": "留言新增成功", "data": result}
@@ -472,13 +614,22 @@ async def create_message(request: Request,
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error: {str(e)}")
+        logger.error("Error: %s", e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                             detail=str(e))
 
 
+def schedule_image_deletions(background_tasks: BackgroundTasks):
+    """通知后台删除 Cloudinary 图片；没有常驻服务时在响应后执行一次批量删除"""
+    if image_deletion_worker:
+        image_deletion_worker.notify()
+    else:
+        background_tasks.add_task(delete_pending_images)
+
+
 @app.delete("/messages/{message_id}")
 def delete_message(message_id: int,
+                   background_tasks: BackgroundTasks,
                    db: Session = Depends(get_db_with_retry()),
                    current_user: models.User = Depends(get_current_user)):
     if not current_user.is_admin:
@@ -489,17 +640,69 @@ def delete_message(message_id: int,
     if not message:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="刪除留言失敗")
+    schedule_image_deletions(background_tasks)
     return {"ok": True, "message": "刪除留言成功"}
 
 
+@app.post("/admin/messages/bulk-delete")
+def bulk_delete_messages(criteria: schemas.MessageBulkDelete,
+                         background_tasks: BackgroundTasks,
+                         db: Session = Depends(get_db_with_retry()),
+                         current_user: models.User = Depends(get_current_user)):
+    """按 id 列表、用户或时间范围批量删除留言"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="沒有刪除留言的權限")
+
+    if (criteria.message_ids is None and criteria.user_id is None
+            and criteria.created_from is None
+            and criteria.created_to is None):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="缺少刪除條件")
+
+    try:
+        deleted_count = crud.bulk_delete_messages(
+            db=db,
+            message_ids=criteria.message_ids,
+            user_id=criteria.user_id,
+            created_from=criteria.created_from,
+            created_to=criteria.created_to)
+    except Exception as e:
+        logger.error("Error bulk deleting messages: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="批量刪除留言失敗")
+
+    if deleted_count:
+        schedule_image_deletions(background_tasks)
+    return {
+        "ok": True,
+        "message": f"已刪除 {deleted_count} 則留言",
+        "deleted": deleted_count
+    }
+
+
+@app.post("/admin/retention/run")
+async def run_data_retention(
+        current_user: models.User = Depends(get_current_user)):
+    """立即执行一次数据归档，返回各表移动的行数"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="沒有執行資料歸檔的權限")
+
+    if retention_worker:
+        report = await retention_worker.run_once()
+    else:
+        report = await asyncio.to_thread(run_retention)
+    return {"ok": True, "moved": report}
+
+
 @app.put("/users/password")
 async def change_password(
     request: Request,
     db: Session = Depends(get_db_with_retry()),
     current_user: models.User = Depends(get_current_user)):
     try:
-        print("=== Debug Info ===")
-        print("Current user:", current_user.username)
+        logger.debug("Current user: %s", current_user.username)
 
         # 获取并解码密码
         data = await request.json()
@@ -527,7 +730,7 @@ async def change_password(
 
         # 生成新密码哈希
         new_password_hash = auth.get_password_hash(new_password)
-        print("New password hash generated")
+        logger.debug("New password hash generated")
 
         # 更新密码
         user.password_hash = new_password_hash
@@ -539,30 +742,65 @@ async def change_password(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error updating password: {str(e)}")
+        logger.error("Error updating password: %s", e)
         db.rollback()  # 发生错误时回滚
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="密碼更新失敗")
 
 
+LOGIN_RECORD_STREAM_FORMATS = ("ndjson", "json")
+
+
+def stream_login_records(skip: int, limit: Optional[int], fmt: str):
+    """以 NDJSON 或分块 JSON 数组的形式逐条输出登录记录"""
+    # 使用独立会话，响应输出期间保持游标打开
+    db = SessionLocal()
+    try:
+        rows = crud.iter_login_records(db, skip=skip, limit=limit)
+        if fmt == "ndjson":
+            for row in rows:
+                yield json.dumps(row, default=crud.json_default,
+                                 ensure_ascii=False) + "\n"
+            return
+
+        yield "["
+        separator = ""
+        for row in rows:
+            yield separator + json.dumps(
+                row, default=crud.json_default, ensure_ascii=False)
+            separator = ","
+        yield "]"
+    finally:
+        db.close()
+
+
 @app.get("/admin/login-records/", response_model=list[schemas.LoginRecord])
 def get_all_login_records(
+        skip: int = 0,
+        limit: Optional[int] = None,
+        stream: Optional[str] = None,
         current_user: models.User = Depends(get_current_user),
         db: Session = Depends(get_db_with_retry())):
+    """
+    获取登录记录
+    limit 为空时返回全部记录；stream=ndjson 或 stream=json 时以流式输出
+    """
     if not current_user.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="僅限管理員訪問")
 
-    try:
-        records = db.query(models.LoginRecord).order_by(
-            models.LoginRecord.login_datetime.desc()).all()
+    if stream is not None and stream not in LOGIN_RECORD_STREAM_FORMATS:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="不支援的串流格式")
 
-        for record in records:
-            display_name = db.query(models.DisplayName).filter(
-                models.DisplayName.user_id == record.user_id).first()
-            record.display_name = display_name.displayname if display_name else "Anonymous"
+    try:
+        if stream:
+            media_type = ("application/x-ndjson"
+                          if stream == "ndjson" else "application/json")
+            return StreamingResponse(stream_login_records(skip, limit, stream),
+                                     media_type=media_type)
 
-        return records
+        return crud.get_login_records(db, skip=skip, limit=limit)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="獲取登入記錄失敗")
@@ -584,8 +822,10 @@ async def get_notify_list(
 
         # 直接使用全局实例获取通知列表
         notifies = task_notify_service.notifies if task_notify_service else []
+        stats = (task_notify_service.stats.summary()
+                 if task_notify_service else None)
 
-        return {"notifies": notifies}
+        return {"notifies": notifies, "stats": stats}
     except HTTPException:
         raise
     except Exception as e:
@@ -619,93 +859,165 @@ async def update_notify_list(
                             detail=f"更新通知列表失败: {str(e)}")
 
 
+def get_task_notify_service_status():
+    return {
+        "running":
+        task_notify_service._running if task_notify_service else False,
+        "count": len(task_notify_service.notifies) if task_notify_service else 0
+    }
+
+
 @app.get("/tasks/all", response_model=dict)
-def get_all_task_data(current_user: models.User = Depends(get_current_user),
+def get_all_task_data(request: Request,
+                      since: Optional[int] = None,
+                      current_user: models.User = Depends(get_current_user),
                       db: Session = Depends(get_db_with_retry())):
     """
     获取所有任务相关数据，包括分类、项目和进度
     需要有效的用户token
+    带 since 参数时只返回该版本之后新增、修改或删除的数据(增量同步)；
+    since 之后的变更记录已被清理时返回全量数据并带 "full_resync": true，
+    客户端应以返回的数据替换本地数据
     """
     try:
-        print(f"=== categories ===")
-        # 获取所有分类(未排序)
-        # categories = db.query(models.TaskCategory).filter(
-        #     models.TaskCategory.user_id == current_user.id).all()
-
-        # 获取所有分类(按分類名稱排序)
-        categories = db.query(models.TaskCategory).filter(
-            models.TaskCategory.user_id == current_user.id).order_by(
-                models.TaskCategory.category_name).all()
+        # 任务数据版本号和通知服务状态都未变时直接返回 304
+        service_status = get_task_notify_service_status()
+        version = crud.get_task_version(db, user_id=current_user.id)
+        etag = (f'W/"tasks-{current_user.id}-{version}-'
+                f'{int(service_status["running"])}-{service_status["count"]}"')
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        headers = {"ETag": etag}
+
+        incremental = since is not None and since > 0
+        if incremental and crud.task_changes_available(db, since, version):
+            changes = crud.get_task_changes(db,
+                                            user_id=current_user.id,
+                                            since=since)
+            content = json.dumps(
+                {
+                    "since": since,
+                    **changes, "task_notify_service": service_status
+                },
+                default=crud.json_default,
+                ensure_ascii=False)
+            return Response(content=content,
+                            media_type="application/json",
+                            headers=headers)
+
+        # 结果集已由数据库或 crud 序列化为 JSON 文本，直接拼接成响应
+        version, data = crud.get_task_tree_json(db, user_id=current_user.id)
+        parts = [f'"version":{version}']
+        parts.extend(f'"{key}":{value}' for key, value in data.items())
+        parts.append('"task_notify_service":' + json.dumps(service_status))
+        if incremental:
+            # 变更记录已清理，无法增量同步
+            parts.append('"full_resync":true')
+        return Response(content="{" + ",".join(parts) + "}",
+                        media_type="application/json",
+                        headers=headers)
+    except Exception as e:
+        logger.error("General error in get_all_task_data: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"獲取任務數據失敗: {str(e)}")
 
-        print(f"Found {len(categories)} categories")
 
-        print(f"=== items ===")
-        # 获取所有项目
-        try:
-            items = db.query(models.TaskItem).filter(
-                models.TaskItem.user_id == current_user.id).all()
-            print(f"Found {len(items)} items")
-        except Exception as item_error:
-            print(f"Error fetching items: {str(item_error)}")
-            # 尝试不带用户过滤的查询
-            items = db.query(models.TaskItem).all()
-            print(f"Found {len(items)} items without user filter")
-
-        print(f"=== progresses ===")
-        # 获取所有进度
-        try:
-            progresses = db.query(models.TaskProgress).filter(
-                models.TaskProgress.user_id == current_user.id).all()
-            print(f"Found {len(progresses)} progresses")
-        except Exception as progress_error:
-            print(f"Error fetching progresses: {str(progress_error)}")
-            # 尝试不带用户过滤的查询
-            progresses = db.query(models.TaskProgress).all()
-            print(f"Found {len(progresses)} progresses without user filter")
-
-        print(f"=== notifies ===")
-        # 获取所有通知
-        try:
-            notifies = db.query(models.TaskNotify).filter(
-                models.TaskNotify.user_id == current_user.id).all()
-            print(f"Found {len(notifies)} notifies")
-        except Exception as notify_error:
-            print(f"Error fetching notifies: {str(notify_error)}")
-            notifies = []
-            print(f"Found {len(notifies)} notifies without user filter")
-
-        # 将数据转换为字典格式，避免序列化问题
-        def model_to_dict(model):
-            if hasattr(model, '__table__'):
-                return {
-                    c.name: getattr(model, c.name)
-                    for c in model.__table__.columns
-                }
-            return model
-
-        # 转换数据
-        categories_data = [model_to_dict(category) for category in categories]
-        items_data = [model_to_dict(item) for item in items]
-        progresses_data = [model_to_dict(progress) for progress in progresses]
-        notifies_data = [model_to_dict(notify) for notify in notifies]
-
-        # 返回组织好的数据
-        return {
-            "categories": categories_data,
-            "items": items_data,
-            "progresses": progresses_data,
-            "notifies": notifies_data,
-            "task_notify_service": {
-                "running":
-                task_notify_service._running if task_notify_service else False,
-                "count":
-                len(task_notify_service.notifies) if task_notify_service else 0
-            }
-        }
+@app.get("/tasks/search", response_model=List[schemas.TaskSearchResult])
+def search_task_tree(q: str,
+                     limit: int = 20,
+                     current_user: models.User = Depends(get_current_user),
+                     db: Session = Depends(get_db_with_retry())):
+    """
+    检索当前用户的分类、项目、进度，按相关度排序
+    每个结果附带 分类 -> 项目 -> 进度 路径，客户端可直接定位到节点
+    """
+    try:
+        return crud.search_task_tree(db,
+                                     user_id=current_user.id,
+                                     q=q,
+                                     limit=max(1, min(limit, 100)))
     except Exception as e:
-        print(f'General error in get_all_task_data: {str(e)}')
+        logger.error("Error searching tasks: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                            detail=f"獲取任務數據失敗: {str(e)}")
+                            detail="搜尋工作項目失敗")
+
+
+def stream_task_tree_export(user_id: int, lines_per_chunk: int = 500):
+    """以 NDJSON 输出用户任务树，每次输出 lines_per_chunk 行"""
+    # 使用独立会话，响应输出期间保持游标打开
+    db = SessionLocal()
+    try:
+        lines = []
+        for record in task_archive.iter_task_tree(db, user_id):
+            lines.append(
+                json.dumps(record,
+                           default=crud.json_default,
+                           ensure_ascii=False) + "\n")
+            if len(lines) >= lines_per_chunk:
+                yield "".join(lines)
+                lines = []
+        if lines:
+            yield "".join(lines)
+    finally:
+        db.close()
+
+
+@app.get("/tasks/export")
+def export_task_tree(current_user: models.User = Depends(get_current_user)):
+    """导出当前用户的分类、项目、进度和通知(NDJSON 串流)"""
+    return StreamingResponse(
+        stream_task_tree_export(current_user.id),
+        media_type="application/x-ndjson",
+        headers={
+            "Content-Disposition":
+            f'attachment; filename="tasks-{current_user.id}.ndjson"'
+        })
+
+
+@app.post("/tasks/import")
+async def import_task_tree(request: Request,
+                           current_user: models.User = Depends(
+                               get_current_user)):
+    """
+    导入 /tasks/export 产生的 NDJSON，数据新增到当前用户下(重新分配 id)
+    边接收边写入，全部成功才提交，任何一行出错则整批回滚
+    """
+    # 数据库写入在专用线程中执行，不阻塞事件循环
+    async with task_archive.ThreadedTaskTreeImporter(
+            current_user.id) as importer:
+        try:
+            pending = b""
+            async for chunk in request.stream():
+                pending += chunk
+                *lines, pending = pending.split(b"\n")
+                records = [json.loads(line) for line in lines if line.strip()]
+                if records:
+                    await importer.add_many(records)
+            if pending.strip():
+                await importer.add(json.loads(pending))
+            counts = await importer.finish()
+        except ValueError as e:
+            # json.JSONDecodeError 也是 ValueError
+            await importer.abort()
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"匯入資料格式錯誤: {str(e)}")
+        except Exception as e:
+            await importer.abort()
+            logger.error("Error importing tasks: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="匯入失敗")
+
+        # 与新增单条通知相同，服务存在时把导入的通知加入调度
+        if task_notify_service and counts["notifies"]:
+            try:
+                for notify in await importer.imported_notifies():
+                    if task_notify_service.should_load_notify(notify):
+                        task_notify_service.add_notify(notify)
+            except Exception as e:
+                logger.error("加入匯入的通知失敗: %s", e)
+    return {"ok": True, "imported": counts}
 
 
 @app.post("/categories/", response_model=schemas.TaskCategory)
@@ -751,7 +1063,7 @@ def update_category(category_id: int,
         raise
     except Exception as e:
         # 记录错误日志
-        print(f"Error updating category: {str(e)}")
+        logger.error("Error updating category: %s", e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                             detail=f"更新分類失敗: {str(e)}")
 
@@ -774,7 +1086,7 @@ async def delete_category(
         # 如果有 task_notifies 被删除，且 task_notify_service 正在运行，刷新通知列表
         if notifies_count > 0 and task_notify_service and task_notify_service._running:
             await task_notify_service.refresh_notifies()
-            print(f"分類刪除時發現 {notifies_count} 個相關的通知被級聯刪除，已刷新通知列表")
+            logger.info("分類刪除時發現 %s 個相關的通知被級聯刪除，已刷新通知列表", notifies_count)
 
         return {
             "ok": True,
@@ -784,11 +1096,61 @@ async def delete_category(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error deleting category: {str(e)}")
+        logger.error("Error deleting category: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"刪除分類失敗: {str(e)}")
 
 
+def check_batch_size(rows: list):
+    if not rows or len(rows) > crud.TASK_BATCH_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"每次需提供 1 到 {crud.TASK_BATCH_LIMIT} 筆資料")
+
+
+# 批量路由需在 /items/{item_id} 之前注册
+@app.post("/items/batch", response_model=List[schemas.TaskItem])
+def create_items(
+        items: List[schemas.TaskItemCreate],
+        db: Session = Depends(get_db_with_retry()),
+        current_user: models.User = Depends(get_current_user),
+):
+    """批量创建任务项，一次事务写入"""
+    check_batch_size(items)
+    try:
+        created = crud.create_task_items(db=db,
+                                         items=items,
+                                         user_id=current_user.id)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"新增項目失敗: {str(e)}")
+    if created is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="分類不存在或無權限")
+    return created
+
+
+@app.put("/items/batch", response_model=List[schemas.TaskItem])
+def update_items(
+        items: List[schemas.TaskItemBatchUpdate],
+        db: Session = Depends(get_db_with_retry()),
+        current_user: models.User = Depends(get_current_user),
+):
+    """批量更新任务项目"""
+    check_batch_size(items)
+    try:
+        updated = crud.update_task_items(db=db,
+                                         items=items,
+                                         user_id=current_user.id)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"更新項目失敗: {str(e)}")
+    if updated is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="項目不存在或無權限")
+    return updated
+
+
 @app.post("/items/", response_model=schemas.TaskItem)
 def create_item(
         item: schemas.TaskItemCreate,
@@ -828,7 +1190,7 @@ def update_item(item_id: int,
         raise
     except Exception as e:
         # 记录错误日志
-        print(f"Error updating item: {str(e)}")
+        logger.error("Error updating item: %s", e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                             detail=f"更新項目失敗: {str(e)}")
 
@@ -850,7 +1212,7 @@ async def delete_item(item_id: int,
         # 如果有 task_notifies 被删除，且 task_notify_service 正在运行，刷新通知列表
         if notifies_count > 0 and task_notify_service and task_notify_service._running:
             await task_notify_service.refresh_notifies()
-            print(f"項目刪除時發現 {notifies_count} 個相關的通知被級聯刪除，已刷新通知列表")
+            logger.info("項目刪除時發現 %s 個相關的通知被級聯刪除，已刷新通知列表", notifies_count)
 
         return {
             "ok": True,
@@ -860,11 +1222,53 @@ async def delete_item(item_id: int,
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error deleting item: {str(e)}")
+        logger.error("Error deleting item: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"刪除項目失敗: {str(e)}")
 
 
+@app.post("/progresses/batch", response_model=List[schemas.TaskProgress])
+def create_progresses(
+        progresses: List[schemas.TaskProgressCreate],
+        db: Session = Depends(get_db_with_retry()),
+        current_user: models.User = Depends(get_current_user),
+):
+    """批量创建任务进度，一次事务写入"""
+    check_batch_size(progresses)
+    try:
+        created = crud.create_task_progresses(db=db,
+                                              progresses=progresses,
+                                              user_id=current_user.id)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"新增進度失敗: {str(e)}")
+    if created is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="項目不存在或無權限")
+    return created
+
+
+@app.put("/progresses/batch", response_model=List[schemas.TaskProgress])
+def update_progresses(
+        progresses: List[schemas.TaskProgressBatchUpdate],
+        db: Session = Depends(get_db_with_retry()),
+        current_user: models.User = Depends(get_current_user),
+):
+    """批量更新任务进度"""
+    check_batch_size(progresses)
+    try:
+        updated = crud.update_task_progresses(db=db,
+                                              progresses=progresses,
+                                              user_id=current_user.id)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"更新進度失敗: {str(e)}")
+    if updated is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="進度不存在或無權限")
+    return updated
+
+
 @app.post("/progresses/", response_model=schemas.TaskProgress)
 def create_progress(
         progress: schemas.TaskProgressCreate,
@@ -888,7 +1292,7 @@ def update_progress(progress_id: int,
                     progress: schemas.TaskProgressUpdate,
                     db: Session = Depends(get_db_with_retry()),
                     current_user: models.User = Depends(get_current_user)):
-    print(f'Progress id:{progress_id}')
+    logger.debug("Progress id:%s", progress_id)
     """更新任务进度"""
     try:
         # 调用 CRUD 函数更新进度
@@ -907,7 +1311,7 @@ def update_progress(progress_id: int,
         raise
     except Exception as e:
         # 记录错误日志
-        print(f"Error updating progress: {str(e)}")
+        logger.error("Error updating progress: %s", e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                             detail=f"更新進度失敗: {str(e)}")
 
@@ -916,7 +1320,7 @@ def update_progress(progress_id: int,
 def delete_progress(progress_id: int,
                     db: Session = Depends(get_db_with_retry()),
                     current_user: models.User = Depends(get_current_user)):
-    print(f'Progress id:{progress_id}')
+    logger.debug("Progress id:%s", progress_id)
     """删除任务进度"""
     try:
         # 调用 CRUD 函数删除进度
@@ -932,7 +1336,7 @@ def delete_progress(progress_id: int,
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error deleting progress: {str(e)}")
+        logger.error("Error deleting progress: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"刪除進度失敗: {str(e)}")
 
@@ -979,6 +1383,8 @@ def update_progress_status(
 
         # 更新状态
         db_progress.status = status_data.get("status", 0)
+        crud.record_task_changes(db, current_user.id, "progress",
+                                 [progress_id])
         db.commit()
         db.refresh(db_progress)
 
@@ -986,7 +1392,7 @@ def update_progress_status(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error updating progress status: {str(e)}")
+        logger.error("Error updating progress status: %s", e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                             detail=f"更新狀態失敗: {str(e)}")
 
@@ -1011,7 +1417,7 @@ def get_progress(category_id: int,
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error getting progress details: {str(e)}")
+        logger.error("Error getting progress details: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"獲取進度詳情失敗: {str(e)}")
 
@@ -1060,7 +1466,7 @@ def update_notify(notify_id: int,
         raise
     except Exception as e:
         # 记录错误日志
-        print(f"Error updating notify: {str(e)}")
+        logger.error("Error updating notify: %s", e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                             detail=f"更新通知失敗: {str(e)}")
 
@@ -1086,7 +1492,7 @@ def delete_notify(notify_id: int,
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error deleting notify: {str(e)}")
+        logger.error("Error deleting notify: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"刪除通知失敗: {str(e)}")
 
@@ -1117,19 +1523,10 @@ async def sse_endpoint(sse_token: str = None, device_id: str = None):
             raise HTTPException(status_code=401,
                                 detail="Missing token or device_id")
         username, user_id = auth.verify_token(sse_token)
-        print(f"SSE连接成功 - User ID: {user_id}, Username: {username}")
-
-        # 关闭该设备的旧连接
-        if user_id in connections:
-            if device_id in connections[user_id]:
-                old_queue = connections[user_id][device_id]
-                await old_queue.put(None)  # 发送关闭信号
+        logger.info("SSE连接成功 - User ID: %s, Username: %s", user_id, username)
 
-        # 创建新连接
-        queue = asyncio.Queue()
-        if user_id not in connections:
-            connections[user_id] = {}
-        connections[user_id][device_id] = queue
+        # 注册新连接（同一设备的旧连接会收到关闭信号）
+        generation, queue = connections.register(user_id, device_id)
 
         async def event_generator():
             try:
@@ -1139,29 +1536,19 @@ async def sse_endpoint(sse_token: str = None, device_id: str = None):
                         if data is None:  # 收到关闭信号
                             break
                         yield f"data: {json.dumps(data)}\n\n"
-                        print(f"发送给用户 {user_id} 的通知: {data}")
+                        logger.debug("发送给用户 %s 的通知: %s", user_id, data)
                     except Exception as e:
-                        print(f"处理队列消息时发生错误: {str(e)}")
+                        logger.error("处理队列消息时发生错误: %s", e)
                         continue
             except asyncio.CancelledError:
-                print(f"用户 {user_id} 断开连接")
-                # 清理连接
-                if user_id in connections:
-                    if device_id in connections[user_id]:
-                        del connections[user_id][device_id]
-                    if not connections[user_id]:
-                        del connections[user_id]
+                logger.info("用户 %s 断开连接", user_id)
                 raise
             except Exception as e:
-                print(f"SSE连接发生错误: {str(e)}")
+                logger.error("SSE连接发生错误: %s", e)
                 raise
             finally:
-                # 确保连接被清理
-                if user_id in connections:
-                    if device_id in connections[user_id]:
-                        del connections[user_id][device_id]
-                    if not connections[user_id]:
-                        del connections[user_id]
+                # 清理连接（只移除本次注册的连接，不影响同设备的新连接）
+                connections.unregister(user_id, device_id, generation)
 
         return StreamingResponse(event_generator(),
                                  media_type="text/event-stream",
@@ -1218,14 +1605,8 @@ async def test_send_user(
 
         # 使用 task_notify_service 发送通知
         # await task_notify_service.send_to_user(user_id, data)
-        # 检查用户ID是否存在于connections字典中
-        if user_id in connections:  # 验证用户是否有活跃连接
-            # 遍历该用户的所有连接队列
-            # for queue in connections[user_id]:  # 对每个用户连接进行处理
-            for device_id, queue in connections[user_id].items():
-                print(f"向用户 ID: {user_id} (设备ID: {device_id})")
-                # 将数据异步放入队列
-                await queue.put(data)  # 使用异步方式将数据放入队列
+        sent = connections.send_to_user(user_id, data)
+        logger.debug("向用户 ID: %s 的 %s 个连接发送", user_id, sent)
 
         return {"message": f"後端已向用户 {user_id} 发送 {data} SSE 测试通知"}
     except HTTPException:
@@ -1321,7 +1702,7 @@ async def control_task_notify(
             if task_notify_service:
                 task_notify_service.stop()
                 task_notify_service = None
-                print(' STOP task_notify_service')
+                logger.info("STOP task_notify_service")
             return {"message": "任務通知服務已停止", "running": False}
 
     except HTTPException:
@@ -1331,44 +1712,32 @@ async def control_task_notify(
                             detail=f"控制任務通知服務失敗: {str(e)}")
 
 
-@app.get("/api/health")
-def health_check():
-    health_status = {
-        "status": "健康 Version: 1.0.2",
-        "components": {
-            "config": {
-                "status": "正常"
-            },
-            "database": {
-                "status": "未檢查"
-            },
-            "api": {
-                "status": "正常"
-            }
-        }
-    }
+@app.get("/metrics", dependencies=[Depends(require_monitoring_access)])
+def get_metrics():
+    """Prometheus 文本格式的请求、数据库与外部调用统计"""
+    return Response(metrics.render_metrics(), media_type=metrics.CONTENT_TYPE)
 
-    # 检查配置
-    try:
-        check_config()
-    except ValueError as e:
-        health_status["status"] = "不健康"
-        health_status["components"]["config"] = {
-            "status": "錯誤",
-            "error": str(e)
-        }
 
-    # 检查数据库连接
-    try:
-        with engine.connect() as connection:
-            health_status["components"]["database"] = {"status": "已連接"}
-    except Exception as e:
-        health_status["status"] = "不健康"
-        health_status["components"]["database"] = {
-            "status": "已斷開",
-            "error": str(e)
-        }
+@app.get("/api/health")
+def health_check(deep: bool = False,
+                 credentials: Optional[HTTPAuthorizationCredentials] = Depends(
+                     optional_security)):
+    """
+    存活检查返回缓存的结果(见 HEALTH_CACHE_TTL)，不会每次连接数据库
+    deep=1 为就绪检查：实时检查数据库并返回各后台服务状态，不健康时返回 503；
+    需要管理员或 METRICS_TOKEN 验证
+    """
+    if not deep:
+        return health_monitor.get()
 
+    if credentials is None:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Not authenticated")
+    require_monitoring_access(credentials)
+    health_status = health_monitor.deep(task_notify_service)
+    if health_status["status"] != HEALTHY:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            content=health_status)
     return health_status
 
 
@@ -3,9 +3,9 @@ JWT认证和密码加密相关功能模块
 包含密码哈希验证、JWT令牌创建和验证等功能
 """
 from datetime import datetime, timedelta, timezone  # 导入可选类型提示  # 导入日期时间处理相关模块
+from functools import lru_cache
 from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from jose import JWTError
 from .config import Config
 
 # 从环境变量中获取密钥
@@ -17,16 +17,23 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 # 设置访问令牌过期时间（秒）
 # ACCESS_TOKEN_EXPIRE_SECONDS = 60
 
-# 创建密码加密上下文，使用bcrypt算法
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# passlib 和 jose.jwt(含 cryptography 后端)导入较慢，在第一次使用时才加载，
+# 使不需要认证的请求(如 /api/health)在冷启动时不必等待
+
+
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    """密码加密上下文，使用bcrypt算法"""
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -39,11 +46,13 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
             timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
 def verify_token(token: str):
+    from jose import jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
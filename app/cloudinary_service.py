@@ -0,0 +1,28 @@
+"""
+Cloudinary SDK 延迟加载
+导入和配置 SDK 需要数十毫秒，serverless 冷启动时只在第一次上传或删除图片时才加载
+"""
+from functools import lru_cache
+from .config import Config
+
+
+@lru_cache(maxsize=None)
+def _configure():
+    import cloudinary
+    cloudinary.config(cloud_name=Config.CLOUDINARY_CLOUD_NAME,
+                      api_key=Config.CLOUDINARY_API_KEY,
+                      api_secret=Config.CLOUDINARY_API_SECRET)
+
+
+def uploader():
+    """已配置的 cloudinary.uploader 模块"""
+    _configure()
+    import cloudinary.uploader
+    return cloudinary.uploader
+
+
+def api():
+    """已配置的 cloudinary.api 模块"""
+    _configure()
+    import cloudinary.api
+    return cloudinary.api
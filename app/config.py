@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 import os
+import tempfile
 
 load_dotenv()
 
@@ -17,3 +18,44 @@ class Config:
     CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
     TIMEZONE = os.getenv("TIMEZONE")
     ENV = os.getenv("ENV")
+    # 图片上传限制：单个文件最大字节数、同时上传的最大数量
+    MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 10 * 1024 * 1024))
+    UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", 4))
+    # 延迟上传：留言先写入，图片由后台上传(仅长驻进程有效)
+    DEFERRED_IMAGE_UPLOAD = os.getenv("DEFERRED_IMAGE_UPLOAD",
+                                      "").lower() in ("1", "true", "yes")
+    PENDING_UPLOAD_DIR = os.getenv(
+        "PENDING_UPLOAD_DIR",
+        os.path.join(tempfile.gettempdir(), "board_pending_uploads"))
+    # 图片预处理：最长边像素(0 表示不处理)、输出格式、质量、进程池大小
+    IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", 0))
+    IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "WEBP").upper()
+    IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 80))
+    IMAGE_PROCESS_WORKERS = int(os.getenv("IMAGE_PROCESS_WORKERS", 2))
+    # 数据保留：超过天数的过期通知、登录记录移入归档表(0 表示不归档)
+    RETENTION_NOTIFY_DAYS = int(os.getenv("RETENTION_NOTIFY_DAYS", 30))
+    RETENTION_LOGIN_RECORD_DAYS = int(
+        os.getenv("RETENTION_LOGIN_RECORD_DAYS", 180))
+    # 任务变更记录(增量同步用)的保留天数，更早同步过的客户端改为全量同步
+    RETENTION_TASK_CHANGE_DAYS = int(
+        os.getenv("RETENTION_TASK_CHANGE_DAYS", 30))
+    RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 500))
+    RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", 3600))
+    # 数据库连接池：serverless(NullPool，配合外部连接池) 或 worker(QueuePool)，
+    # 未设置时 ENV=vercel 使用 serverless，其余使用 worker
+    DB_POOL_PROFILE = os.getenv("DB_POOL_PROFILE", "").lower()
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING",
+                                 "").lower() in ("1", "true", "yes")
+    # /metrics 的 Bearer token(供监控系统抓取)，未设置时仅管理员可查看
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+    # /api/health 缓存检查结果的秒数
+    HEALTH_CACHE_TTL = int(os.getenv("HEALTH_CACHE_TTL", 10))
+    # 后台刷新 /api/health 缓存的间隔秒数(0 表示只在请求时刷新)
+    HEALTH_REFRESH_INTERVAL = int(os.getenv("HEALTH_REFRESH_INTERVAL", 60))
+    # 日志：级别(DEBUG 时输出调度循环等热点路径的追踪)、格式(text 或 json)
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
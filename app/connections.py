@@ -1,5 +1,100 @@
 import asyncio
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
-# SSE 连接池，格式: {user_id: {device_id: queue}}
-connections: Dict[int, Dict[str, asyncio.Queue]] = {}
+
+class ConnectionRegistry:
+    """
+    SSE 连接注册表，格式: {user_id: {device_id: (generation, queue)}}
+
+    所有方法都是同步的，在事件循环中执行时不会被其他协程打断，
+    因此注册、替换、注销都是原子操作。每次注册都会分配新的 generation，
+    旧连接清理时只能移除自己那一代的记录，不会误删同一设备的新连接。
+    """
+
+    def __init__(self):
+        self._connections: Dict[int, Dict[str, Tuple[int,
+                                                     asyncio.Queue]]] = {}
+        self._generation = 0
+        self._device_count = 0
+
+    def register(self, user_id: int,
+                 device_id: str) -> Tuple[int, asyncio.Queue]:
+        """
+        注册新连接，若该设备已有旧连接则替换并向旧队列发送关闭信号
+        返回:
+            (generation, queue): 连接代号和消息队列
+        """
+        self._generation += 1
+        generation = self._generation
+        queue = asyncio.Queue()
+
+        devices = self._connections.setdefault(user_id, {})
+        old = devices.get(device_id)
+        devices[device_id] = (generation, queue)
+
+        if old is None:
+            self._device_count += 1
+        else:
+            # 队列无上限，put_nowait 不会阻塞
+            old[1].put_nowait(None)  # 发送关闭信号
+
+        return generation, queue
+
+    def unregister(self, user_id: int, device_id: str,
+                   generation: int) -> bool:
+        """注销连接，仅当 generation 与当前登记的一致时才移除"""
+        devices = self._connections.get(user_id)
+        if not devices:
+            return False
+        entry = devices.get(device_id)
+        if entry is None or entry[0] != generation:
+            return False
+
+        del devices[device_id]
+        self._device_count -= 1
+        if not devices:
+            del self._connections[user_id]
+        return True
+
+    def queues(self, user_id: int) -> List[Tuple[str, asyncio.Queue]]:
+        """获取用户所有连接的 (device_id, queue) 快照"""
+        devices = self._connections.get(user_id)
+        if not devices:
+            return []
+        return [(device_id, queue)
+                for device_id, (_, queue) in devices.items()]
+
+    def send_to_user(self, user_id: int, data: Dict) -> int:
+        """向用户的所有连接队列放入数据，返回投递的连接数"""
+        targets = self.queues(user_id)
+        for _, queue in targets:
+            queue.put_nowait(data)
+        return len(targets)
+
+    def broadcast(self, data: Dict) -> int:
+        """向所有连接队列放入数据，返回投递的连接数"""
+        sent = 0
+        for user_id in list(self._connections):
+            sent += self.send_to_user(user_id, data)
+        return sent
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._connections
+
+    @property
+    def active_users(self) -> int:
+        return len(self._connections)
+
+    @property
+    def active_devices(self) -> int:
+        return self._device_count
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "active_users": self.active_users,
+            "active_devices": self.active_devices,
+        }
+
+
+# SSE 连接池
+connections = ConnectionRegistry()
@@ -1,17 +1,70 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import uuid
+from datetime import date, datetime, time, timezone
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import (Float, Integer, Text, and_, case, cast, delete, func,
+                        insert, literal, null, or_, select, text, union_all,
+                        update)
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.sql import column, literal_column, table
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from . import models, schemas
-from passlib.context import CryptContext
-import cloudinary
-import cloudinary.uploader
+from . import auth, cloudinary_service, models, schemas, image_processing
 from .config import Config
+from .log import get_logger
+from .metrics import external_call
 from .models import TaskNotify
 
-# 配置 Cloudinary
-cloudinary.config(cloud_name=Config.CLOUDINARY_CLOUD_NAME,
-                  api_key=Config.CLOUDINARY_API_KEY,
-                  api_secret=Config.CLOUDINARY_API_SECRET)
+logger = get_logger(__name__)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 分块上传时每块的大小(Cloudinary 要求至少 5MB)
+UPLOAD_CHUNK_SIZE = 6 * 1024 * 1024
+# 限制同时在线程池中进行的上传数量
+upload_semaphore = asyncio.Semaphore(Config.UPLOAD_CONCURRENCY)
+
+
+MESSAGES_SCOPE = "messages"
+# 已清理的 task_changes 中最大的 id，增量同步的 since 小于它时须全量同步
+TASK_CHANGES_PRUNED_SCOPE = "task_changes_pruned"
+
+
+def get_sync_version(db: Session, scope: str) -> int:
+    """获取指定范围的数据版本号"""
+    return db.query(models.SyncVersion.version).filter(
+        models.SyncVersion.scope == scope).scalar() or 0
+
+
+def _upsert_sync_version(db: Session, scope: str, version: int, new_version):
+    """
+    以一条 INSERT ... ON CONFLICT DO UPDATE 写入版本号，并发的首次写入不会主键冲突
+    记录不存在时写入 version，已存在时改为 new_version 表达式
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        statement = postgresql_insert(models.SyncVersion)
+    else:
+        statement = sqlite_insert(models.SyncVersion)
+    db.execute(
+        statement.values(scope=scope, version=version).on_conflict_do_update(
+            index_elements=[models.SyncVersion.scope],
+            set_={"version": new_version}))
+
+
+def bump_sync_version(db: Session, scope: str):
+    """递增指定范围的数据版本号(不提交，随调用方的事务一起提交)"""
+    _upsert_sync_version(db, scope, 1, models.SyncVersion.version + 1)
+
+
+def raise_sync_version(db: Session, scope: str, version: int):
+    """把指定范围的版本号提高到 version，已更大时不变(不提交)"""
+    current = models.SyncVersion.version
+    _upsert_sync_version(db, scope, version,
+                         case((current < version, version), else_=current))
 
 
 def get_user(db: Session, user_id: int):
@@ -24,7 +77,7 @@ def get_user_by_username(db: Session, username: str):
 
 
 def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = auth.get_password_hash(user.password)
     db_user = models.User(username=user.username,
                           password_hash=hashed_password,
                           is_admin=user.is_admin)
@@ -41,29 +94,325 @@ def create_login_record(db: Session, user_id: int):
     return login_record
 
 
+def login_records_query(skip: int = 0, limit: int = None):
+    """登录记录查询(连接 displaynames，一次查询取得显示名称)"""
+    display_name = func.coalesce(models.DisplayName.displayname,
+                                 "Anonymous").label("display_name")
+    query = select(models.LoginRecord.id, models.LoginRecord.user_id,
+                   models.LoginRecord.login_datetime, display_name)
+    query = query.outerjoin(
+        models.DisplayName,
+        models.DisplayName.user_id == models.LoginRecord.user_id)
+    query = query.order_by(models.LoginRecord.login_datetime.desc(),
+                           models.LoginRecord.id.desc()).offset(skip)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def get_login_records(db: Session, skip: int = 0, limit: int = None):
+    """获取登录记录列表"""
+    return [
+        dict(row)
+        for row in db.execute(login_records_query(skip, limit)).mappings()
+    ]
+
+
+def iter_login_records(db: Session,
+                       skip: int = 0,
+                       limit: int = None,
+                       batch_size: int = 1000):
+    """
+    逐批读取登录记录(服务端游标)，内存占用与表大小无关
+    """
+    result = db.execute(login_records_query(skip, limit),
+                        execution_options={"yield_per": batch_size})
+    for row in result.mappings():
+        yield dict(row)
+
+
 def get_messages(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Message).order_by(
         models.Message.created_at.desc()).offset(skip).limit(limit).all()
 
 
+def _like_pattern(term: str) -> str:
+    """子字符串匹配的 LIKE 模式(以反斜线转义用户输入中的通配符)"""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace(
+        "_", "\\_")
+    return f"%{escaped}%"
+
+
+def _search_matches(db: Session, model, columns, q: str, ranked: bool = True):
+    """
+    检索命中的行，ranked 时返回 (id, score) 查询(score 越大越相关)，
+    否则只返回 id，省去计算相关度
+    q 中以空格分隔的每个词都须出现在文档中(子字符串匹配，不区分大小写)，
+    中文词不需要与其他文字以空格分开
+    Postgres 使用 pg_trgm GIN 索引，SQLite 使用 trigram 分词的 FTS5
+    """
+    terms = q.split()
+    if db.get_bind().dialect.name == "postgresql":
+        document = models.search_document(*columns)
+        selected = [model.id.label("id")]
+        if ranked:
+            # similarity 返回 real，转为 double 保证游标中的分数能精确比较
+            selected.append(
+                cast(func.similarity(document, q),
+                     Float(precision=53)).label("score"))
+        return select(*selected).where(
+            *[document.ilike(_like_pattern(term)) for term in terms])
+
+    fts_name = models.fts_table_name(model.__tablename__)
+    fts = table(fts_name, column("rowid"), *[column(c.key) for c in columns])
+    fts_ref = literal_column(fts_name)
+    # 三字组索引只能检索至少三个字符的词；更短的词(如两个字的中文词)
+    # 对 FTS 表做 LIKE 过滤
+    long_terms = [t for t in terms if len(t) >= models.TRIGRAM_MIN_LENGTH]
+    short_terms = [t for t in terms if len(t) < models.TRIGRAM_MIN_LENGTH]
+    conditions = []
+    if long_terms:
+        # 每个词加引号，避免用户输入被当作 FTS5 查询语法
+        conditions.append(
+            fts_ref.op("MATCH")(" ".join('"' + term.replace('"', '""') + '"'
+                                         for term in long_terms)))
+    for term in short_terms:
+        pattern = _like_pattern(term)
+        conditions.append(
+            or_(*[fts.c[c.key].like(pattern, escape="\\") for c in columns]))
+
+    selected = [fts.c.rowid.label("id")]
+    if ranked:
+        # bm25 越小越相关，取负数与 Postgres 的排序方向一致；
+        # 只有短词时没有 MATCH，不计算相关度(按 id 倒序)
+        score = -func.bm25(fts_ref) if long_terms else literal(0.0)
+        selected.append(score.label("score"))
+    return select(*selected).where(*conditions)
+
+
+def search_messages(db: Session,
+                    q: str,
+                    user_id: int = None,
+                    order: str = "rank",
+                    cursor: str = None,
+                    limit: int = 20) -> Tuple[List[models.Message],
+                                              Optional[str]]:
+    """
+    全文检索留言，按相关度(rank)或时间(recent)排序，使用游标分页
+    游标格式: rank 为 "score:id"，recent 为 "id"
+    返回:
+        (messages, next_cursor): 已附带 display_name 和 is_admin 的留言，
+        以及下一页游标(没有下一页时为 None)
+    """
+    if not q.split():
+        return [], None
+
+    ranked = order != "recent"
+    matches = _search_matches(db, models.Message, (models.Message.content, ),
+                              q, ranked)
+    if ranked:
+        matches = matches.subquery()
+        score = matches.c.score
+        query = db.query(models.Message, score).join(
+            matches, models.Message.id == matches.c.id)
+    else:
+        # 按时间排序时不需要相关度，沿主键倒序扫描并检查是否命中即可
+        score = None
+        query = db.query(models.Message).filter(
+            models.Message.id.in_(matches))
+    query = query.add_columns(
+        models.DisplayName.displayname, models.User.is_admin).join(
+            models.User, models.User.id == models.Message.user_id).outerjoin(
+                models.DisplayName,
+                models.DisplayName.user_id == models.Message.user_id)
+    if user_id is not None:
+        query = query.filter(models.Message.user_id == user_id)
+
+    if ranked:
+        if cursor:
+            last_score, last_id = cursor.split(":")
+            last_score, last_id = float(last_score), int(last_id)
+            query = query.filter(
+                or_(score < last_score,
+                    and_(score == last_score, models.Message.id < last_id)))
+        query = query.order_by(score.desc(), models.Message.id.desc())
+    else:
+        if cursor:
+            query = query.filter(models.Message.id < int(cursor))
+        query = query.order_by(models.Message.id.desc())
+
+    # 多取一行判断是否还有下一页
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    messages = []
+    for row in rows:
+        message = row[0]
+        message.display_name = row.displayname or "Anonymous"
+        message.is_admin = bool(row.is_admin)
+        messages.append(message)
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = (f"{last.score!r}:{last[0].id}"
+                       if ranked else str(last[0].id))
+    return messages, next_cursor
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def compute_file_digest(file_obj) -> str:
+    """分块计算文件对象内容的 SHA-256(计算后回到文件开头)"""
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+async def save_upload_to_disk(file, directory: str) -> Tuple[str, str]:
+    """
+    把上传文件复制到 directory 下的新文件，复制的同时计算内容摘要
+    返回:
+        (path, digest): 文件路径和 SHA-256
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, uuid.uuid4().hex)
+
+    def _copy():
+        digest = hashlib.sha256()
+        file.file.seek(0)
+        with open(path, "wb") as dst:
+            for chunk in iter(lambda: file.file.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                dst.write(chunk)
+        return digest.hexdigest()
+
+    digest = await asyncio.to_thread(_copy)
+    return path, digest
+
+
+def acquire_image_asset(db: Session, digest: str) -> Optional[str]:
+    """
+    查找内容相同的已上传图片，找到时引用数加一(不提交)
+    返回:
+        str: 已上传图片的 secure_url，没有时返回 None
+    """
+    # ref_count 为 0 的资源正在被删除，不再复用
+    result = db.execute(
+        update(models.ImageAsset).where(
+            models.ImageAsset.digest == digest,
+            models.ImageAsset.ref_count > 0).values(
+                ref_count=models.ImageAsset.ref_count + 1))
+    if result.rowcount == 0:
+        return None
+    return db.query(models.ImageAsset.secure_url).filter(
+        models.ImageAsset.digest == digest).scalar()
+
+
+def register_image_asset(db: Session, digest: str, upload_result: Dict) -> str:
+    """
+    登记新上传的图片(不提交)，返回留言应使用的 secure_url
+    并发上传了相同内容时使用先登记的资源，并删除本次重复上传的图片
+    """
+    try:
+        with db.begin_nested():
+            db.add(
+                models.ImageAsset(digest=digest,
+                                  secure_url=upload_result['secure_url'],
+                                  public_id=upload_result['public_id'],
+                                  ref_count=1))
+        return upload_result['secure_url']
+    except IntegrityError:
+        image_url = acquire_image_asset(db, digest)
+        if not image_url:
+            raise
+        enqueue_image_deletion(db, upload_result['public_id'])
+        return image_url
+
+
+def enqueue_image_deletion(db: Session, public_id: str):
+    """登记待删除的 Cloudinary 图片(不提交)，由后台批量删除"""
+    db.add(models.PendingImageDeletion(public_id=public_id))
+
+
+def enqueue_image_deletions(db: Session, public_ids: Iterable[str]):
+    """批量登记待删除的 Cloudinary 图片(不提交)"""
+    rows = [{"public_id": public_id} for public_id in public_ids]
+    if rows:
+        db.execute(insert(models.PendingImageDeletion), rows)
+
+
+def release_image_asset(db: Session,
+                        image_url: str,
+                        count: int = 1) -> Optional[str]:
+    """
+    留言删除时释放图片引用(不提交)，count 为同时删除的引用该图片的留言数
+    返回:
+        str: 已无留言引用、需要从 Cloudinary 删除的 public_id，否则返回 None
+    """
+    asset = db.query(models.ImageAsset.id, models.ImageAsset.public_id).filter(
+        models.ImageAsset.secure_url == image_url).first()
+    if not asset:
+        # 去重功能之前上传的图片没有登记，从URL中提取public_id
+        return image_url.split('/')[-1].split('.')[0]
+
+    db.execute(
+        update(models.ImageAsset).where(
+            models.ImageAsset.id == asset.id).values(
+                ref_count=models.ImageAsset.ref_count - count))
+    result = db.execute(
+        delete(models.ImageAsset).where(models.ImageAsset.id == asset.id,
+                                        models.ImageAsset.ref_count <= 0))
+    return asset.public_id if result.rowcount else None
+
+
 async def create_user_message(db: Session,
                               message: schemas.MessageCreate,
                               user_id: int,
-                              file=None):
+                              file=None,
+                              defer_upload: bool = False):
     """
     创建用户消息，包含内容验证和文件上传功能
+    defer_upload 为 True 时图片先暂存到本地，留言立即写入，
+    返回的消息带有 pending_upload_id，由调用方交给 ImageUploadWorker 上传；
+    image_deletion_queued 为 True 时登记了重复上传的图片，由调用方安排删除
     """
+    pending_path = None
     try:
         # 验证内容
         if not message.content or len(message.content.strip()) == 0:
             raise ValueError("Content cannot be empty")
 
         # 处理文件上传
+        # 内容相同的图片已上传过时直接复用，不再上传
         image_url = None
-        if file:
-            image_url = await upload_image_to_cloudinary(file)
+        digest = None
+        image_deletion_queued = False
+        if file and defer_upload:
+            if get_upload_size(file) > Config.MAX_UPLOAD_SIZE:
+                raise ValueError("Upload too large")
+            pending_path, digest = await save_upload_to_disk(
+                file, Config.PENDING_UPLOAD_DIR)
+            image_url = acquire_image_asset(db, digest)
+            if image_url:
+                os.remove(pending_path)
+                pending_path = None
+        elif file:
+            digest = await asyncio.to_thread(compute_file_digest, file.file)
+            image_url = acquire_image_asset(db, digest)
             if not image_url:
-                raise ValueError("Failed to upload image")
+                upload_result = await upload_image_to_cloudinary(file)
+                if not upload_result:
+                    raise ValueError("Failed to upload image")
+                image_url = register_image_asset(db, digest, upload_result)
+                # 并发上传了相同内容时本次上传的图片已登记删除
+                image_deletion_queued = (image_url !=
+                                         upload_result['secure_url'])
 
         # 创建消息对象
         message_data = {
@@ -75,22 +424,54 @@ async def create_user_message(db: Session,
         # 创建消息
         db_message = models.Message(**message_data)
         db.add(db_message)
+        pending = None
+        if pending_path:
+            db.flush()
+            pending = models.PendingImageUpload(message_id=db_message.id,
+                                                file_path=pending_path,
+                                                filename=file.filename,
+                                                digest=digest)
+            db.add(pending)
+        bump_sync_version(db, MESSAGES_SCOPE)
         db.commit()
         db.refresh(db_message)
 
+        db_message.image_status = "pending" if pending else None
+        db_message.pending_upload_id = pending.id if pending else None
+        db_message.image_deletion_queued = image_deletion_queued
         return db_message
 
     except ValueError as e:
-        print(f"Validation error: {str(e)}")
-        return None
+        logger.error("Validation error: %s", e)
     except Exception as e:
-        print(f"Error creating message: {str(e)}")
-        return None
+        logger.error("Error creating message: %s", e)
+        db.rollback()
+    if pending_path and os.path.exists(pending_path):
+        os.remove(pending_path)
+    return None
+
+
+def get_image_statuses(db: Session, message_ids: Iterable[int]) -> Dict:
+    """获取留言图片的延迟上传状态 {message_id: status}"""
+    message_ids = list(message_ids)
+    if not message_ids:
+        return {}
+    rows = db.query(models.PendingImageUpload.message_id,
+                    models.PendingImageUpload.status).filter(
+                        models.PendingImageUpload.message_id.in_(message_ids))
+    return {message_id: image_status for message_id, image_status in rows}
+
+
+def remove_upload_files(paths: Iterable[Optional[str]]):
+    """删除延迟上传的暂存文件(原文件和预处理后的文件)，忽略不存在的路径"""
+    for path in set(paths):
+        if path and os.path.exists(path):
+            os.remove(path)
 
 
 def delete_message(db: Session, message_id: int):
     """
-    删除消息，如果消息包含图片则同时删除Cloudinary上的图片
+    删除消息，如果消息包含图片则登记删除Cloudinary上的图片
     """
     try:
         # 获取要删除的消息
@@ -99,27 +480,100 @@ def delete_message(db: Session, message_id: int):
         if not message:
             return None
 
-        # 如果消息包含图片，从Cloudinary删除
+        # 如果消息包含图片且已没有其他留言引用，登记为待删除，
+        # 随留言删除一起提交，由后台批量从Cloudinary删除
         if message.image_url:
-            try:
-                # 从URL中提取public_id
-                public_id = message.image_url.split('/')[-1].split('.')[0]
-                cloudinary.uploader.destroy(public_id)
-            except Exception as e:
-                print(f"Error deleting image from Cloudinary: {str(e)}")
+            public_id = release_image_asset(db, message.image_url)
+            if public_id:
+                enqueue_image_deletion(db, public_id)
+
+        # 删除尚未上传的暂存图片(提交后删除文件)
+        pending = db.query(models.PendingImageUpload).filter(
+            models.PendingImageUpload.message_id == message_id).first()
+        upload_files = []
+        if pending:
+            upload_files = [pending.file_path, pending.processed_path]
+            db.delete(pending)
 
         # 删除数据库中的消息记录
         db.delete(message)
+        bump_sync_version(db, MESSAGES_SCOPE)
         db.commit()
+        remove_upload_files(upload_files)
 
         return message
 
     except Exception as e:
-        print(f"Error deleting message: {str(e)}")
+        logger.error("Error deleting message: %s", e)
         db.rollback()
         return None
 
 
+def bulk_delete_messages(db: Session,
+                         message_ids: List[int] = None,
+                         user_id: int = None,
+                         created_from: datetime = None,
+                         created_to: datetime = None) -> int:
+    """
+    按 id 列表、用户、时间范围批量删除留言(条件之间为 AND)
+    以一条 DELETE ... RETURNING 删除，图片引用一并释放并登记后台删除
+    返回:
+        int: 删除的留言数
+    """
+    conditions = []
+    if message_ids is not None:
+        conditions.append(models.Message.id.in_(message_ids))
+    if user_id is not None:
+        conditions.append(models.Message.user_id == user_id)
+    if created_from is not None:
+        conditions.append(models.Message.created_at >= created_from)
+    if created_to is not None:
+        conditions.append(models.Message.created_at < created_to)
+    if not conditions:
+        raise ValueError("At least one condition is required")
+
+    try:
+        # 删除尚未上传的暂存图片
+        pending = db.query(
+            models.PendingImageUpload.id, models.PendingImageUpload.file_path,
+            models.PendingImageUpload.processed_path).join(
+                models.Message, models.Message.id ==
+                models.PendingImageUpload.message_id).filter(
+                    *conditions).all()
+        if pending:
+            db.query(models.PendingImageUpload).filter(
+                models.PendingImageUpload.id.in_([p.id for p in pending
+                                                  ])).delete(
+                                                      synchronize_session=False)
+
+        deleted = db.execute(
+            delete(models.Message).where(*conditions).returning(
+                models.Message.id, models.Message.image_url),
+            execution_options={
+                "synchronize_session": False
+            }).all()
+
+        # 同一图片可能被多则留言引用，按图片合并释放
+        image_counts = Counter(row.image_url for row in deleted
+                               if row.image_url)
+        public_ids = [
+            release_image_asset(db, image_url, count)
+            for image_url, count in image_counts.items()
+        ]
+        enqueue_image_deletions(db, filter(None, public_ids))
+
+        if deleted:
+            bump_sync_version(db, MESSAGES_SCOPE)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    remove_upload_files(path for p in pending
+                        for path in (p.file_path, p.processed_path))
+    return len(deleted)
+
+
 # def delete_message(db: Session, message_id: int):
 #     message = db.query(models.Message).filter(models.Message.id == message_id).first()
 #     if message:
@@ -128,19 +582,309 @@ def delete_message(db: Session, message_id: int):
 #     return message
 
 
+def get_upload_size(file) -> int:
+    """获取上传文件的大小(字节)"""
+    if getattr(file, "size", None) is not None:
+        return file.size
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(0)
+    return size
+
+
 async def upload_image_to_cloudinary(file):
+    """
+    上传图片到 Cloudinary
+    直接从临时文件分块读取上传，不把整个文件读入内存；
+    同步的 Cloudinary SDK 在线程中执行，避免阻塞事件循环。
+    启用图片预处理时先缩小、去除元数据并重新编码。
+    返回 Cloudinary 的上传结果，失败时返回 None
+    """
     try:
-        # 读取文件内容（异步）
-        file_content = await file.read()
+        size = get_upload_size(file)
+        if size > Config.MAX_UPLOAD_SIZE:
+            logger.warning("Upload too large: %s bytes (limit %s)", size,
+                           Config.MAX_UPLOAD_SIZE)
+            return None
 
-        # 上传图片到Cloudinary
-        upload_result = cloudinary.uploader.upload(file_content)
-        return upload_result['secure_url']
+        if not image_processing.is_enabled():
+            file.file.seek(0)
+            return await upload_stream_to_cloudinary(file.file, file.filename)
+
+        # 预处理需要磁盘文件，先复制到临时目录
+        path, _ = await save_upload_to_disk(file, tempfile.gettempdir())
+        try:
+            await image_processing.preprocess_image(path)
+            return await upload_stream_to_cloudinary(open(path, "rb"),
+                                                     file.filename)
+        finally:
+            os.remove(path)
     except Exception as e:
-        print(f"Error uploading to Cloudinary: {str(e)}")
+        logger.error("Error uploading to Cloudinary: %s", e)
         return None
 
 
+async def upload_stream_to_cloudinary(file_obj,
+                                      filename: str = None) -> Dict:
+    """
+    分块上传文件对象到 Cloudinary(上传完成后会关闭文件)，失败时抛出异常
+    返回 Cloudinary 的上传结果(包含 secure_url 和 public_id)
+    """
+    async with upload_semaphore:
+        with external_call("cloudinary"):
+            upload_result = await asyncio.to_thread(
+                cloudinary_service.uploader().upload_large,
+                file_obj,
+                chunk_size=UPLOAD_CHUNK_SIZE,
+                filename=filename or "stream")
+    return upload_result
+
+
+# 增量同步使用的实体名称与模型、响应字段的对应关系
+TASK_CHANGE_UPSERT = "upsert"
+TASK_CHANGE_DELETE = "delete"
+TASK_ENTITIES = {
+    "category": (models.TaskCategory, "categories"),
+    "item": (models.TaskItem, "items"),
+    "progress": (models.TaskProgress, "progresses"),
+    "notify": (models.TaskNotify, "notifies"),
+}
+
+
+def record_task_changes(db: Session,
+                        user_id: int,
+                        entity: str,
+                        entity_ids: Iterable[int],
+                        op: str = TASK_CHANGE_UPSERT):
+    """记录任务数据变更(不提交，随调用方的事务一起提交)"""
+    rows = [{
+        "user_id": user_id,
+        "entity": entity,
+        "entity_id": entity_id,
+        "op": op
+    } for entity_id in entity_ids]
+    if rows:
+        db.execute(insert(models.TaskChange), rows)
+
+
+def record_notify_changes(db: Session, rows: Iterable, op: str):
+    """按用户分组记录通知变更，rows 为 (user_id, notify_id) 序列"""
+    by_user = {}
+    for user_id, notify_id in rows:
+        by_user.setdefault(user_id, []).append(notify_id)
+    for user_id, notify_ids in by_user.items():
+        record_task_changes(db, user_id, "notify", notify_ids, op)
+
+
+def get_task_version(db: Session, user_id: int) -> int:
+    """获取用户任务数据的当前同步版本号"""
+    return db.query(func.max(models.TaskChange.id)).filter(
+        models.TaskChange.user_id == user_id).scalar() or 0
+
+
+def task_changes_available(db: Session, since: int, version: int) -> bool:
+    """
+    since 之后的变更记录是否完整(未被数据保留任务清理)
+    version 为用户当前的版本号：since 已是最新时没有需要返回的变更，
+    即使早于清理位置也无须全量同步
+    """
+    if since >= version:
+        return True
+    return since >= get_sync_version(db, TASK_CHANGES_PRUNED_SCOPE)
+
+
+def get_task_changes(db: Session, user_id: int, since: int) -> Dict:
+    """
+    获取 since 版本之后发生变更的任务数据
+    返回:
+        dict: version 为最新版本号，categories/items/progresses/notifies
+              为新增或修改的记录(字典)，deleted 为各类别被删除的 id 列表
+    """
+    changes = db.query(models.TaskChange.id, models.TaskChange.entity,
+                       models.TaskChange.entity_id,
+                       models.TaskChange.op).filter(
+                           models.TaskChange.user_id == user_id,
+                           models.TaskChange.id > since).order_by(
+                               models.TaskChange.id).all()
+
+    # 同一记录多次变更时只保留最后一次
+    version = since
+    latest = {}
+    for change_id, entity, entity_id, op in changes:
+        version = change_id
+        latest[(entity, entity_id)] = op
+
+    result = {"version": version, "deleted": {}}
+    for entity, (model, key) in TASK_ENTITIES.items():
+        upsert_ids = [
+            entity_id for (e, entity_id), op in latest.items()
+            if e == entity and op == TASK_CHANGE_UPSERT
+        ]
+        deleted_ids = [
+            entity_id for (e, entity_id), op in latest.items()
+            if e == entity and op == TASK_CHANGE_DELETE
+        ]
+        rows = []
+        if upsert_ids:
+            rows = select_task_rows(db, model, model.user_id == user_id,
+                                    model.id.in_(upsert_ids))
+            # 变更后又被级联删除的记录视为已删除
+            found = {row["id"] for row in rows}
+            deleted_ids.extend(i for i in upsert_ids if i not in found)
+        result[key] = rows
+        result["deleted"][key] = deleted_ids
+    return result
+
+
+# /tasks/all 全量读取时各结果集的排序
+TASK_TREE_ORDER = {"categories": "category_name"}
+
+
+def json_default(value):
+    """json.dumps 的默认转换，处理日期时间类型"""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} "
+                    "is not JSON serializable")
+
+
+def select_task_rows(db: Session, model, *criteria,
+                     order_by: str = None) -> List[Dict]:
+    """以列投影方式查询任务数据，直接返回字典，不经过 ORM 实体和 identity map"""
+    columns = model.__table__.columns
+    query = select(*columns).where(*criteria)
+    if order_by:
+        query = query.order_by(columns[order_by])
+    result = db.execute(query)
+    return [dict(row) for row in result.mappings()]
+
+
+def _get_task_tree_json_postgres(db: Session,
+                                 user_id: int) -> Tuple[int, Dict[str, str]]:
+    """PostgreSQL: 一次查询以 json_agg 返回版本号和四个结果集的 JSON 文本"""
+    selects = ["(SELECT max(id) FROM task_changes "
+               "WHERE user_id = :user_id) AS version"]
+    for model, key in TASK_ENTITIES.values():
+        table = model.__table__
+        column_list = ", ".join(c.name for c in table.columns)
+        order = TASK_TREE_ORDER.get(key)
+        order_by = f" ORDER BY t.{order}" if order else ""
+        selects.append(f"(SELECT coalesce(json_agg(t{order_by}), '[]')::text "
+                       f"FROM (SELECT {column_list} FROM {table.name} "
+                       f"WHERE user_id = :user_id) t) AS {key}")
+    row = db.execute(text("SELECT " + ", ".join(selects)), {
+        "user_id": user_id
+    }).mappings().one()
+    return row["version"] or 0, {
+        key: row[key]
+        for _, key in TASK_ENTITIES.values()
+    }
+
+
+def get_task_tree_json(db: Session,
+                       user_id: int) -> Tuple[int, Dict[str, str]]:
+    """
+    读取用户全部任务数据并直接序列化为 JSON 文本
+    返回:
+        (version, dict): 同步版本号，以及 categories/items/progresses/notifies
+                         对应的 JSON 数组文本
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return _get_task_tree_json_postgres(db, user_id)
+
+    # 先取得版本号再读取数据，期间发生的变更会在下次增量同步时重复返回
+    version = get_task_version(db, user_id)
+    data = {}
+    for model, key in TASK_ENTITIES.values():
+        rows = select_task_rows(db,
+                                model,
+                                model.user_id == user_id,
+                                order_by=TASK_TREE_ORDER.get(key))
+        data[key] = json.dumps(rows, default=json_default, ensure_ascii=False)
+    return version, data
+
+
+# 任务树检索: 实体 -> (模型, 名称列)，名称和内容一起检索
+TASK_SEARCH_ENTITIES = {
+    "category": (models.TaskCategory, models.TaskCategory.category_name),
+    "item": (models.TaskItem, models.TaskItem.item_name),
+    "progress": (models.TaskProgress, models.TaskProgress.progress_name),
+}
+
+
+def search_task_tree(db: Session,
+                     user_id: int,
+                     q: str,
+                     limit: int = 20) -> List[Dict]:
+    """
+    在用户的分类、项目、进度的名称和内容中全文检索，按相关度排序
+    返回:
+        list: 每个命中节点及其 分类 -> 项目 -> 进度 路径，格式:
+              {"entity", "id", "score", "category": {"id", "name"},
+               "item": {"id", "name"} | None, "progress": {...} | None}
+    """
+    if not q.split():
+        return []
+
+    category, item, progress = (models.TaskCategory, models.TaskItem,
+                                models.TaskProgress)
+    no_id = cast(null(), Integer)
+    no_name = cast(null(), Text)
+    selects = []
+    for entity, (model, name_column) in TASK_SEARCH_ENTITIES.items():
+        matches = _search_matches(db, model, (name_column, model.content),
+                                  q).subquery()
+        # 每个实体都投影成相同的 路径 列，合并为一个 UNION ALL 查询
+        if entity == "category":
+            path = [
+                category.id, category.category_name, no_id, no_name, no_id,
+                no_name
+            ]
+            joins = []
+        elif entity == "item":
+            path = [
+                category.id, category.category_name, item.id, item.item_name,
+                no_id, no_name
+            ]
+            joins = [(category, category.id == item.category_id)]
+        else:
+            path = [
+                category.id, category.category_name, item.id, item.item_name,
+                progress.id, progress.progress_name
+            ]
+            joins = [(item, item.id == progress.item_id),
+                     (category, category.id == item.category_id)]
+
+        stmt = select(
+            literal(entity).label("entity"),
+            model.id.label("id"),
+            matches.c.score.label("score"),
+            *[col.label(label) for col, label in zip(path, (
+                "category_id", "category_name", "item_id", "item_name",
+                "progress_id", "progress_name"))]).select_from(model).join(
+                    matches, matches.c.id == model.id)
+        for target, onclause in joins:
+            stmt = stmt.join(target, onclause)
+        selects.append(stmt.where(model.user_id == user_id))
+
+    combined = union_all(*selects).subquery()
+    rows = db.execute(
+        select(combined).order_by(combined.c.score.desc(), combined.c.entity,
+                                  combined.c.id).limit(limit)).all()
+
+    def node(node_id, name):
+        return None if node_id is None else {"id": node_id, "name": name}
+
+    return [{
+        "entity": row.entity,
+        "id": row.id,
+        "score": row.score,
+        "category": node(row.category_id, row.category_name),
+        "item": node(row.item_id, row.item_name),
+        "progress": node(row.progress_id, row.progress_name),
+    } for row in rows]
+
+
 def create_task_category(db: Session, category: schemas.TaskCategoryCreate,
                          user_id: int):
     """创建新的任务分类"""
@@ -148,6 +892,8 @@ def create_task_category(db: Session, category: schemas.TaskCategoryCreate,
                                       category_name=category.category_name,
                                       content=category.content)
     db.add(db_category)
+    db.flush()
+    record_task_changes(db, user_id, "category", [db_category.id])
     db.commit()
     db.refresh(db_category)
     return db_category
@@ -167,6 +913,7 @@ def update_task_category(db: Session, category_id: int,
     # 更新分类信息
     db_category.category_name = category.category_name
     db_category.content = category.content
+    record_task_changes(db, user_id, "category", [category_id])
 
     db.commit()
     db.refresh(db_category)
@@ -187,6 +934,22 @@ def delete_task_category(db: Session, category_id: int, user_id: int):
         models.TaskNotify.category_id == category_id,
         models.TaskNotify.user_id == user_id).count()
 
+    # 记录级联删除的项目、进度和通知，供增量同步使用
+    item_ids = db.query(models.TaskItem.id).filter(
+        models.TaskItem.category_id == category_id)
+    progress_ids = db.query(models.TaskProgress.id).filter(
+        models.TaskProgress.item_id.in_(item_ids))
+    notify_ids = db.query(models.TaskNotify.id).filter(
+        models.TaskNotify.category_id == category_id)
+    record_task_changes(db, user_id, "notify",
+                        [row.id for row in notify_ids], TASK_CHANGE_DELETE)
+    record_task_changes(db, user_id, "progress",
+                        [row.id for row in progress_ids], TASK_CHANGE_DELETE)
+    record_task_changes(db, user_id, "item", [row.id for row in item_ids],
+                        TASK_CHANGE_DELETE)
+    record_task_changes(db, user_id, "category", [category_id],
+                        TASK_CHANGE_DELETE)
+
     # 删除分类（由于设置了级联删除，关联的项目和进度也会自动删除）
     db.delete(db_category)
     db.commit()
@@ -202,11 +965,108 @@ def create_task_item(db: Session, item: schemas.TaskItemCreate, user_id: int):
                               content=item.content,
                               item_at=item.item_at)
     db.add(db_item)
+    db.flush()
+    record_task_changes(db, user_id, "item", [db_item.id])
     db.commit()
     db.refresh(db_item)
     return db_item
 
 
+# 批量写入一次最多处理的行数
+TASK_BATCH_LIMIT = 1000
+
+
+def _owns_all(db: Session, model, ids: Iterable[int], user_id: int) -> bool:
+    """检查 ids 对应的行是否全部存在且属于该用户(一次查询)"""
+    ids = set(ids)
+    owned = db.query(func.count(model.id)).filter(
+        model.id.in_(ids), model.user_id == user_id).scalar()
+    return owned == len(ids)
+
+
+def _bulk_create_task_rows(db: Session, model, entity: str, parent_model,
+                           parent_key: str, rows: List[Dict],
+                           user_id: int) -> Optional[List[Dict]]:
+    """
+    批量新增任务数据: 一次检查上级归属，以一条 INSERT ... RETURNING 写入
+    返回:
+        list: 新增行的字典(与输入顺序一致)；上级不存在或不属于该用户时返回 None
+    """
+    if not _owns_all(db, parent_model, [row[parent_key] for row in rows],
+                     user_id):
+        return None
+
+    columns = model.__table__.columns
+    try:
+        created = db.execute(
+            insert(model).returning(*columns, sort_by_parameter_order=True),
+            [dict(row, user_id=user_id) for row in rows]).mappings().all()
+        created = [dict(row) for row in created]
+        record_task_changes(db, user_id, entity,
+                            [row["id"] for row in created])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return created
+
+
+def _bulk_update_task_rows(db: Session, model, entity: str, rows: List[Dict],
+                           user_id: int) -> Optional[List[Dict]]:
+    """
+    批量更新任务数据: 一次检查归属，按主键批量 UPDATE
+    返回:
+        list: 更新后的行字典；任一行不存在或不属于该用户时返回 None
+    """
+    ids = [row["id"] for row in rows]
+    if not _owns_all(db, model, ids, user_id):
+        return None
+
+    try:
+        db.execute(update(model), rows)
+        record_task_changes(db, user_id, entity, ids)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return select_task_rows(db, model, model.id.in_(ids))
+
+
+def create_task_items(db: Session, items: List[schemas.TaskItemCreate],
+                      user_id: int) -> Optional[List[Dict]]:
+    """批量创建任务项，所有分类必须属于该用户"""
+    # 与 server_default now() 一致: 同一事务内的时间相同
+    now = datetime.now(timezone.utc)
+    rows = [{
+        "category_id": item.category_id,
+        "item_name": item.item_name,
+        "content": item.content,
+        "item_at": item.item_at or now
+    } for item in items]
+    return _bulk_create_task_rows(db, models.TaskItem, "item",
+                                  models.TaskCategory, "category_id", rows,
+                                  user_id)
+
+
+def update_task_items(db: Session, items: List[schemas.TaskItemBatchUpdate],
+                      user_id: int) -> Optional[List[Dict]]:
+    """
+    批量更新任务项目，与 update_task_item 相同:
+    未提供 item_at 时保持原值
+    """
+    rows = []
+    for item in items:
+        row = {
+            "id": item.id,
+            "item_name": item.item_name,
+            "content": item.content
+        }
+        if item.item_at:
+            row["item_at"] = item.item_at
+        rows.append(row)
+    return _bulk_update_task_rows(db, models.TaskItem, "item", rows, user_id)
+
+
 def update_task_item(db: Session, item_id: int, item: schemas.TaskItemUpdate,
                      user_id: int):
     """更新任务项目"""
@@ -222,6 +1082,7 @@ def update_task_item(db: Session, item_id: int, item: schemas.TaskItemUpdate,
     db_item.content = item.content
     if item.item_at:
         db_item.item_at = item.item_at
+    record_task_changes(db, user_id, "item", [item_id])
 
     db.commit()
     db.refresh(db_item)
@@ -242,6 +1103,17 @@ def delete_task_item(db: Session, item_id: int, user_id: int):
         models.TaskNotify.item_id == item_id,
         models.TaskNotify.user_id == user_id).count()
 
+    # 记录级联删除的进度和通知，供增量同步使用
+    progress_ids = db.query(models.TaskProgress.id).filter(
+        models.TaskProgress.item_id == item_id)
+    notify_ids = db.query(models.TaskNotify.id).filter(
+        models.TaskNotify.item_id == item_id)
+    record_task_changes(db, user_id, "notify",
+                        [row.id for row in notify_ids], TASK_CHANGE_DELETE)
+    record_task_changes(db, user_id, "progress",
+                        [row.id for row in progress_ids], TASK_CHANGE_DELETE)
+    record_task_changes(db, user_id, "item", [item_id], TASK_CHANGE_DELETE)
+
     # 删除项目（由于设置了级联删除，关联的进度也会自动删除）
     db.delete(db_item)
     db.commit()
@@ -259,11 +1131,52 @@ def create_task_progress(db: Session, progress: schemas.TaskProgressCreate,
                                       progress_at=progress.progress_at,
                                       status=progress.status)
     db.add(db_progress)
+    db.flush()
+    record_task_changes(db, user_id, "progress", [db_progress.id])
     db.commit()
     db.refresh(db_progress)
     return db_progress
 
 
+def create_task_progresses(db: Session,
+                           progresses: List[schemas.TaskProgressCreate],
+                           user_id: int) -> Optional[List[Dict]]:
+    """批量创建任务进度，所有项目必须属于该用户"""
+    now = datetime.now(timezone.utc)
+    rows = [{
+        "item_id": progress.item_id,
+        "progress_name": progress.progress_name,
+        "content": progress.content,
+        "progress_at": progress.progress_at or now,
+        "status": progress.status
+    } for progress in progresses]
+    return _bulk_create_task_rows(db, models.TaskProgress, "progress",
+                                  models.TaskItem, "item_id", rows, user_id)
+
+
+def update_task_progresses(db: Session,
+                           progresses: List[schemas.TaskProgressBatchUpdate],
+                           user_id: int) -> Optional[List[Dict]]:
+    """
+    批量更新任务进度，与 update_task_progress 相同:
+    未提供 progress_at / status 时保持原值
+    """
+    rows = []
+    for progress in progresses:
+        row = {
+            "id": progress.id,
+            "progress_name": progress.progress_name,
+            "content": progress.content
+        }
+        if progress.progress_at:
+            row["progress_at"] = progress.progress_at
+        if progress.status is not None:
+            row["status"] = progress.status
+        rows.append(row)
+    return _bulk_update_task_rows(db, models.TaskProgress, "progress", rows,
+                                  user_id)
+
+
 def update_task_progress(db: Session, progress_id: int,
                          progress: schemas.TaskProgressUpdate, user_id: int):
     """更新任务进度"""
@@ -281,6 +1194,7 @@ def update_task_progress(db: Session, progress_id: int,
         db_progress.progress_at = progress.progress_at
     if progress.status is not None:
         db_progress.status = progress.status
+    record_task_changes(db, user_id, "progress", [progress_id])
 
     db.commit()
     db.refresh(db_progress)
@@ -290,16 +1204,25 @@ def update_task_progress(db: Session, progress_id: int,
 def delete_task_progress(db: Session, progress_id: int, user_id: int):
     """删除任务进度"""
     # 打印调试信息
-    print(f"Deleting progress - ID: {progress_id}, User ID: {user_id}")
+    logger.debug("Deleting progress - ID: %s, User ID: %s", progress_id,
+                 user_id)
 
     # 查找进度
     db_progress = db.query(models.TaskProgress).filter(
         models.TaskProgress.id == progress_id,
         models.TaskProgress.user_id == user_id).first()
     if not db_progress:
-        print(f"Progress with ID {progress_id} not found")
+        logger.warning("Progress with ID %s not found", progress_id)
         return None
 
+    # 记录级联删除的通知，供增量同步使用
+    notify_ids = db.query(models.TaskNotify.id).filter(
+        models.TaskNotify.progress_id == progress_id)
+    record_task_changes(db, user_id, "notify",
+                        [row.id for row in notify_ids], TASK_CHANGE_DELETE)
+    record_task_changes(db, user_id, "progress", [progress_id],
+                        TASK_CHANGE_DELETE)
+
     # 删除进度
     db.delete(db_progress)
     db.commit()
@@ -336,10 +1259,39 @@ def get_progress_details(db: Session, category_id: int, item_id: int,
             "progress_content": progress.content
         }
     except Exception as e:
-        print(f"Error getting progress details: {str(e)}")
+        logger.error("Error getting progress details: %s", e)
         return None
 
 
+def scheduler_notifies_query(now: datetime):
+    """
+    调度器需要加载的通知(连同用户名)
+    两个条件分别命中 task_notifies 的部分索引，以 UNION ALL 合并；
+    条件中的常量以字面量写入 SQL，SQLite 才能判断可以使用部分索引
+    """
+    columns = [*models.TaskNotify.__table__.columns, models.User.username]
+    notify = models.TaskNotify
+    once_pending = select(*columns).join(
+        models.User, notify.user_id == models.User.id).where(
+            notify.run_mode == literal_column("0"),
+            notify.last_executed.is_(None))
+    repeating = select(*columns).join(
+        models.User, notify.user_id == models.User.id).where(
+            notify.run_mode.in_([literal_column("1"),
+                                 literal_column("2")]), notify.stop_at > now)
+    return union_all(once_pending, repeating)
+
+
+def iter_scheduler_notifies(db: Session,
+                            now: datetime,
+                            batch_size: int = 1000):
+    """逐批读取调度器需要加载的通知(服务端游标)，每行为字典"""
+    result = db.execute(scheduler_notifies_query(now),
+                        execution_options={"yield_per": batch_size})
+    for row in result.mappings():
+        yield dict(row)
+
+
 def create_task_notify(db: Session,
                        notify: schemas.TaskNotifyCreate,
                        user_id: int,
@@ -356,6 +1308,8 @@ def create_task_notify(db: Session,
                                   time_at=notify.time_at,
                                   week_at=notify.week_at)
     db.add(db_notify)
+    db.flush()
+    record_task_changes(db, user_id, "notify", [db_notify.id])
     db.commit()
     db.refresh(db_notify)
 
@@ -406,6 +1360,7 @@ def update_task_notify(db: Session,
         db_notify.week_at = notify.week_at
 
     db_notify.last_executed = None
+    record_task_changes(db, user_id, "notify", [notify_id])
 
     db.commit()
     db.refresh(db_notify)
@@ -435,6 +1390,8 @@ def delete_task_notify(db: Session,
         return None
     # 删除通知
     db.delete(db_notify)
+    record_task_changes(db, user_id, "notify", [notify_id],
+                        TASK_CHANGE_DELETE)
     db.commit()
 
     if task_notify_service:
@@ -451,6 +1408,9 @@ def reset_last_executed(db: Session, user_id: int = None):
     if user_id != 0:
         query = query.filter(models.TaskNotify.user_id == user_id)
 
+    record_notify_changes(
+        db, query.with_entities(models.TaskNotify.user_id,
+                                models.TaskNotify.id), TASK_CHANGE_UPSERT)
     updated = query.update({'last_executed': None})
     db.commit()
     return updated
@@ -461,18 +1421,20 @@ def delete_notifies(db: Session, user_id: int):
     try:
         # 如果 user_id 为 0，删除所有通知
         if user_id == 0:
-            deleted_count = db.query(models.TaskNotify).count()
-            db.query(models.TaskNotify).delete()
+            query = db.query(models.TaskNotify)
         else:
             # 删除指定用户的通知
-            deleted_count = db.query(models.TaskNotify).filter(
-                models.TaskNotify.user_id == user_id).count()
-            db.query(models.TaskNotify).filter(
-                models.TaskNotify.user_id == user_id).delete()
+            query = db.query(models.TaskNotify).filter(
+                models.TaskNotify.user_id == user_id)
+
+        record_notify_changes(
+            db, query.with_entities(models.TaskNotify.user_id,
+                                    models.TaskNotify.id), TASK_CHANGE_DELETE)
+        deleted_count = query.delete(synchronize_session=False)
 
         db.commit()
         return deleted_count
     except Exception as e:
-        print(f"Error deleting notifies: {str(e)}")
+        logger.error("Error deleting notifies: %s", e)
         db.rollback()
         return 0
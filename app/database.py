@@ -1,20 +1,139 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
 from .config import Config
+from .metrics import instrument_engine
 
 DATABASE_URL = Config.DATABASE_URL
 
-# engine = create_engine(DATABASE_URL)
-# 添加连接池配置
-engine = create_engine(
-    DATABASE_URL,
-    pool_size=5,
-    max_overflow=10,
-    pool_timeout=30,
-    pool_recycle=1800,
-    pool_pre_ping=True
-)
+# 连接池配置
+# serverless: 每个实例生命周期短，且常有多个实例同时运行，不自建连接池，
+#             每次会话直接连接(应使用 Neon 等提供的外部连接池地址)
+# worker: 长驻进程使用固定大小的 QueuePool，默认不做 pre-ping，
+#         依靠 pool_recycle 在服务端断开空闲连接前更换连接
+POOL_PROFILES = ("serverless", "worker")
+
+
+class PoolStats:
+    """连接池统计：取得连接的次数、等待时间、超时次数、使用中的连接数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.checked_out = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def on_connect(self, *args):
+        with self._lock:
+            self.connects += 1
+
+    def on_checkout(self, *args):
+        with self._lock:
+            self.checked_out += 1
+
+    def on_checkin(self, *args):
+        with self._lock:
+            self.checked_out -= 1
+
+
+pool_stats = PoolStats()
+
+
+class _TimedPool:
+    """记录从连接池取得连接所花的时间(含排队、新建连接和 pre-ping)"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            pool_stats.record_timeout()
+            raise
+        pool_stats.record_wait(time.perf_counter() - start)
+        return connection
+
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    pass
+
+
+class TimedNullPool(_TimedPool, NullPool):
+    pass
+
+
+def resolve_pool_profile() -> str:
+    """未指定 DB_POOL_PROFILE 时，Vercel 使用 serverless，其余使用 worker"""
+    profile = Config.DB_POOL_PROFILE
+    if not profile:
+        profile = "serverless" if Config.ENV == "vercel" else "worker"
+    if profile not in POOL_PROFILES:
+        raise ValueError(f"Unknown DB_POOL_PROFILE: {profile}")
+    return profile
+
+
+def engine_options(profile: str) -> dict:
+    if profile == "serverless":
+        return {"poolclass": TimedNullPool}
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": Config.DB_POOL_SIZE,
+        "max_overflow": Config.DB_MAX_OVERFLOW,
+        "pool_timeout": Config.DB_POOL_TIMEOUT,
+        "pool_recycle": Config.DB_POOL_RECYCLE,
+        "pool_pre_ping": Config.DB_POOL_PRE_PING,
+    }
+
+
+POOL_PROFILE = resolve_pool_profile()
+engine = create_engine(DATABASE_URL, **engine_options(POOL_PROFILE))
+event.listen(engine, "connect", pool_stats.on_connect)
+event.listen(engine, "checkout", pool_stats.on_checkout)
+event.listen(engine, "checkin", pool_stats.on_checkin)
+instrument_engine(engine)
+
+
+def pool_status() -> dict:
+    """连接池当前状态，供 /api/health 使用"""
+    pool = engine.pool
+    stats = pool_stats
+    wait_avg = stats.wait_total / stats.checkouts if stats.checkouts else 0
+    status = {
+        "profile": POOL_PROFILE,
+        "pool": type(pool).__name__,
+        "checked_out": stats.checked_out,
+        "connects": stats.connects,
+        "checkouts": stats.checkouts,
+        "timeouts": stats.timeouts,
+        "wait_avg_ms": round(wait_avg * 1000, 3),
+        "wait_max_ms": round(stats.wait_max * 1000, 3),
+    }
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            # QueuePool.overflow() 在连接未满 pool_size 时为负数
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+        })
+    return status
+
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -0,0 +1,169 @@
+"""
+健康检查
+负载均衡器频繁探测 /api/health，每次都检查配置并建立数据库连接会造成持续的连接开销。
+HealthMonitor 缓存最近一次检查的结果，由后台循环(或过期后的下一次请求)刷新；
+深度检查(就绪检查)则每次实时查询，并附带连接池、调度器、SSE 和待处理队列的状态。
+"""
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+from sqlalchemy import func, select, text
+from . import models
+from .config import Config
+from .connections import connections
+from .database import SessionLocal, engine, pool_status
+
+HEALTHY = "健康 Version: 1.0.2"
+UNHEALTHY = "不健康"
+
+
+def check_database() -> Dict:
+    """执行 SELECT 1，返回连接状态和耗时"""
+    start = time.perf_counter()
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    except Exception as e:
+        return {"status": "已斷開", "error": str(e)}
+    return {
+        "status": "已連接",
+        "latency_ms": round((time.perf_counter() - start) * 1000, 3)
+    }
+
+
+def pending_queue_depths() -> Dict[str, int]:
+    """后台待处理队列(延迟上传、待删除图片)的积压数量"""
+    db = SessionLocal()
+    try:
+        return {
+            "image_uploads":
+            db.execute(
+                select(func.count()).select_from(
+                    models.PendingImageUpload).where(
+                        models.PendingImageUpload.status ==
+                        "pending")).scalar(),
+            "image_deletions":
+            db.execute(
+                select(func.count()).select_from(
+                    models.PendingImageDeletion)).scalar(),
+        }
+    finally:
+        db.close()
+
+
+def scheduler_status(service) -> Dict:
+    """
+    通知调度器状态
+    lag_seconds 为距上次检查的时间超出检查间隔的部分，持续增大表示调度循环被阻塞
+    """
+    if service is None:
+        return {"running": False}
+    status = {"running": service._running, "count": len(service.notifies)}
+    if service.last_check_at:
+        age = (datetime.now(timezone.utc) -
+               service.last_check_at).total_seconds()
+        status["last_check_at"] = service.last_check_at.isoformat()
+        status["lag_seconds"] = round(max(age - service.CHECK_INTERVAL, 0), 3)
+    status["stats"] = service.stats.summary()
+    return status
+
+
+class HealthMonitor:
+    """缓存存活检查结果，最多每 ttl 秒刷新一次"""
+
+    def __init__(self,
+                 check_config: Callable[[], None],
+                 ttl: int = None,
+                 refresh_interval: int = None):
+        self.check_config = check_config
+        self.ttl = ttl or Config.HEALTH_CACHE_TTL
+        self.refresh_interval = (Config.HEALTH_REFRESH_INTERVAL
+                                 if refresh_interval is None else
+                                 refresh_interval)
+        self.snapshot: Optional[Dict] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._running = False
+        self._stop_event = asyncio.Event()
+
+    def refresh(self) -> Dict:
+        """检查配置和数据库连接，更新缓存(同步执行)"""
+        components = {"config": {"status": "正常"}, "api": {"status": "正常"}}
+        healthy = True
+        try:
+            self.check_config()
+        except ValueError as e:
+            healthy = False
+            components["config"] = {"status": "錯誤", "error": str(e)}
+
+        database = check_database()
+        healthy = healthy and "error" not in database
+        components["database"] = database
+
+        self.snapshot = {
+            "status": HEALTHY if healthy else UNHEALTHY,
+            "checked_at": datetime.now(timezone.utc).isoformat(),
+            "components": components
+        }
+        self._checked_at = time.monotonic()
+        return self.snapshot
+
+    def get(self) -> Dict:
+        """
+        返回缓存的结果，过期时由一个请求刷新，其余请求继续使用旧结果
+        连接池统计只读内存，每次附上最新值
+        """
+        stale = time.monotonic() - self._checked_at >= self.ttl
+        if self.snapshot is None or stale:
+            if self._lock.acquire(blocking=self.snapshot is None):
+                try:
+                    self.refresh()
+                finally:
+                    self._lock.release()
+        snapshot = dict(self.snapshot)
+        snapshot["components"] = {
+            **snapshot["components"], "database": {
+                **snapshot["components"]["database"], "pool": pool_status()
+            }
+        }
+        return snapshot
+
+    def deep(self, scheduler=None) -> Dict:
+        """就绪检查：实时检查数据库，并汇总各后台服务的状态"""
+        snapshot = self.refresh()
+        components = {
+            **snapshot["components"],
+            "database": {
+                **snapshot["components"]["database"], "pool": pool_status()
+            },
+            "scheduler": scheduler_status(scheduler),
+            "sse": connections.stats(),
+        }
+        try:
+            components["queues"] = pending_queue_depths()
+        except Exception as e:
+            components["queues"] = {"error": str(e)}
+        return {**snapshot, "components": components}
+
+    async def start(self):
+        """
+        后台每 refresh_interval 秒刷新一次缓存(0 表示不在后台刷新)
+        没有探测请求时也只以这个间隔连接数据库；
+        有探测请求时缓存超过 ttl 仍由请求刷新
+        """
+        if self.refresh_interval <= 0:
+            return
+        self._running = True
+        while self._running:
+            await asyncio.to_thread(self.refresh)
+            try:
+                await asyncio.wait_for(self._stop_event.wait(),
+                                       self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self):
+        self._running = False
+        self._stop_event.set()
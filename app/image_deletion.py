@@ -0,0 +1,105 @@
+import asyncio
+from . import cloudinary_service, models
+from .database import SessionLocal
+from .log import get_logger
+from .metrics import external_call
+
+logger = get_logger(__name__)
+
+# Cloudinary delete_resources 每次最多删除 100 个资源
+BATCH_SIZE = 100
+# 超过此失败次数的记录不再自动重试，保留在表中供人工处理
+MAX_ATTEMPTS = 5
+
+
+def delete_pending_images(batch_size: int = BATCH_SIZE) -> int:
+    """
+    批量删除 pending_image_deletions 中登记的 Cloudinary 图片(同步执行)
+    每条记录每次调用最多尝试一次，失败的记录累计 attempts 等待下次重试
+    返回:
+        int: 本次成功删除的数量
+    """
+    db = SessionLocal()
+    deleted = 0
+    last_id = 0
+    try:
+        while True:
+            query = db.query(models.PendingImageDeletion.id,
+                             models.PendingImageDeletion.public_id)
+            rows = query.filter(
+                models.PendingImageDeletion.id > last_id,
+                models.PendingImageDeletion.attempts < MAX_ATTEMPTS).order_by(
+                    models.PendingImageDeletion.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            try:
+                with external_call("cloudinary"):
+                    result = cloudinary_service.api().delete_resources(
+                        [row.public_id for row in rows])
+                statuses = result.get("deleted", {})
+                error = "not deleted"
+            except Exception as e:
+                logger.error("Error deleting images from Cloudinary: %s", e)
+                statuses = {}
+                error = str(e)
+
+            # 已删除或本来就不存在的都视为完成
+            done_ids = [
+                row.id for row in rows
+                if statuses.get(row.public_id) in ("deleted", "not_found")
+            ]
+            failed_ids = [row.id for row in rows if row.id not in done_ids]
+            if done_ids:
+                db.query(models.PendingImageDeletion).filter(
+                    models.PendingImageDeletion.id.in_(done_ids)).delete(
+                        synchronize_session=False)
+            if failed_ids:
+                db.query(models.PendingImageDeletion).filter(
+                    models.PendingImageDeletion.id.in_(failed_ids)).update(
+                        {
+                            "attempts":
+                            models.PendingImageDeletion.attempts + 1,
+                            "last_error": error
+                        },
+                        synchronize_session=False)
+            db.commit()
+            deleted += len(done_ids)
+    except Exception as e:
+        logger.error("批量删除图片失败: %s", e)
+        db.rollback()
+    finally:
+        db.close()
+    return deleted
+
+
+class ImageDeletionWorker:
+    """后台批量删除 Cloudinary 图片，有新登记时立即处理，否则定时重试失败的记录"""
+    INTERVAL = 60  # 重试间隔(秒)
+
+    def __init__(self):
+        self._event = asyncio.Event()
+        self._running = False
+
+    def notify(self):
+        """通知有新的待删除图片"""
+        self._event.set()
+
+    async def start(self):
+        """启动删除循环"""
+        self._running = True
+        while self._running:
+            deleted = await asyncio.to_thread(delete_pending_images)
+            if deleted:
+                logger.info("已从 Cloudinary 删除 %s 张图片", deleted)
+            try:
+                await asyncio.wait_for(self._event.wait(), self.INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._event.clear()
+
+    def stop(self):
+        """停止删除循环"""
+        self._running = False
+        self._event.set()
@@ -0,0 +1,95 @@
+"""
+留言图片预处理：缩小尺寸、去除元数据(EXIF/GPS 等)并重新编码为网页格式
+图片解码和编码是 CPU 密集操作，在进程池中执行，不占用事件循环
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from .config import Config
+
+_executor = None
+
+
+def is_enabled() -> bool:
+    return Config.IMAGE_MAX_DIMENSION > 0
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=Config.IMAGE_PROCESS_WORKERS)
+    return _executor
+
+
+def shutdown():
+    """关闭进程池(应用关闭时调用)，未开始的预处理任务直接取消"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+def transcode_image(src_path: str, dst_path: str, max_dimension: int,
+                    image_format: str, quality: int) -> bool:
+    """
+    在子进程中执行：缩小到 max_dimension 以内并重新编码
+    返回:
+        bool: 是否已写出 dst_path；无法处理的文件(非图片、动图)返回 False
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return False
+
+    try:
+        with Image.open(src_path) as img:
+            # 动图重新编码会丢失帧，保留原文件
+            if getattr(img, "is_animated", False):
+                return False
+            # 先按 EXIF 方向旋转，之后保存时不带 EXIF
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((max_dimension, max_dimension))
+            if image_format == "JPEG" and img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            elif img.mode not in ("RGB", "RGBA", "L"):
+                img = img.convert("RGBA")
+            img.save(dst_path, format=image_format, quality=quality)
+        return True
+    except Exception as e:
+        # 在进程池的子进程中执行，日志队列只在主进程中有输出线程，直接写 stdout
+        print(f"Error preprocessing image: {str(e)}")
+        return False
+
+
+async def preprocess_image_to(src_path: str, dst_path: str) -> bool:
+    """
+    预处理 src_path 并写到 dst_path(先写临时文件再改名，dst_path 存在即为完整结果)
+    返回:
+        bool: 是否已写出 dst_path；未启用或无法处理时返回 False
+    """
+    if not is_enabled():
+        return False
+
+    tmp_path = dst_path + ".tmp"
+    loop = asyncio.get_running_loop()
+    processed = await loop.run_in_executor(get_executor(), transcode_image,
+                                           src_path, tmp_path,
+                                           Config.IMAGE_MAX_DIMENSION,
+                                           Config.IMAGE_FORMAT,
+                                           Config.IMAGE_QUALITY)
+    if not processed:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, dst_path)
+    return True
+
+
+async def preprocess_image(path: str) -> bool:
+    """
+    就地预处理图片文件(处理结果替换原文件)
+    返回:
+        bool: 是否已替换；未启用或无法处理时保留原文件并返回 False
+    """
+    return await preprocess_image_to(path, path)
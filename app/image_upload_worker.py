@@ -0,0 +1,225 @@
+import asyncio
+from typing import Optional
+from . import models, crud, image_deletion, image_processing
+from .database import SessionLocal
+from .connections import connections
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+
+class ImageUploadWorker:
+    """
+    后台上传延迟处理的留言图片
+    留言写入后图片暂存在本地，由本服务上传到 Cloudinary，
+    成功后更新 messages.image_url 并通过 SSE 通知所有在线用户
+    """
+    RETRY_DELAYS = [5, 30, 120]  # 每次失败后的重试等待(秒)
+    MESSAGE_IMAGE = 'message_image'
+
+    def __init__(self, image_deletion_worker=None):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        # 重复上传的图片登记删除后通知删除服务，没有时直接执行一次批量删除
+        self.image_deletion_worker = image_deletion_worker
+        self._running = False
+        self._retry_tasks = set()
+
+    def enqueue(self, pending_id: int):
+        """加入待上传队列"""
+        self.queue.put_nowait(pending_id)
+
+    def recover_pending(self):
+        """重新加入上次运行时未完成的上传(进程崩溃或重启后恢复)"""
+        db = SessionLocal()
+        try:
+            pending_ids = [
+                row.id for row in db.query(models.PendingImageUpload.id).
+                filter(models.PendingImageUpload.status == "pending").order_by(
+                    models.PendingImageUpload.id)
+            ]
+        finally:
+            db.close()
+        for pending_id in pending_ids:
+            self.enqueue(pending_id)
+        if pending_ids:
+            logger.info("恢复 %s 个未完成的图片上传", len(pending_ids))
+
+    async def start(self):
+        """启动上传循环"""
+        self._running = True
+        self.recover_pending()
+        while self._running:
+            pending_id = await self.queue.get()
+            if pending_id is None:  # 收到停止信号
+                break
+            try:
+                await self.process(pending_id)
+            except Exception as e:
+                logger.error("处理图片上传 %s 时出错: %s", pending_id, e)
+
+    def stop(self):
+        """停止上传循环，未完成的上传保留在数据库中，下次启动时恢复"""
+        self._running = False
+        self.queue.put_nowait(None)
+        for task in self._retry_tasks:
+            task.cancel()
+
+    async def process(self, pending_id: int):
+        """上传一张图片，成功后更新留言，失败则按 RETRY_DELAYS 重试"""
+        db = SessionLocal()
+        try:
+            pending = db.query(models.PendingImageUpload).filter(
+                models.PendingImageUpload.id == pending_id).first()
+            if not pending or pending.status != "pending":
+                return
+
+            message = db.query(models.Message).filter(
+                models.Message.id == pending.message_id).first()
+            if not message:
+                # 留言已被删除
+                self._discard(db, pending)
+                return
+
+            # 等待期间其他留言可能已上传了相同内容的图片
+            message_id = message.id
+            image_url = None
+            upload_result = None
+            if pending.digest:
+                image_url = crud.acquire_image_asset(db, pending.digest)
+
+            if not image_url:
+                # 预处理结果写到另一个文件并记录在 processed_path，
+                # 重试或重启恢复时直接上传，不再重复编码
+                if pending.processed_path is None:
+                    await self._preprocess(db, pending)
+                paths = (pending.file_path, pending.processed_path)
+                filename = pending.filename
+                # 上传期间不占用事务，留言可以同时被删除
+                db.commit()
+
+                try:
+                    upload_result = await crud.upload_stream_to_cloudinary(
+                        open(paths[1], "rb"), filename)
+                except Exception as e:
+                    pending, message = self._reload(db, pending_id,
+                                                    message_id)
+                    if not pending or not message:
+                        # 上传期间留言已被删除
+                        self._abandon(db, pending_id, None, paths)
+                    elif isinstance(e, FileNotFoundError):
+                        # 暂存文件已丢失，无法重试
+                        self._fail(db, pending, str(e))
+                    else:
+                        self._retry_or_fail(db, pending, str(e))
+                    return
+
+                # 重新读取留言和暂存记录，上传期间留言可能已被删除
+                pending, message = self._reload(db, pending_id, message_id)
+                if not pending or not message:
+                    self._abandon(db, pending_id, upload_result, paths)
+                    await self._schedule_image_deletions()
+                    return
+
+                image_url = upload_result['secure_url']
+                if pending.digest:
+                    image_url = crud.register_image_asset(
+                        db, pending.digest, upload_result)
+
+            message.image_url = image_url
+            crud.bump_sync_version(db, crud.MESSAGES_SCOPE)
+            self._discard(db, pending)
+            self.publish(message_id, image_url, None)
+            # 并发上传了相同内容时，本次上传的图片已登记删除
+            if upload_result and image_url != upload_result['secure_url']:
+                await self._schedule_image_deletions()
+        finally:
+            db.close()
+
+    def _reload(self, db, pending_id: int, message_id: int):
+        """重新读取暂存记录和留言(锁定留言直到提交)，已删除的返回 None"""
+        pending = db.query(models.PendingImageUpload).filter(
+            models.PendingImageUpload.id == pending_id).first()
+        message = db.query(models.Message).filter(
+            models.Message.id == message_id).with_for_update().first()
+        return pending, message
+
+    def _abandon(self, db, pending_id: int, upload_result: Optional[dict],
+                 paths):
+        """
+        上传期间留言已被删除: 刚上传的图片登记删除，清除暂存记录和文件
+        """
+        logger.info("留言已删除，放弃图片上传 (暂存 ID: %s)", pending_id)
+        if upload_result:
+            crud.enqueue_image_deletion(db, upload_result['public_id'])
+        db.query(models.PendingImageUpload).filter(
+            models.PendingImageUpload.id == pending_id).delete(
+                synchronize_session=False)
+        db.commit()
+        crud.remove_upload_files(paths)
+
+    async def _preprocess(self, db, pending: models.PendingImageUpload):
+        """预处理暂存文件，记录要上传的文件(未预处理时为原文件)"""
+        processed_path = pending.file_path + ".processed"
+        if not await image_processing.preprocess_image_to(
+                pending.file_path, processed_path):
+            processed_path = pending.file_path
+        pending.processed_path = processed_path
+        db.commit()
+
+    def _discard(self, db, pending: models.PendingImageUpload):
+        """删除暂存记录和文件"""
+        paths = (pending.file_path, pending.processed_path)
+        db.delete(pending)
+        db.commit()
+        crud.remove_upload_files(paths)
+
+    def _fail(self, db, pending: models.PendingImageUpload, error: str):
+        logger.error("图片上传失败 (留言 ID: %s): %s", pending.message_id, error)
+        pending.status = "failed"
+        pending.last_error = error
+        message_id = pending.message_id
+        paths = (pending.file_path, pending.processed_path)
+        crud.bump_sync_version(db, crud.MESSAGES_SCOPE)
+        db.commit()
+        crud.remove_upload_files(paths)
+        self.publish(message_id, None, "failed")
+
+    def _retry_or_fail(self, db, pending: models.PendingImageUpload,
+                       error: str):
+        pending.attempts += 1
+        if pending.attempts > len(self.RETRY_DELAYS):
+            self._fail(db, pending, error)
+            return
+
+        delay = self.RETRY_DELAYS[pending.attempts - 1]
+        logger.warning("图片上传失败 (留言 ID: %s)，%s 秒后第 %s 次重试: %s",
+                       pending.message_id, delay, pending.attempts, error)
+        pending.last_error = error
+        pending_id = pending.id
+        db.commit()
+        task = asyncio.create_task(self._retry_later(pending_id, delay))
+        self._retry_tasks.add(task)
+        task.add_done_callback(self._retry_tasks.discard)
+
+    async def _schedule_image_deletions(self):
+        """删除并发上传了相同内容时多出的 Cloudinary 图片"""
+        if self.image_deletion_worker:
+            self.image_deletion_worker.notify()
+        else:
+            await asyncio.to_thread(image_deletion.delete_pending_images)
+
+    async def _retry_later(self, pending_id: int, delay: float):
+        await asyncio.sleep(delay)
+        self.enqueue(pending_id)
+
+    def publish(self, message_id: int, image_url: Optional[str],
+                image_status: Optional[str]):
+        """通知所有在线用户留言图片已更新"""
+        connections.broadcast({
+            "type": self.MESSAGE_IMAGE,
+            "message": {
+                "id": message_id,
+                "image_url": image_url,
+                "image_status": image_status
+            }
+        })
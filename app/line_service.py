@@ -1,7 +1,10 @@
 import asyncio
-import httpx
 from fastapi import HTTPException
 from .config import Config
+from .log import get_logger
+from .metrics import external_call
+
+logger = get_logger(__name__)
 
 
 async def send_line_notification(user_id: str, message: str):
@@ -9,6 +12,8 @@ async def send_line_notification(user_id: str, message: str):
     # return
     """
     异步发送 LINE 通知
+    返回:
+        bool: 是否发送成功(失败只记录日志，不抛出异常)
     """
     url = "https://api.line.me/v2/bot/message/push"
     headers = {
@@ -23,10 +28,16 @@ async def send_line_notification(user_id: str, message: str):
         }]
     }
     
+    # httpx 导入较慢，只在实际发送时加载
+    import httpx
     try:
         async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=headers, json=data)
+            with external_call("line"):
+                response = await client.post(url, headers=headers, json=data)
             if response.status_code != 200:
-                print(f"LINE 通知發送失敗: {response.text}")
+                logger.error("LINE 通知發送失敗: %s", response.text)
+                return False
+            return True
     except Exception as e:
-        print(f"發送 LINE 通知時發生錯誤: {str(e)}")
+        logger.error("發送 LINE 通知時發生錯誤: %s", e)
+        return False
@@ -0,0 +1,103 @@
+"""
+日志设置
+
+所有模块通过 get_logger(__name__) 取得 logger，使用 %s 占位符延迟格式化，
+低于 LOG_LEVEL 的日志(如调度循环中的 debug 追踪)不会产生任何格式化或输出开销。
+长驻进程中日志记录先放入内存队列(QueueHandler)，由后台线程(QueueListener)
+写到 stdout，调用方不会因同步写 stdout 而阻塞事件循环。
+serverless(如 Vercel)在响应后可能冻结进程，队列中尚未写出的日志会丢失，
+因此以 queued=False 同步写 stdout。
+"""
+import atexit
+import json
+import logging
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+from .config import Config
+
+ROOT_LOGGER = "app"
+# LogRecord 自带的属性，其余属性视为 extra 传入的结构化字段
+_RECORD_ATTRS = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {
+    "message", "asctime"
+}
+
+_configured = False
+_listener: Optional[QueueListener] = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """取得 app 下的 logger(api.main 等模块也归入 app，共用同一设置)"""
+    if not name.startswith(ROOT_LOGGER + "."):
+        name = f"{ROOT_LOGGER}.{name}"
+    return logging.getLogger(name)
+
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    return {
+        key: value
+        for key, value in record.__dict__.items() if key not in _RECORD_ATTRS
+    }
+
+
+class TextFormatter(logging.Formatter):
+    """时间 级别 logger 消息 key=value ..."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}"
+                                   for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志一行 JSON，便于日志平台检索"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time":
+            datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_extra_fields(record)
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(queued: bool = True):
+    """
+    设置 app logger 的级别和输出，重复调用不会重复添加 handler
+    queued 为 False 时每条日志在调用线程中直接写出(适用于 serverless)
+    """
+    global _configured, _listener
+    if _configured:
+        return
+    _configured = True
+
+    if Config.LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = TextFormatter(
+            "%(asctime)s %(levelname)s %(name)s %(message)s")
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(Config.LOG_LEVEL)
+    logger.propagate = False
+    if not queued:
+        logger.addHandler(stream_handler)
+        return
+
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+    logger.addHandler(QueueHandler(log_queue))
@@ -0,0 +1,327 @@
+"""
+请求耗时与数据库查询统计
+
+MetricsMiddleware 记录每个路由的延迟分布，并通过 SQLAlchemy 事件统计请求期间的
+查询次数和耗时、通过 external_call() 统计调用 LINE / Cloudinary 的耗时。
+结果以 Prometheus 文本格式由 /metrics 输出，单个请求的耗时写入 Server-Timing 响应头。
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 与 prometheus_client 默认的延迟分桶一致(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0,
+                   2.5, 5.0, 7.5, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple = (), value: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter"
+        ]
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in sorted(values):
+            lines.append(
+                f"{self.name}{_format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Gauge:
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, labels: Tuple = ()):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} gauge"
+        ]
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in sorted(values):
+            lines.append(
+                f"{self.name}{_format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Histogram:
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [各分桶计数..., 总数, 总和]
+        self._values: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                counts[index] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram"
+        ]
+        with self._lock:
+            values = [(labels, list(counts))
+                      for labels, counts in self._values.items()]
+        for labels, counts in sorted(values):
+            names = self.labels + ("le", )
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket"
+                             f"{_format_labels(names, labels + (bound, ))} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_bucket"
+                         f"{_format_labels(names, labels + ('+Inf', ))} "
+                         f"{counts[-2]}")
+            label_text = _format_labels(self.labels, labels)
+            lines.append(f"{self.name}_count{label_text} {counts[-2]}")
+            lines.append(f"{self.name}_sum{label_text} {counts[-1]}")
+        return lines
+
+
+REQUEST_LABELS = ("method", "route")
+
+http_requests = Counter("http_requests_total", "HTTP requests",
+                        REQUEST_LABELS + ("status", ))
+http_request_duration = Histogram("http_request_duration_seconds",
+                                  "HTTP request latency", REQUEST_LABELS)
+http_request_db_queries = Counter("http_request_db_queries_total",
+                                  "Database queries issued by HTTP requests",
+                                  REQUEST_LABELS)
+http_request_db_seconds = Counter(
+    "http_request_db_seconds_total",
+    "Database time spent by HTTP requests", REQUEST_LABELS)
+db_queries = Counter("db_queries_total",
+                     "Database queries (requests and background workers)")
+db_query_duration = Histogram("db_query_duration_seconds",
+                              "Database query latency")
+external_call_duration = Histogram("external_call_duration_seconds",
+                                   "Outbound calls to LINE / Cloudinary",
+                                   ("service", "outcome"))
+
+# 通知调度器(TaskNotify)
+scheduler_tick_duration = Histogram("scheduler_tick_duration_seconds",
+                                    "Duration of one check_notifies pass")
+scheduler_last_tick = Gauge(
+    "scheduler_last_tick_timestamp_seconds",
+    "Unix time of the last check_notifies pass (alert when it stops moving)")
+scheduler_loaded_notifies = Gauge("scheduler_loaded_notifies",
+                                  "Notifies held in the scheduler")
+scheduler_fired = Counter("scheduler_fired_total", "Notifies fired")
+scheduler_fire_latency = Histogram(
+    "scheduler_fire_latency_seconds",
+    "Delay between a notify's due time and its LINE message being sent",
+    buckets=(1, 5, 15, 30, 60, 90, 120, 300, 600, 1800, 3600))
+scheduler_stage_duration = Histogram("scheduler_stage_duration_seconds",
+                                     "Time spent per notify in each stage",
+                                     ("stage", ))
+scheduler_failures = Counter("scheduler_failures_total",
+                             "Notify check / fire failures", ("reason", ))
+
+REGISTRY = [
+    http_requests, http_request_duration, http_request_db_queries,
+    http_request_db_seconds, db_queries, db_query_duration,
+    external_call_duration, scheduler_tick_duration, scheduler_last_tick,
+    scheduler_loaded_notifies, scheduler_fired, scheduler_fire_latency,
+    scheduler_stage_duration, scheduler_failures
+]
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    """单个请求期间累计的数据库与外部调用耗时"""
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.external: Dict[str, float] = {}
+
+
+# 同步路由在线程池中执行时 contextvars 会被复制，因此能取到同一个 RequestStats
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats",
+                                                          default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    context._metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    start = getattr(context, "_metrics_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    db_queries.inc()
+    db_query_duration.observe((), elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.db_queries += 1
+        stats.db_seconds += elapsed
+
+
+def instrument_engine(engine: Engine):
+    """在 engine 上注册查询计时事件"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def external_call(service: str):
+    """统计一次对外部服务(line、cloudinary)的调用耗时"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        elapsed = time.perf_counter() - start
+        external_call_duration.observe((service, outcome), elapsed)
+        stats = _current.get()
+        if stats is not None:
+            stats.external[service] = (stats.external.get(service, 0.0) +
+                                       elapsed)
+
+
+def server_timing(total: float, stats: RequestStats) -> str:
+    parts = [f"app;dur={total * 1000:.1f}"]
+    parts.append(f'db;dur={stats.db_seconds * 1000:.1f};'
+                 f'desc="{stats.db_queries} queries"')
+    for service, seconds in stats.external.items():
+        parts.append(f"{service};dur={seconds * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """
+    ASGI 中间件(不使用 BaseHTTPMiddleware，以免缓冲 SSE 等流式响应)
+    路由以路径模板(如 /items/{item_id})作为标签，未匹配的请求归为 unmatched
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Optional[Dict] = None
+
+    def _route_label(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._route_paths is None:
+            self._route_paths = {
+                route.endpoint: route.path
+                for route in scope["app"].routes
+                if hasattr(route, "endpoint")
+            }
+        return self._route_paths.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        status_code = 500
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, streaming
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                streaming = any(
+                    name == b"content-type"
+                    and value.startswith(b"text/event-stream")
+                    for name, value in headers)
+                headers.append(
+                    (b"server-timing",
+                     server_timing(time.perf_counter() - start,
+                                   stats).encode("latin-1")))
+                message = {**message, "headers": headers}
+                if streaming:
+                    # SSE 连接会持续数小时，只记录到开始响应为止的耗时
+                    self._observe(scope, status_code, start, stats)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            if not streaming:
+                self._observe(scope, status_code, start, stats)
+
+    def _observe(self, scope, status_code: int, start: float,
+                 stats: RequestStats):
+        labels = (scope["method"], self._route_label(scope))
+        http_requests.inc(labels + (str(status_code), ))
+        http_request_duration.observe(labels, time.perf_counter() - start)
+        http_request_db_queries.inc(labels, stats.db_queries)
+        http_request_db_seconds.inc(labels, stats.db_seconds)
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Time
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Time, Index, DDL, event
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, literal_column, text
 from .database import Base
 
 
@@ -23,6 +23,74 @@ class User(Base):
     task_progresses = relationship("TaskProgress", back_populates="user")
 
 
+# 全文检索
+# 内容以中文为主，词与词之间没有空格，按词分词时整句会成为一个词，
+# 因此按三字组(trigram)建立索引，可检索文本中任意位置的子字符串
+TRIGRAM_MIN_LENGTH = 3
+
+# Postgres 的三字组索引需要 pg_trgm 扩展，建表前启用
+event.listen(
+    Base.metadata, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(
+        dialect="postgresql"))
+
+
+def search_document(*columns):
+    """
+    检索文档(多列以空格拼接)
+    Postgres 查询时必须与索引表达式完全一致才能命中索引
+    """
+    document = columns[0]
+    for col in columns[1:]:
+        document = document + literal_column("' '") + col
+    return document
+
+
+def search_index(name: str, *columns) -> Index:
+    """Postgres pg_trgm GIN 表达式索引(其他数据库不创建)"""
+    return Index(name,
+                 search_document(*columns).label("document"),
+                 postgresql_using="gin",
+                 postgresql_ops={
+                     "document": "gin_trgm_ops"
+                 }).ddl_if(dialect="postgresql")
+
+
+def fts_table_name(table_name: str) -> str:
+    return f"{table_name}_fts"
+
+
+def enable_sqlite_fts(table, *column_names: str):
+    """
+    SQLite(本地测试)的全文检索: 随表创建 trigram 分词的 FTS5 外部内容表，
+    由触发器保持同步
+    """
+    fts = fts_table_name(table.name)
+    cols = ", ".join(column_names)
+    new_values = ", ".join(f"new.{c}" for c in column_names)
+    old_values = ", ".join(f"old.{c}" for c in column_names)
+    statements = [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{cols}, content='{table.name}', content_rowid='id', "
+        f"tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table.name} "
+        f"BEGIN INSERT INTO {fts}(rowid, {cols}) "
+        f"VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table.name} "
+        f"BEGIN INSERT INTO {fts}({fts}, rowid, {cols}) "
+        f"VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} "
+        f"ON {table.name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) "
+        f"VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {cols}) "
+        f"VALUES (new.id, {new_values}); END",
+    ]
+    for statement in statements:
+        event.listen(table, "after_create",
+                     DDL(statement).execute_if(dialect="sqlite"))
+
+
 class Message(Base):
     __tablename__ = "messages"
 
@@ -34,6 +102,17 @@ class Message(Base):
 
     user = relationship("User", back_populates="messages")
 
+    __table_args__ = (
+        # GET /messages/ 按时间倒序分页
+        Index("ix_messages_created_at_id", "created_at", "id"),
+        # 按作者检索、批量删除
+        Index("ix_messages_user_id_created_at", "user_id", "created_at"),
+        search_index("ix_messages_content_trgm", content),
+    )
+
+
+enable_sqlite_fts(Message.__table__, "content")
+
 
 class DisplayName(Base):
     __tablename__ = "displaynames"
@@ -60,6 +139,12 @@ class LoginRecord(Base):
 
     user = relationship("User", back_populates="login_records")
 
+    __table_args__ = (
+        # 登录记录按时间倒序分页
+        Index("ix_login_records_login_datetime_id", "login_datetime", "id"),
+        Index("ix_login_records_user_id", "user_id"),
+    )
+
 
 # 工作分类模型
 class TaskCategory(Base):
@@ -80,6 +165,14 @@ class TaskCategory(Base):
                          back_populates="category",
                          cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_task_categories_user_id", "user_id"),
+        search_index("ix_task_categories_trgm", category_name, content),
+    )
+
+
+enable_sqlite_fts(TaskCategory.__table__, "category_name", "content")
+
 
 # 工作分类-项目模型
 class TaskItem(Base):
@@ -106,6 +199,16 @@ class TaskItem(Base):
                               back_populates="item",
                               cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_task_items_user_id", "user_id"),
+        # 删除分类时连带删除项目
+        Index("ix_task_items_category_id", "category_id"),
+        search_index("ix_task_items_trgm", item_name, content),
+    )
+
+
+enable_sqlite_fts(TaskItem.__table__, "item_name", "content")
+
 
 # 工作分类-项目-进度模型
 class TaskProgress(Base):
@@ -129,6 +232,21 @@ class TaskProgress(Base):
     # 建立与项目的关系
     item = relationship("TaskItem", back_populates="progresses")
 
+    __table_args__ = (
+        Index("ix_task_progresses_user_id", "user_id"),
+        # 删除项目时连带删除进度
+        Index("ix_task_progresses_item_id", "item_id"),
+        search_index("ix_task_progresses_trgm", progress_name, content),
+    )
+
+
+enable_sqlite_fts(TaskProgress.__table__, "progress_name", "content")
+
+
+# 调度器加载的通知: 未执行过的单次通知，以及重复通知(再按 stop_at 过滤)
+NOTIFY_ONCE_PENDING_SQL = "run_mode = 0 AND last_executed IS NULL"
+NOTIFY_REPEATING_SQL = "run_mode IN (1, 2)"
+
 
 class TaskNotify(Base):
     __tablename__ = "task_notifies"
@@ -163,3 +281,123 @@ class TaskNotify(Base):
     item = relationship("TaskItem")
     # 建立与进度的关系
     progress = relationship("TaskProgress")
+
+    __table_args__ = (
+        # 调度器加载条件的部分索引，条件需与 crud.scheduler_notifies_query 一致
+        Index("ix_task_notifies_once_pending",
+              "id",
+              postgresql_where=text(NOTIFY_ONCE_PENDING_SQL),
+              sqlite_where=text(NOTIFY_ONCE_PENDING_SQL)),
+        Index("ix_task_notifies_repeat_stop_at",
+              "stop_at",
+              postgresql_where=text(NOTIFY_REPEATING_SQL),
+              sqlite_where=text(NOTIFY_REPEATING_SQL)),
+        Index("ix_task_notifies_user_id", "user_id"),
+        # 删除分类、项目、进度时连带删除通知
+        Index("ix_task_notifies_category_id", "category_id"),
+        Index("ix_task_notifies_item_id", "item_id"),
+        Index("ix_task_notifies_progress_id", "progress_id"),
+    )
+
+
+# 任务数据变更日志(供 /tasks/all?since= 增量同步使用)
+class TaskChange(Base):
+    __tablename__ = "task_changes"
+    __table_args__ = (Index("ix_task_changes_user_id_id", "user_id", "id"), )
+
+    # 自增 id 即同步版本号
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer,
+                     ForeignKey("users.id", ondelete="CASCADE"),
+                     nullable=False)
+    # category / item / progress / notify
+    entity = Column(String(20), nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    # upsert / delete
+    op = Column(String(10), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# 数据版本计数器(用于 ETag / 条件 GET)，scope 如 "messages"
+class SyncVersion(Base):
+    __tablename__ = "sync_versions"
+
+    scope = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, server_default='0')
+
+
+# 延迟上传的留言图片(留言先写入，图片由后台 ImageUploadWorker 上传)
+class PendingImageUpload(Base):
+    __tablename__ = "pending_image_uploads"
+
+    id = Column(Integer, primary_key=True, index=True)
+    message_id = Column(Integer,
+                        ForeignKey("messages.id", ondelete="CASCADE"),
+                        unique=True,
+                        nullable=False)
+    # 暂存在本地磁盘的图片文件路径
+    file_path = Column(String(500), nullable=False)
+    # 预处理完成后实际上传的文件(未预处理时与 file_path 相同)，
+    # 重试或重启恢复时直接上传，不再重复预处理
+    processed_path = Column(String(500))
+    filename = Column(String(255))
+    # 原始图片内容的 SHA-256，上传后登记到 image_assets
+    digest = Column(String(64))
+    # pending / failed
+    status = Column(String(10), nullable=False, server_default='pending')
+    attempts = Column(Integer, nullable=False, server_default='0')
+    last_error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# 已上传的图片资源(按内容摘要去重，ref_count 为引用该图片的留言数)
+class ImageAsset(Base):
+    __tablename__ = "image_assets"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # 原始上传内容的 SHA-256
+    digest = Column(String(64), unique=True, nullable=False)
+    secure_url = Column(String(255), unique=True, nullable=False)
+    public_id = Column(String(255), nullable=False)
+    ref_count = Column(Integer, nullable=False, server_default='1')
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# 待从 Cloudinary 删除的图片(留言删除时写入，由后台批量删除)
+class PendingImageDeletion(Base):
+    __tablename__ = "pending_image_deletions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    public_id = Column(String(255), nullable=False)
+    attempts = Column(Integer, nullable=False, server_default='0')
+    last_error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# 归档表: 由 app/retention.py 从原表分批移入，不设外键(用户删除后仍保留)
+class ArchivedTaskNotify(Base):
+    __tablename__ = "task_notifies_archive"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    category_id = Column(Integer, nullable=False)
+    item_id = Column(Integer, nullable=False)
+    progress_id = Column(Integer, nullable=False)
+    start_at = Column(DateTime(timezone=True))
+    stop_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True))
+    run_mode = Column(Integer, nullable=False)
+    run_code = Column(Integer, nullable=False)
+    time_at = Column(Time)
+    week_at = Column(Integer)
+    last_executed = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ArchivedLoginRecord(Base):
+    __tablename__ = "login_records_archive"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    login_datetime = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
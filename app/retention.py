@@ -0,0 +1,192 @@
+"""
+过期数据归档
+已执行的单次通知、已过停止时间的重复通知、旧的登录记录会一直留在原表中，
+使热点查询的索引不断膨胀。本模块按 Config 中的保留天数把这些行分批移入归档表，
+旧的任务变更记录(增量同步用)则直接删除；每批一个短事务，避免长时间锁表。
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import and_, delete, exists, insert, or_, select
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm import Session
+from . import crud, models
+from .config import Config
+from .database import SessionLocal
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+
+def _move_rows(db: Session, source, archive, ids: List[int]):
+    """把 ids 对应的行复制到归档表后从原表删除(不提交)"""
+    columns = [archive.__table__.c[c.name] for c in source.__table__.columns]
+    db.execute(
+        insert(archive).from_select(
+            columns,
+            select(*source.__table__.columns).where(source.id.in_(ids))))
+    db.execute(delete(source).where(source.id.in_(ids)))
+
+
+def archive_expired_notifies(db: Session, cutoff: datetime,
+                             batch_size: int) -> int:
+    """
+    归档在 cutoff 之前已执行的单次通知和已停止的重复通知
+    按 id 递增分批处理，每批提交一次
+    返回:
+        int: 移动的行数
+    """
+    notify = models.TaskNotify
+    expired = or_(
+        and_(notify.run_mode == 0, notify.last_executed < cutoff),
+        and_(notify.run_mode.in_([1, 2]), notify.stop_at < cutoff))
+    moved = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(notify.user_id, notify.id).where(
+                notify.id > last_id,
+                expired).order_by(notify.id).limit(batch_size)).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        ids = [row.id for row in rows]
+        try:
+            # 记录删除，客户端增量同步时移除这些通知
+            crud.record_notify_changes(db, rows, crud.TASK_CHANGE_DELETE)
+            _move_rows(db, notify, models.ArchivedTaskNotify, ids)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        moved += len(ids)
+    return moved
+
+
+def archive_login_records(db: Session, cutoff: datetime,
+                          batch_size: int) -> int:
+    """
+    归档 cutoff 之前的登录记录，沿 (login_datetime, id) 索引分批处理
+    返回:
+        int: 移动的行数
+    """
+    record = models.LoginRecord
+    moved = 0
+    while True:
+        ids = db.execute(
+            select(record.id).where(record.login_datetime < cutoff).order_by(
+                record.login_datetime, record.id).limit(batch_size)).scalars(
+                ).all()
+        if not ids:
+            break
+        try:
+            _move_rows(db, record, models.ArchivedLoginRecord, ids)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        moved += len(ids)
+    return moved
+
+
+def prune_task_changes(db: Session, cutoff: datetime, batch_size: int) -> int:
+    """
+    删除 cutoff 之前的任务变更记录，每个用户保留最新的一条，使版本号不变
+    已删除的最大 id 记入 TASK_CHANGES_PRUNED_SCOPE，since 更早的客户端改为全量同步
+    返回:
+        int: 删除的行数
+    """
+    change = models.TaskChange
+    newer = aliased(models.TaskChange)
+    has_newer = exists().where(newer.user_id == change.user_id,
+                               newer.id > change.id)
+    deleted = 0
+    last_id = 0
+    while True:
+        ids = db.execute(
+            select(change.id).where(change.id > last_id,
+                                    change.created_at < cutoff,
+                                    has_newer).order_by(
+                                        change.id).limit(batch_size)).scalars(
+                                        ).all()
+        if not ids:
+            break
+        last_id = ids[-1]
+        try:
+            crud.raise_sync_version(db, crud.TASK_CHANGES_PRUNED_SCOPE,
+                                    last_id)
+            db.execute(delete(change).where(change.id.in_(ids)))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        deleted += len(ids)
+    return deleted
+
+
+def run_retention(now: Optional[datetime] = None,
+                  batch_size: int = None) -> Dict[str, int]:
+    """
+    按保留策略执行一次归档(同步执行)
+    返回:
+        dict: 各表本次移动(或删除)的行数，未启用的策略不出现在结果中
+    """
+    now = now or datetime.now(timezone.utc)
+    batch_size = batch_size or Config.RETENTION_BATCH_SIZE
+    policies = [
+        ("task_notifies", Config.RETENTION_NOTIFY_DAYS,
+         archive_expired_notifies),
+        ("login_records", Config.RETENTION_LOGIN_RECORD_DAYS,
+         archive_login_records),
+        ("task_changes", Config.RETENTION_TASK_CHANGE_DAYS,
+         prune_task_changes),
+    ]
+    report = {}
+    db = SessionLocal()
+    try:
+        for table, days, archive in policies:
+            if days <= 0:
+                continue
+            try:
+                report[table] = archive(db, now - timedelta(days=days),
+                                        batch_size)
+            except Exception as e:
+                logger.error("归档 %s 失败: %s", table, e)
+    finally:
+        db.close()
+    return report
+
+
+class RetentionWorker:
+    """定时执行数据归档"""
+
+    def __init__(self, interval: int = None):
+        self.interval = interval or Config.RETENTION_INTERVAL
+        self.last_run: Optional[datetime] = None
+        self.last_report: Dict[str, int] = {}
+        self._stop_event = asyncio.Event()
+        self._running = False
+
+    async def run_once(self) -> Dict[str, int]:
+        """在线程中执行一次归档，记录并返回结果"""
+        report = await asyncio.to_thread(run_retention)
+        self.last_run = datetime.now(timezone.utc)
+        self.last_report = report
+        if any(report.values()):
+            logger.info("数据归档完成: %s", report)
+        return report
+
+    async def start(self):
+        """启动归档循环"""
+        self._running = True
+        while self._running:
+            await self.run_once()
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self):
+        """停止归档循环"""
+        self._running = False
+        self._stop_event.set()
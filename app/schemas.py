@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime, time
 
 
@@ -46,11 +46,27 @@ class Message(MessageBase):
     user_id: int
     display_name: str
     is_admin: bool
+    # 延迟上传的图片状态: pending / failed，已完成或无图片时为 None
+    image_status: Optional[str] = None
 
     class Config:
         from_attributes = True
 
 
+class MessageSearchResult(BaseModel):
+    items: List[Message]
+    # 下一页游标，没有更多结果时为 None
+    next_cursor: Optional[str] = None
+
+
+class MessageBulkDelete(BaseModel):
+    """批量删除留言的条件(各条件之间为 AND，至少需要一个)"""
+    message_ids: Optional[List[int]] = None
+    user_id: Optional[int] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+
+
 # 工作分类相关模式
 class TaskCategoryBase(BaseModel):
     category_name: str
@@ -148,6 +164,16 @@ class TaskProgressUpdate(BaseModel):
     status: Optional[int] = None
 
 
+class TaskItemBatchUpdate(TaskItemUpdate):
+    """批量更新任务项目时的单项数据"""
+    id: int
+
+
+class TaskProgressBatchUpdate(TaskProgressUpdate):
+    """批量更新任务进度时的单项数据"""
+    id: int
+
+
 class TaskNotifyBase(BaseModel):
     category_id: int
     item_id: int
@@ -193,3 +219,18 @@ class TaskNotify(TaskNotifyBase):
 
     class Config:
         from_attributes = True
+
+
+class TaskSearchNode(BaseModel):
+    id: int
+    name: str
+
+
+class TaskSearchResult(BaseModel):
+    """任务树检索结果，附带 分类 -> 项目 -> 进度 路径"""
+    entity: str  # category / item / progress
+    id: int
+    score: float
+    category: TaskSearchNode
+    item: Optional[TaskSearchNode] = None
+    progress: Optional[TaskSearchNode] = None
@@ -0,0 +1,286 @@
+"""
+用户任务树(分类、项目、进度、通知)的导出与导入
+
+导出格式为 NDJSON: 第一行是 header，之后按 分类 -> 项目 -> 进度 -> 通知
+的顺序每行一条数据，{"type": 实体, "id": 原 id, ...}。
+导入时在同一事务中分批写入，并把上级 id 重新对应到新建的行。
+"""
+import asyncio
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import DateTime, Time, insert, select
+from sqlalchemy.orm import Session
+from . import crud, models
+from .database import SessionLocal
+
+ARCHIVE_FORMAT = "board-task-tree"
+ARCHIVE_VERSION = 1
+BATCH_SIZE = 1000
+
+# 导入时需重新对应的上级 id 列: 实体 -> {列名: 上级实体}
+PARENT_KEYS = {
+    "category": {},
+    "item": {
+        "category_id": "category"
+    },
+    "progress": {
+        "item_id": "item"
+    },
+    "notify": {
+        "category_id": "category",
+        "item_id": "item",
+        "progress_id": "progress"
+    },
+}
+
+
+def _export_columns(model):
+    return [c for c in model.__table__.columns if c.name != "user_id"]
+
+
+def iter_task_tree(db: Session, user_id: int, batch_size: int = BATCH_SIZE):
+    """
+    逐行产生用户任务树的导出记录(服务端游标)，内存占用与数据量无关
+    """
+    yield {
+        "type": "header",
+        "format": ARCHIVE_FORMAT,
+        "version": ARCHIVE_VERSION
+    }
+    for entity, (model, _) in crud.TASK_ENTITIES.items():
+        result = db.execute(select(*_export_columns(model)).where(
+            model.user_id == user_id).order_by(model.id),
+                            execution_options={"yield_per": batch_size})
+        for row in result.mappings():
+            yield {"type": entity, **row}
+
+
+def _value_parser(column):
+    """JSON 中的日期时间是 ISO 字符串，写入前转回 Python 对象"""
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat
+    if isinstance(column.type, Time):
+        return time.fromisoformat
+    return None
+
+
+class IdMap:
+    """
+    原 id -> 新 id 对照表
+    导出数据按 id 递增排列，以两个整数数组加二分查找保存，每行只占 16 字节
+    """
+
+    def __init__(self):
+        self._old = array("q")
+        self._new = array("q")
+
+    def extend(self, old_ids: List[int], new_ids: List[int]):
+        for old_id, new_id in zip(old_ids, new_ids):
+            if self._old and old_id <= self._old[-1]:
+                raise ValueError(f"Ids must be ascending, got {old_id} "
+                                 f"after {self._old[-1]}")
+            self._old.append(old_id)
+            self._new.append(new_id)
+
+    def get(self, old_id) -> Optional[int]:
+        if not isinstance(old_id, int):
+            return None
+        index = bisect_left(self._old, old_id)
+        if index < len(self._old) and self._old[index] == old_id:
+            return self._new[index]
+        return None
+
+
+class TaskTreeImporter:
+    """
+    逐行导入任务树，每种实体缓冲 batch_size 行后以一条 INSERT ... RETURNING
+    写入，全部完成后由 finish() 一次提交
+
+    子数据写入前会先写入所有缓冲中的上级数据，因此只要输入按导出顺序
+    (上级在前、同类按 id 递增)即可正确对应 id。
+    内存占用为缓冲区加上分类、项目、进度的 id 对照表(每行 16 字节)。
+    """
+
+    def __init__(self,
+                 db: Session,
+                 user_id: int,
+                 batch_size: int = BATCH_SIZE):
+        self.db = db
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self._header_seen = False
+        self._buffers: Dict[str, List[Dict]] = {
+            entity: []
+            for entity in crud.TASK_ENTITIES
+        }
+        # 只有被引用的上级实体需要对照表
+        self._id_maps: Dict[str, IdMap] = {
+            parent: IdMap()
+            for keys in PARENT_KEYS.values()
+            for parent in keys.values()
+        }
+        self.counts: Dict[str, int] = {
+            key: 0
+            for _, key in crud.TASK_ENTITIES.values()
+        }
+        # 新建通知的 id，提交后交给通知调度器
+        self.notify_ids: List[int] = []
+        self._columns = {}
+        for entity, (model, _) in crud.TASK_ENTITIES.items():
+            self._columns[entity] = {
+                c.name: _value_parser(c)
+                for c in _export_columns(model) if c.name != "id"
+            }
+
+    def add(self, record: Dict):
+        """加入一条导出记录，缓冲区满时写入数据库"""
+        record_type = record.get("type")
+        if not self._header_seen:
+            if (record_type != "header"
+                    or record.get("format") != ARCHIVE_FORMAT
+                    or record.get("version") != ARCHIVE_VERSION):
+                raise ValueError("Unsupported archive header")
+            self._header_seen = True
+            return
+
+        if record_type not in self._buffers:
+            raise ValueError(f"Unknown record type: {record_type}")
+        if "id" not in record:
+            raise ValueError(f"Missing id in {record_type} record")
+
+        row = {"id": record["id"]}
+        for name, parse in self._columns[record_type].items():
+            value = record.get(name)
+            if value is not None and parse is not None:
+                value = parse(value)
+            if value is not None:
+                row[name] = value
+        buffer = self._buffers[record_type]
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush()
+
+    def add_many(self, records: Iterable[Dict]):
+        for record in records:
+            self.add(record)
+
+    def flush(self):
+        """按 上级 -> 下级 的顺序写入所有缓冲中的数据"""
+        for entity in crud.TASK_ENTITIES:
+            if self._buffers[entity]:
+                self._write(entity, self._buffers[entity])
+                self._buffers[entity] = []
+
+    def _write(self, entity: str, rows: List[Dict]):
+        model, key = crud.TASK_ENTITIES[entity]
+        old_ids = []
+        params = []
+        for row in rows:
+            old_ids.append(row.pop("id"))
+            for column, parent in PARENT_KEYS[entity].items():
+                new_id = self._id_maps[parent].get(row.get(column))
+                if new_id is None:
+                    raise ValueError(f"{entity} {old_ids[-1]} refers to "
+                                     f"unknown {parent} {row.get(column)}")
+                row[column] = new_id
+            row["user_id"] = self.user_id
+            params.append(row)
+
+        # 缺少的列使用 server_default，按列集合分组写入
+        new_ids = [None] * len(params)
+        groups: Dict[tuple, List[int]] = {}
+        for index, row in enumerate(params):
+            groups.setdefault(tuple(sorted(row)), []).append(index)
+        for indexes in groups.values():
+            ids = self.db.execute(
+                insert(model).returning(model.id,
+                                        sort_by_parameter_order=True),
+                [params[i] for i in indexes]).scalars().all()
+            for i, new_id in zip(indexes, ids):
+                new_ids[i] = new_id
+
+        if entity in self._id_maps:
+            self._id_maps[entity].extend(old_ids, new_ids)
+        if entity == "notify":
+            self.notify_ids.extend(new_ids)
+        crud.record_task_changes(self.db, self.user_id, entity, new_ids)
+        self.counts[key] += len(new_ids)
+
+    def finish(self) -> Dict[str, int]:
+        """写入剩余数据并提交，返回各实体导入的行数"""
+        if not self._header_seen:
+            raise ValueError("Empty archive")
+        self.flush()
+        self.db.commit()
+        return self.counts
+
+    def abort(self):
+        self.db.rollback()
+
+    def imported_notifies(self) -> List[Dict]:
+        """已导入的通知(连同用户名)，格式与调度器加载的通知相同"""
+        columns = [*models.TaskNotify.__table__.columns, models.User.username]
+        notifies = []
+        for start in range(0, len(self.notify_ids), self.batch_size):
+            ids = self.notify_ids[start:start + self.batch_size]
+            result = self.db.execute(
+                select(*columns).join(
+                    models.User,
+                    models.TaskNotify.user_id == models.User.id).where(
+                        models.TaskNotify.id.in_(ids)).order_by(
+                            models.TaskNotify.id))
+            notifies.extend(dict(row) for row in result.mappings())
+        return notifies
+
+
+class ThreadedTaskTreeImporter:
+    """
+    在专用线程中运行 TaskTreeImporter，不阻塞事件循环
+    Session 不是线程安全的，建立、写入、提交和关闭都在同一个线程中执行
+    """
+
+    def __init__(self, user_id: int, batch_size: int = BATCH_SIZE):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self._executor = ThreadPoolExecutor(max_workers=1,
+                                            thread_name_prefix="task-import")
+        self._importer: Optional[TaskTreeImporter] = None
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _open(self) -> TaskTreeImporter:
+        return TaskTreeImporter(SessionLocal(), self.user_id, self.batch_size)
+
+    def _close(self):
+        if self._importer:
+            self._importer.db.close()
+
+    async def __aenter__(self):
+        self._importer = await self._run(self._open)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        try:
+            await self._run(self._close)
+        finally:
+            self._executor.shutdown(wait=False)
+
+    async def add(self, record: Dict):
+        await self._run(self._importer.add, record)
+
+    async def add_many(self, records: Iterable[Dict]):
+        await self._run(self._importer.add_many, records)
+
+    async def finish(self) -> Dict[str, int]:
+        return await self._run(self._importer.finish)
+
+    async def abort(self):
+        await self._run(self._importer.abort)
+
+    async def imported_notifies(self) -> List[Dict]:
+        return await self._run(self._importer.imported_notifies)
@@ -1,13 +1,103 @@
 import asyncio
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
 from datetime import datetime, time, timezone, timedelta
 from typing import List, Dict, Optional
 from sqlalchemy.orm import Session
-from . import models
+from . import metrics, models, crud
 from .line_service import send_line_notification
 from app.config import Config
 import re
 import pytz
 from .connections import connections
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+
+class SchedulerStats:
+    """
+    调度器运行统计：每次检查的耗时、通知实际发送时间与预定时间的延迟、
+    各阶段耗时和失败原因。同时写入 /metrics，摘要由 /admin/get-notify-list/ 返回
+    """
+    RECENT = 200  # 计算延迟摘要时保留的最近发送次数
+
+    def __init__(self):
+        self.ticks = 0
+        self.last_tick_at: Optional[datetime] = None
+        self.last_tick_seconds = 0.0
+        self.max_tick_seconds = 0.0
+        self.loaded = 0
+        self.fired = 0
+        self.failures: Dict[str, int] = {}
+        self.stage_seconds: Dict[str, float] = {}
+        self._latencies = deque(maxlen=self.RECENT)
+
+    def record_tick(self, started_at: datetime, seconds: float, loaded: int):
+        self.ticks += 1
+        self.last_tick_at = started_at
+        self.last_tick_seconds = seconds
+        self.max_tick_seconds = max(self.max_tick_seconds, seconds)
+        self.loaded = loaded
+        metrics.scheduler_tick_duration.observe((), seconds)
+        metrics.scheduler_last_tick.set(started_at.timestamp())
+        metrics.scheduler_loaded_notifies.set(loaded)
+
+    def record_loaded(self, loaded: int):
+        self.loaded = loaded
+        metrics.scheduler_loaded_notifies.set(loaded)
+
+    def record_fire(self, due_at: datetime, fired_at: datetime):
+        latency = max((fired_at - due_at).total_seconds(), 0.0)
+        self.fired += 1
+        self._latencies.append(latency)
+        metrics.scheduler_fired.inc()
+        metrics.scheduler_fire_latency.observe((), latency)
+
+    def record_failure(self, reason: str):
+        self.failures[reason] = self.failures.get(reason, 0) + 1
+        metrics.scheduler_failures.inc((reason, ))
+
+    @contextmanager
+    def stage(self, name: str):
+        """统计一个阶段(resolve、line、db_update、sse)的耗时"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            self.stage_seconds[name] = (self.stage_seconds.get(name, 0.0) +
+                                        elapsed)
+            metrics.scheduler_stage_duration.observe((name, ), elapsed)
+
+    def summary(self) -> Dict:
+        latencies = sorted(self._latencies)
+        latency = None
+        if latencies:
+            latency = {
+                "count": len(latencies),
+                "avg": round(sum(latencies) / len(latencies), 3),
+                "p95": round(
+                    latencies[min(len(latencies) - 1,
+                                  int(len(latencies) * 0.95))], 3),
+                "max": round(latencies[-1], 3),
+            }
+        return {
+            "ticks": self.ticks,
+            "last_tick_at":
+            self.last_tick_at.isoformat() if self.last_tick_at else None,
+            "last_tick_seconds": round(self.last_tick_seconds, 4),
+            "max_tick_seconds": round(self.max_tick_seconds, 4),
+            "loaded": self.loaded,
+            "fired": self.fired,
+            "fire_latency_seconds": latency,
+            "stage_seconds": {
+                name: round(seconds, 4)
+                for name, seconds in self.stage_seconds.items()
+            },
+            "failures": dict(self.failures),
+        }
 
 
 class TaskNotify:
@@ -26,7 +116,7 @@ class TaskNotify:
         try:
             local_tz = pytz.timezone(Config.TIMEZONE)
         except pytz.UnknownTimeZoneError:
-            print(f"未知的时区: {Config.TIMEZONE}，使用 Asia/Taipei")
+            logger.warning("未知的时区: %s，使用 Asia/Taipei", Config.TIMEZONE)
             local_tz = pytz.timezone('Asia/Taipei')
 
         # 获取当前本地日期
@@ -48,7 +138,7 @@ class TaskNotify:
         try:
             local_tz = pytz.timezone(Config.TIMEZONE)
         except pytz.UnknownTimeZoneError:
-            print(f"未知的时区: {Config.TIMEZONE}，使用 Asia/Taipei")
+            logger.warning("未知的时区: %s，使用 Asia/Taipei", Config.TIMEZONE)
             local_tz = pytz.timezone('Asia/Taipei')
         now = datetime.now(local_tz)
         return now.time(), now.weekday() + 1  # weekday()返回0-6，加1转换为1-7
@@ -77,6 +167,8 @@ class TaskNotify:
         self.db = db
         self.notifies: List[Dict] = []  # 存储通知记录的列表
         self._running = False  # 运行状态标志
+        self.last_check_at: Optional[datetime] = None  # 上次检查的时间
+        self.stats = SchedulerStats()
 
     def should_execute_notify(self, notify: Dict, now: datetime,
                               current_time: time, current_week: int) -> bool:
@@ -94,31 +186,25 @@ class TaskNotify:
         """
         try:
             utc_time_at = self.local_time_to_utc(notify['time_at'])
-            print(f"\n检查通知 ID: {notify['id']}")
+            # 每个通知每次检查都会经过这里，只在 DEBUG 级别输出
+            logger.debug(
+                "检查通知 ID: %s run_mode: %s 当前时间: %s 开始时间: %s "
+                "停止时间: %s 執行時間: %s 開始星期: %s 当前星期: %s", notify['id'],
+                notify['run_mode'], now, notify['start_at'], notify['stop_at'],
+                notify['time_at'], notify['week_at'], current_week)
 
             # 单次执行模式
             if notify['run_mode'] == 0:
-                print(f"通知 ID: {notify['id']} run_mode 为 0")
-                print(f"当前时间: {now}")
-                print(f"开始时间: {notify['start_at']}")
-                print(f"时间比较: {now >= notify['start_at']}")
                 return now >= notify['start_at']
 
             # 检查是否超过停止时间
             if now >= notify['stop_at']:
-                print(f"通知 ID: {notify['id']} run_mode 为 1 或 2")
-                print(f"通知 ID: {notify['id']} 已超过停止时间")
+                logger.debug("通知 ID: %s 已超过停止时间，移除", notify['id'])
                 self.notifies.remove(notify)
                 return False
 
             # 重复执行模式 - 每天
             if notify['run_mode'] == 1:
-                print(f"通知 ID: {notify['id']} run_mode 为 1")
-                print(f"通知 ID: {notify['id']} 未过停止时间，继续检查")
-                print(f"当前时间: {now}")
-                print(f"开始时间: {notify['start_at']}")
-                print(f"时间比较: {now >= notify['start_at']}")
-                print(f"執行時間: {notify['time_at']}")
                 return (now >= notify['start_at']
                         and utc_time_at >= notify['start_at']
                         and current_time >= notify['time_at']
@@ -127,17 +213,6 @@ class TaskNotify:
 
             # 重复执行模式 - 每周
             if notify['run_mode'] == 2:
-                print(f"通知 ID: {notify['id']} run_mode 为 2")
-                print(f"通知 ID: {notify['id']} 未过停止时间，继续检查")
-                print(f"当前星期: {current_week}")
-                print(f"開始星期: {notify['week_at']}")
-                print(
-                    f"星期比较: {current_week in [int(d) for d in str(notify['week_at'])]}"
-                )
-                print(f"当前时间: {now}")
-                print(f"开始时间: {notify['start_at']}")
-                print(f"时间比较: {now >= notify['start_at']}")
-                print(f"執行時間: {notify['time_at']}")
                 return (now >= notify['start_at']
                         and utc_time_at >= notify['start_at'] and current_week
                         in [int(d) for d in str(notify['week_at'])]
@@ -147,7 +222,8 @@ class TaskNotify:
 
             return False
         except Exception as e:
-            print(f"检查通知 {notify['id']} 时出错: {str(e)}")
+            logger.error("检查通知 %s 时出错: %s", notify['id'], e)
+            self.stats.record_failure("check_error")
             return False
 
     def should_load_notify(self, notify: Dict) -> bool:
@@ -190,9 +266,8 @@ class TaskNotify:
 
     async def load_notifies(self):
         """加载符合条件的通知记录"""
-        print("\n=== 开始加载通知 ===")
         now = datetime.now(self.TIMEZONE)
-        print(f"当前时间: {now}")
+        logger.info("开始加载通知，当前时间: %s", now)
 
         #########################################################################
         # 批次定時加載時專用(系統仍需定時執行load_notifies)
@@ -215,33 +290,24 @@ class TaskNotify:
         #         & (models.TaskNotify.stop_at > early_time)).all()
         #########################################################################
         # 一次性加載模式：加載未執行過的通知
-        notifies = (self.db.query(
-            models.TaskNotify, models.User.username).join(
-                models.User,
-                models.TaskNotify.user_id == models.User.id).filter(
-                    ((models.TaskNotify.run_mode == 0)
-                     & (models.TaskNotify.last_executed.is_(None)))
-                    | ((models.TaskNotify.run_mode.in_([1, 2]))
-                       & (models.TaskNotify.stop_at > now))).all())
-
-        # 转换为字典格式并添加username字段
-        self.notifies = []
-        for notify, username in notifies:
-            notify_dict = notify.__dict__.copy()
-            notify_dict['username'] = username
-            self.notifies.append(notify_dict)
+        # 两个加载条件各自命中部分索引，逐批读取为字典(含 username)，
+        # 读取完成后再替换列表，不影响检查循环中正在使用的列表
+        self.notifies = list(crud.iter_scheduler_notifies(self.db, now))
+        self.stats.record_loaded(len(self.notifies))
+        logger.info("已加载 %s 个通知", len(self.notifies))
 
     async def check_notifies(self):
         """检查并执行通知"""
         now = datetime.now(self.TIMEZONE)
+        self.last_check_at = now
+        tick_start = perf_counter()
         # current_time = now.time()
         # current_week = now.weekday() + 1  # 转换为 1-7 (Monday to Sunday)
         current_time, current_week = self.get_local_time()
 
-        print(
-            f"\n=== 开始检查通知 ({now}) current_time ({current_time} current_week {current_week}) ==="
-        )
-        print(f"当前通知数量: {len(self.notifies)}")
+        logger.debug("开始检查通知 (%s) current_time (%s current_week %s)，"
+                     "当前通知数量: %s", now, current_time, current_week,
+                     len(self.notifies))
 
         for notify in self.notifies[:]:  # 创建副本以便安全删除
             try:
@@ -312,39 +378,58 @@ class TaskNotify:
                 #          or now.date() > notify['last_executed'].date())):
                 #         should_execute = True
 
-                print(f"当前通知数量: {len(self.notifies)}")
                 if should_execute:
-                    print(f"通知 ID: {notify['id']} 符合执行条件，执行通知")
+                    logger.info("通知 ID: %s 符合执行条件，执行通知", notify['id'])
                     await self.execute_notify(notify, now)
                     if notify['run_mode'] == 0:
-                        print(f"通知 {notify['id']} 已执行，移除")
+                        logger.debug("通知 %s 已执行，移除", notify['id'])
                         self.notifies.remove(notify)
-                print(f"当前通知数量: {len(self.notifies)}")
             except Exception as e:
-                print(f"处理通知 {notify['id']} 时出错: {str(e)}")
+                logger.error("处理通知 %s 时出错: %s", notify['id'], e)
+                self.stats.record_failure("execute_error")
+        self.stats.record_tick(now,
+                               perf_counter() - tick_start,
+                               len(self.notifies))
+
+    def due_at(self, notify: Dict) -> datetime:
+        """通知本次预定的发送时间(UTC)：单次为开始时间，重复为当天的执行时间"""
+        if notify['run_mode'] == 0:
+            return notify['start_at']
+        return self.local_time_to_utc(notify['time_at'])
 
     async def execute_notify(self, notify: Dict, current_time: datetime):
         """执行指定的通知函数"""
         # 验证 LINE ID 格式
         if not self.validate_line_id(notify['username']):
-            print(f"无效的 LINE ID 格式: {notify['username']}")
+            logger.warning("无效的 LINE ID 格式: %s", notify['username'])
+            self.stats.record_failure("invalid_line_id")
             return
 
         # 先验证相关对象是否存在
-        details = self.get_progress_details(notify['category_id'],
-                                            notify['item_id'],
-                                            notify['progress_id'])
+        with self.stats.stage("resolve"):
+            details = self.get_progress_details(notify['category_id'],
+                                                notify['item_id'],
+                                                notify['progress_id'])
 
         if not details:
+            self.stats.record_failure("missing_details")
             return
 
-        print(
-            f"run_code = {notify['run_code']} 发送 LINE 通知给用户 ID: {notify['user_id']}"
-        )
-        await send_line_notification(notify['username'],
-                                     details['progress_content'])
+        logger.info("run_code = %s 发送 LINE 通知给用户 ID: %s", notify['run_code'],
+                    notify['user_id'])
+        with self.stats.stage("line"):
+            sent = await send_line_notification(notify['username'],
+                                                details['progress_content'])
+        if sent:
+            self.stats.record_fire(self.due_at(notify),
+                                   datetime.now(self.TIMEZONE))
+        else:
+            self.stats.record_failure("line_send")
         # 更新指定通知记录的最后执行时间
-        self.update_last_executed(notify['id'], current_time)
+        with self.stats.stage("db_update"):
+            updated = self.update_last_executed(notify['id'], current_time)
+        if not updated:
+            self.stats.record_failure("db_update")
 
         # 只通知特定用户
 
@@ -363,8 +448,9 @@ class TaskNotify:
         }
         # 发送给用户的数据
         data = {"message": message_data, "type": self.LINE_NOTIFY}
-        print(f"通知 ID: {notify['id']} 通知内容: {data}")
-        await self.send_to_user(notify['user_id'], data)
+        logger.debug("通知 ID: %s 通知内容: %s", notify['id'], data)
+        with self.stats.stage("sse"):
+            await self.send_to_user(notify['user_id'], data)
 
     async def send_to_user(self, user_id: int, data: Dict):
         """
@@ -375,14 +461,10 @@ class TaskNotify:
             data: 要发送的数据字典
         """
 
-        # 检查用户ID是否存在于connections字典中
-        if user_id in connections:  # 验证用户是否有活跃连接
-            # 遍历该用户的所有连接队列
-            # for queue in connections[user_id]:  # 对每个用户连接进行处理
-            for device_id, queue in connections[user_id].items():
-                print(f"向用户 ID: {user_id} (设备ID: {device_id})")
-                # 将数据异步放入队列
-                await queue.put(data)  # 使用异步方式将数据放入队列
+        # 向该用户的所有连接队列投递数据
+        sent = connections.send_to_user(user_id, data)
+        if sent:
+            logger.debug("向用户 ID: %s 的 %s 个连接发送", user_id, sent)
 
     async def start(self):
         """启动通知检查循环"""
@@ -419,7 +501,7 @@ class TaskNotify:
         try:
             await self.load_notifies()
         except Exception as e:
-            print(f"刷新通知列表失败: {str(e)}")
+            logger.error("刷新通知列表失败: %s", e)
             self.db.rollback()
             raise
 
@@ -451,7 +533,7 @@ class TaskNotify:
                 "progress_content": progress.content
             }
         except Exception as e:
-            print(f"Error getting progress details: {str(e)}")
+            logger.error("Error getting progress details: %s", e)
             return None
 
     def update_last_executed(self,
@@ -467,9 +549,15 @@ class TaskNotify:
         """
         try:
             # 更新数据库记录
-            updated = self.db.query(models.TaskNotify).filter(
-                models.TaskNotify.id == notify_id).update(
-                    {'last_executed': current_time if current_time else None})
+            query = self.db.query(
+                models.TaskNotify).filter(models.TaskNotify.id == notify_id)
+            crud.record_notify_changes(
+                self.db,
+                query.with_entities(models.TaskNotify.user_id,
+                                    models.TaskNotify.id),
+                crud.TASK_CHANGE_UPSERT)
+            updated = query.update(
+                {'last_executed': current_time if current_time else None})
 
             # 提交事务
             self.db.commit()
@@ -483,6 +571,6 @@ class TaskNotify:
 
             return bool(updated)
         except Exception as e:
-            print(f"更新最后执行时间失败: {str(e)}")
+            logger.error("更新最后执行时间失败: %s", e)
             self.db.rollback()
             return False
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""
+API 基准测试
+
+先以 seed.py 生成固定的数据集，再在进程内通过 ASGI 以指定并发调用主要路由，
+LINE 和 Cloudinary 以桩函数替换(可用 --line-latency / --cloudinary-latency
+模拟网络延迟)。每个路由输出吞吐量和 p50/p95/p99/max 延迟，以及平均每个请求的
+数据库查询次数(取自 Server-Timing 响应头)。
+
+结果可用 --json 保存，之后以 --compare 与保存的结果对比，
+相同的数据量、种子和参数下，不同分支的结果可以直接比较。
+
+用法:
+    python benchmarks/bench_api.py
+    python benchmarks/bench_api.py --requests 500 --concurrency 8 --json base.json
+    python benchmarks/bench_api.py --compare base.json --only tasks_all,messages_list
+    DATABASE_URL=postgresql://localhost/bench python benchmarks/bench_api.py --reset
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import sys
+import time
+from typing import Callable, List
+
+import common
+import seed as seeder
+from app.database import engine
+
+DB_QUERIES = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+# 影响结果的参数，对比时这些参数不同会给出警告
+COMPARABLE_PARAMS = ("seed", "users", "messages", "categories", "items",
+                     "progresses", "notifies", "requests", "concurrency",
+                     "warmup", "image_size", "line_latency",
+                     "cloudinary_latency")
+
+
+class Scenario:
+    """
+    一个基准测试场景
+    build(i) 返回第 i 个请求的 (method, url, 其他 httpx 参数)
+    scale: 请求数相对于 --requests 的比例
+    sqlite_serial: 在 SQLite 上逐个执行。该路由在事件循环中持有写事务并等待
+    外部调用，SQLite 只允许一个写入者，并发时其他请求会阻塞事件循环直到锁超时
+    """
+
+    def __init__(self,
+                 name: str,
+                 build: Callable,
+                 expect: int = 200,
+                 scale: float = 1.0,
+                 sqlite_serial: bool = False):
+        self.name = name
+        self.build = build
+        self.expect = expect
+        self.scale = scale
+        self.sqlite_serial = sqlite_serial
+
+
+def build_scenarios(dataset: seeder.Dataset, headers: dict, etags: dict,
+                    image_size: int) -> List[Scenario]:
+    user_id = dataset.user_ids[0]
+    progress_ids = dataset.progress_ids[user_id]
+    terms = dataset.search_terms
+    # 每个请求上传内容不同的图片，避免命中已上传图片的去重
+    image_rng = random.Random(0)
+
+    def cached(headers: dict, etag: str) -> dict:
+        return {**headers, "If-None-Match": etag}
+
+    return [
+        Scenario("health", lambda i: ("GET", "/api/health", {})),
+        Scenario(
+            "messages_list", lambda i: ("GET", "/messages/", {
+                "headers": headers
+            })),
+        Scenario("messages_list_304",
+                 lambda i: ("GET", "/messages/", {
+                     "headers": cached(headers, etags["messages"])
+                 }),
+                 expect=304),
+        Scenario(
+            "messages_search", lambda i: ("GET", "/messages/search", {
+                "headers": headers,
+                "params": {
+                    "q": terms[i % len(terms)]
+                }
+            })),
+        Scenario("tasks_all",
+                 lambda i: ("GET", "/tasks/all", {
+                     "headers": headers
+                 })),
+        Scenario("tasks_all_304",
+                 lambda i: ("GET", "/tasks/all", {
+                     "headers": cached(headers, etags["tasks"])
+                 }),
+                 expect=304),
+        Scenario(
+            "tasks_search", lambda i: ("GET", "/tasks/search", {
+                "headers": headers,
+                "params": {
+                    "q": terms[i % len(terms)]
+                }
+            })),
+        Scenario(
+            "progress_update", lambda i:
+            ("PUT", f"/progresses/{progress_ids[i % len(progress_ids)]}", {
+                "headers": headers,
+                "json": {
+                    "progress_name": f"bench {i}",
+                    "content": "updated"
+                }
+            })),
+        Scenario(
+            "progress_status", lambda i:
+            ("PUT",
+             f"/progresses/{progress_ids[i % len(progress_ids)]}/status", {
+                 "headers": headers,
+                 "json": {
+                     "status": i % 3
+                 }
+             })),
+        Scenario(
+            "message_create", lambda i: ("POST", "/messages/", {
+                "headers": headers,
+                "data": {
+                    "content": f"bench message {i}"
+                }
+            })),
+        Scenario("message_create_image",
+                 lambda i: ("POST", "/messages/", {
+                     "headers": headers,
+                     "data": {
+                         "content": f"bench image {i}"
+                     },
+                     "files": {
+                         "file":
+                         (f"bench_{i}.bin", image_rng.randbytes(image_size),
+                          "application/octet-stream")
+                     }
+                 }),
+                 sqlite_serial=True),
+        # bcrypt 验证每次约数百毫秒，登录场景只执行十分之一的请求数
+        Scenario("login",
+                 lambda i: ("POST", "/token", {
+                     "json": {
+                         "username": seeder.ADMIN_USERNAME,
+                         "password": seeder.PASSWORD
+                     }
+                 }),
+                 scale=0.1),
+    ]
+
+
+def comparable_params(args) -> dict:
+    return {name: getattr(args, name) for name in COMPARABLE_PARAMS}
+
+
+async def fetch_etags(client, headers: dict) -> dict:
+    """取得当前的 ETag，供 304 场景使用"""
+    etags = {}
+    for key, path in (("messages", "/messages/"), ("tasks", "/tasks/all")):
+        response = await client.get(path, headers=headers)
+        response.raise_for_status()
+        etags[key] = response.headers["ETag"]
+    return etags
+
+
+async def run_scenario(client, scenario: Scenario, requests: int,
+                       concurrency: int, warmup: int) -> dict:
+    for i in range(warmup):
+        method, url, kwargs = scenario.build(i)
+        await client.request(method, url, **kwargs)
+
+    counter = iter(range(warmup, warmup + requests))
+    latencies = []
+    errors = 0
+    queries = 0
+
+    async def worker():
+        nonlocal errors, queries
+        for i in counter:
+            method, url, kwargs = scenario.build(i)
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != scenario.expect:
+                errors += 1
+            match = DB_QUERIES.search(response.headers.get(
+                "server-timing", ""))
+            if match:
+                queries += int(match.group(1))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result = common.summarize(latencies, time.perf_counter() - start)
+    result["concurrency"] = concurrency
+    result["errors"] = errors
+    result["db_queries"] = queries / requests if requests else 0.0
+    return result
+
+
+def print_report(results: dict, baseline: dict = None):
+    header = (f"{'route':<22} {'req':>5} {'conc':>4} {'err':>4} {'req/s':>9} "
+              f"{'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'queries':>8}")
+    if baseline:
+        header += f" {'Δp50':>8} {'Δp95':>8}"
+    print(header)
+    for name, result in results.items():
+        line = (f"{name:<22} {result['requests']:>5} "
+                f"{result['concurrency']:>4} {result['errors']:>4} "
+                f"{result['rps']:>9.1f} {result['p50_ms']:>8.2f} "
+                f"{result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+                f"{result['max_ms']:>8.2f} {result['db_queries']:>8.1f}")
+        previous = (baseline or {}).get(name)
+        if previous:
+            for key in ("p50_ms", "p95_ms"):
+                if previous[key]:
+                    change = (result[key] / previous[key] - 1) * 100
+                    line += f" {change:>+7.1f}%"
+                else:
+                    line += f" {'-':>8}"
+        print(line)
+    print("latency in ms; queries = database queries per request")
+
+
+async def run(args, dataset: seeder.Dataset) -> dict:
+    common.install_stubs(line_latency=args.line_latency,
+                         cloudinary_latency=args.cloudinary_latency)
+    headers = common.auth_headers(dataset.user_ids[0])
+
+    async with common.api_client() as client:
+        etags = await fetch_etags(client, headers)
+        scenarios = build_scenarios(dataset, headers, etags, args.image_size)
+        if args.only:
+            names = set(args.only.split(","))
+            unknown = names - {scenario.name for scenario in scenarios}
+            if unknown:
+                raise SystemExit(f"unknown scenario: {', '.join(unknown)}")
+            scenarios = [s for s in scenarios if s.name in names]
+
+        results = {}
+        for scenario in scenarios:
+            requests = max(1, int(args.requests * scenario.scale))
+            concurrency = (1 if scenario.sqlite_serial
+                           and engine.dialect.name == "sqlite" else
+                           args.concurrency)
+            results[scenario.name] = await run_scenario(
+                client, scenario, requests, concurrency, args.warmup)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    seeder.add_arguments(parser)
+    parser.add_argument("--requests",
+                        type=int,
+                        default=200,
+                        help="每个场景的请求数")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--only", help="只运行指定场景，以逗号分隔")
+    parser.add_argument("--image-size",
+                        type=int,
+                        default=64 * 1024,
+                        help="上传图片场景的文件大小(字节)")
+    parser.add_argument("--line-latency",
+                        type=float,
+                        default=0.0,
+                        help="LINE 桩函数的模拟延迟(秒)")
+    parser.add_argument("--cloudinary-latency",
+                        type=float,
+                        default=0.0,
+                        help="Cloudinary 桩函数的模拟延迟(秒)")
+    parser.add_argument("--json", help="将结果保存为 JSON")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果对比")
+    args = parser.parse_args()
+
+    volumes = seeder.volumes_from_args(args)
+    dataset = seeder.seed(volumes, seed=args.seed, reset=args.reset)
+    results = asyncio.run(run(args, dataset))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["params"] != comparable_params(args):
+            print("warning: baseline was recorded with different parameters")
+        baseline = baseline["results"]
+
+    print(f"database: {engine.dialect.name}, python "
+          f"{platform.python_version()}, requests={args.requests}, "
+          f"concurrency={args.concurrency}, seed={args.seed}")
+    print_report(results, baseline)
+
+    if args.json:
+        report = {
+            "params": comparable_params(args),
+            "environment": {
+                "database": engine.dialect.name,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count()
+            },
+            "results": results
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"saved {args.json}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
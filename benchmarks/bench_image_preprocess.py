@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+留言图片预处理基准测试
+
+用 Pillow 生成带 EXIF 的手机尺寸照片(4032x3024 JPEG)，通过本地 Cloudinary
+替身服务(模拟 20Mbit/s 上行带宽)上传，比较关闭和开启预处理时
+上传的字节数和每则留言的端到端上传耗时。
+
+用法:
+    python benchmarks/bench_image_preprocess.py
+"""
+import asyncio
+import io
+import sys
+import tempfile
+import time
+
+from bench_image_upload import ROOT, StubUploadHandler, start_stub_server
+
+sys.path.insert(0, ROOT)
+
+POSTS = 5
+BANDWIDTH = 20 * 1000 * 1000 // 8
+MAX_DIMENSION = 1600
+
+
+def make_phone_photo() -> bytes:
+    from PIL import Image
+    img = Image.effect_noise((4032, 3024), 40).convert("RGB")
+    exif = Image.Exif()
+    exif[0x010F] = "BenchPhone"  # Make
+    exif[0x0112] = 6  # Orientation: 旋转 90 度
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=92, exif=exif)
+    return buffer.getvalue()
+
+
+def make_upload_file(data: bytes):
+    from starlette.datastructures import UploadFile
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    spooled.write(data)
+    spooled.seek(0)
+    return UploadFile(spooled, size=len(data), filename="photo.jpg")
+
+
+async def run_posts(photo: bytes) -> tuple:
+    from app import crud
+    StubUploadHandler.bytes_received = 0
+    latencies = []
+    for _ in range(POSTS):
+        start = time.perf_counter()
+        result = await crud.upload_image_to_cloudinary(
+            make_upload_file(photo))
+        latencies.append(time.perf_counter() - start)
+        assert result, "upload failed"
+    return StubUploadHandler.bytes_received / POSTS, latencies
+
+
+def main():
+    import cloudinary
+    from app import cloudinary_service
+    from app.config import Config
+    # 先执行应用的延迟配置，避免第一次上传时覆盖替身配置
+    cloudinary_service._configure()
+    cloudinary.config(cloud_name="bench",
+                      api_key="key",
+                      api_secret="secret",
+                      upload_prefix=start_stub_server())
+    StubUploadHandler.bandwidth = BANDWIDTH
+    Config.MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+
+    photo = make_phone_photo()
+    print(f"{POSTS} posts, photo {len(photo) / 1024 / 1024:.2f}MB, "
+          f"uplink {BANDWIDTH * 8 / 1000 / 1000:.0f}Mbit/s")
+    print(f"{'mode':>12} {'KB/post':>10} {'avg(ms)':>9} {'max(ms)':>9}")
+    for label, max_dimension in (("original", 0),
+                                 (f"{Config.IMAGE_FORMAT}@{MAX_DIMENSION}",
+                                  MAX_DIMENSION)):
+        Config.IMAGE_MAX_DIMENSION = max_dimension
+        per_post, latencies = asyncio.run(run_posts(photo))
+        print(f"{label:>12} {per_post / 1024:>10.1f} "
+              f"{sum(latencies) / len(latencies) * 1000:>9.1f} "
+              f"{max(latencies) * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
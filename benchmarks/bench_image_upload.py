@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+留言图片上传基准测试
+
+启动本地 Cloudinary 替身服务，并发上传 20 个 10MB 文件，
+比较旧实现(await file.read() + 同步 cloudinary.uploader.upload)
+与 crud.upload_image_to_cloudinary 的事件循环延迟和峰值内存(RSS)。
+
+每种实现在独立子进程中运行，峰值 RSS 互不影响。
+
+用法:
+    python benchmarks/bench_image_upload.py
+"""
+import asyncio
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault(
+    "DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_upload.db"))
+os.environ.setdefault("MAX_UPLOAD_SIZE", str(20 * 1024 * 1024))
+
+UPLOADS = 20
+FILE_SIZE = 10 * 1024 * 1024
+TICK = 0.01
+
+
+class StubUploadHandler(BaseHTTPRequestHandler):
+    """接收上传请求并丢弃内容，返回 Cloudinary 格式的响应"""
+    # 累计接收的字节数
+    bytes_received = 0
+    # 模拟上行带宽(字节/秒)，0 表示不限速
+    bandwidth = 0
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        remaining = length
+        while remaining > 0:
+            remaining -= len(self.rfile.read(min(remaining, 65536)))
+        StubUploadHandler.bytes_received += length
+        if self.bandwidth:
+            time.sleep(length / self.bandwidth)
+        body = json.dumps({
+            "public_id": "stub",
+            "secure_url": "https://stub.local/image/upload/stub.jpg"
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubUploadHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def make_upload_file(path: str):
+    from starlette.datastructures import UploadFile
+    return UploadFile(open(path, "rb"),
+                      size=FILE_SIZE,
+                      filename=os.path.basename(path))
+
+
+async def legacy_upload(file):
+    """旧实现: 整个文件读入内存后同步上传"""
+    import cloudinary.uploader
+    file_content = await file.read()
+    return cloudinary.uploader.upload(file_content)['secure_url']
+
+
+async def monitor_loop_lag(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def run_uploads(mode: str, paths: list) -> dict:
+    from app import crud
+    upload = (legacy_upload
+              if mode == "legacy" else crud.upload_image_to_cloudinary)
+
+    stop = asyncio.Event()
+    lags = []
+    monitor = asyncio.create_task(monitor_loop_lag(stop, lags))
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(upload(make_upload_file(path)) for path in paths))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await monitor
+
+    lags.sort()
+    return {
+        "mode": mode,
+        "ok": sum(1 for r in results if r),
+        "elapsed_s": elapsed,
+        "max_lag_ms": lags[-1] * 1000 if lags else 0,
+        "p99_lag_ms": lags[int(len(lags) * 0.99)] * 1000 if lags else 0,
+        "peak_rss_mb":
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def child(mode: str, data_dir: str):
+    import cloudinary
+    from app import cloudinary_service
+    # 应用在第一次上传时才用环境变量配置 Cloudinary，先执行该配置，
+    # 之后的替身配置才不会被覆盖
+    cloudinary_service._configure()
+    cloudinary.config(cloud_name="bench",
+                      api_key="key",
+                      api_secret="secret",
+                      upload_prefix=start_stub_server())
+    paths = sorted(
+        os.path.join(data_dir, name) for name in os.listdir(data_dir))
+    print(json.dumps(asyncio.run(run_uploads(mode, paths))))
+
+
+def main():
+    data_dir = tempfile.mkdtemp()
+    for i in range(UPLOADS):
+        with open(os.path.join(data_dir, f"image_{i}.jpg"), "wb") as f:
+            f.write(os.urandom(FILE_SIZE))
+
+    try:
+        print(f"{UPLOADS} x {FILE_SIZE // (1024 * 1024)}MB concurrent uploads")
+        print(f"{'mode':>10} {'ok':>4} {'time(s)':>8} {'max lag(ms)':>12} "
+              f"{'p99 lag(ms)':>12} {'peak RSS(MB)':>13}")
+        for mode in ("legacy", "streamed"):
+            proc = subprocess.run(
+                [sys.executable, __file__, "--child", mode, data_dir],
+                capture_output=True,
+                text=True)
+            if proc.returncode != 0:
+                sys.exit(proc.stderr)
+            r = json.loads(proc.stdout.strip().splitlines()[-1])
+            print(f"{r['mode']:>10} {r['ok']:>4} {r['elapsed_s']:>8.2f} "
+                  f"{r['max_lag_ms']:>12.1f} {r['p99_lag_ms']:>12.1f} "
+                  f"{r['peak_rss_mb']:>13.1f}")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3])
+    else:
+        main()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+调度器加载通知基准测试
+
+写入 HISTORY 条已失效的通知(已执行的单次通知、已过 stop_at 的重复通知)
+和 ACTIVE 条待加载的通知后，比较旧的 OR 条件 ORM 查询 + .all() 与
+crud.iter_scheduler_notifies(部分索引 + UNION ALL + yield_per)的耗时和
+Python 堆内存峰值。
+
+用法:
+    python benchmarks/bench_notify_load.py [HISTORY]
+    DATABASE_URL=postgresql://... python benchmarks/bench_notify_load.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault(
+    "DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_notify_load.db"))
+
+from sqlalchemy import insert, text  # noqa: E402
+from app import crud, models  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+
+HISTORY = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+ACTIVE = 2000
+BATCH_SIZE = 20000
+REPEAT = 3
+
+
+def seed(db):
+    user = models.User(username=f"bench_notify_{time.time_ns()}",
+                       password_hash="x")
+    db.add(user)
+    db.flush()
+    category = models.TaskCategory(user_id=user.id,
+                                   category_name="c",
+                                   content="")
+    db.add(category)
+    db.flush()
+    item = models.TaskItem(user_id=user.id,
+                           category_id=category.id,
+                           item_name="i",
+                           content="")
+    db.add(item)
+    db.flush()
+    progress = models.TaskProgress(user_id=user.id,
+                                   item_id=item.id,
+                                   progress_name="p",
+                                   content="")
+    db.add(progress)
+    db.flush()
+
+    now = datetime.now(timezone.utc)
+    past = now - timedelta(days=30)
+    future = now + timedelta(days=30)
+    base = {
+        "user_id": user.id,
+        "category_id": category.id,
+        "item_id": item.id,
+        "progress_id": progress.id,
+        "run_code": 1,
+        "start_at": past,
+    }
+    rng = random.Random(0)
+
+    def history_row():
+        if rng.random() < 0.6:
+            # 已执行的单次通知
+            return dict(base, run_mode=0, stop_at=past, last_executed=past)
+        # 已过期的重复通知
+        return dict(base,
+                    run_mode=rng.choice([1, 2]),
+                    stop_at=past,
+                    last_executed=past)
+
+    def active_row(i):
+        if i % 2:
+            return dict(base, run_mode=0, stop_at=future, last_executed=None)
+        return dict(base, run_mode=1, stop_at=future, last_executed=past)
+
+    for start in range(0, HISTORY, BATCH_SIZE):
+        db.execute(insert(models.TaskNotify), [
+            history_row() for _ in range(min(BATCH_SIZE, HISTORY - start))
+        ])
+    db.execute(insert(models.TaskNotify), [active_row(i) for i in range(ACTIVE)])
+    db.commit()
+    if engine.dialect.name == "postgresql":
+        db.execute(text("ANALYZE task_notifies"))
+    else:
+        db.execute(text("ANALYZE"))
+    db.commit()
+
+
+def legacy_load(db, now):
+    """旧实现: OR 条件的 ORM 查询，.all() 后复制实体 __dict__"""
+    notifies = (db.query(models.TaskNotify, models.User.username).join(
+        models.User, models.TaskNotify.user_id == models.User.id).filter(
+            ((models.TaskNotify.run_mode == 0)
+             & (models.TaskNotify.last_executed.is_(None)))
+            | ((models.TaskNotify.run_mode.in_([1, 2]))
+               & (models.TaskNotify.stop_at > now))).all())
+    result = []
+    for notify, username in notifies:
+        notify_dict = notify.__dict__.copy()
+        notify_dict['username'] = username
+        result.append(notify_dict)
+    return result
+
+
+def streamed_load(db, now):
+    return list(crud.iter_scheduler_notifies(db, now))
+
+
+def measure(func):
+    best = None
+    peak = 0
+    count = 0
+    for _ in range(REPEAT):
+        db = SessionLocal()
+        try:
+            now = datetime.now(timezone.utc)
+            tracemalloc.start()
+            start = time.perf_counter()
+            count = len(func(db, now))
+            elapsed = time.perf_counter() - start
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        finally:
+            db.close()
+        best = elapsed if best is None else min(best, elapsed)
+    return best, peak, count
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    start = time.perf_counter()
+    seed(db)
+    db.close()
+    print(f"seeded {HISTORY} historical + {ACTIVE} active notifies in "
+          f"{time.perf_counter() - start:.1f}s ({engine.dialect.name})")
+
+    print(f"{'loader':>10} {'rows':>6} {'time(ms)':>9} {'peak(MB)':>9}")
+    for name, func in [("legacy", legacy_load), ("streamed", streamed_load)]:
+        elapsed, peak, count = measure(func)
+        print(f"{name:>10} {count:>6} {elapsed * 1000:>9.1f} "
+              f"{peak / 2**20:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
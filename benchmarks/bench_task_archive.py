@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+任务树导出/导入基准测试
+
+在进程内通过 ASGI 调用 GET /tasks/export 和 POST /tasks/import，
+记录每个用户 1k / 10k / 100k 行时的耗时和 Python 堆内存峰值(tracemalloc)。
+导出与导入都是串流处理，内存峰值不应随行数线性增长。
+
+用法:
+    python benchmarks/bench_task_archive.py
+    DATABASE_URL=postgresql://... python benchmarks/bench_task_archive.py
+"""
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+from common import api_client, auth_headers  # 须在导入 app 之前完成环境设置
+from app import models
+from app.database import Base, SessionLocal, engine
+from api.main import app
+from bench_task_tree import seed_user
+
+SIZES = [1000, 10000, 100000]
+CHUNK_SIZE = 64 * 1024
+
+
+def new_user() -> int:
+    db = SessionLocal()
+    try:
+        user = models.User(username=f"bench_import_{time.time_ns()}",
+                           password_hash="x")
+        db.add(user)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+async def export_to_file(client, headers, path: str) -> int:
+    """
+    直接以 ASGI 调用导出接口并写入文件，返回字节数
+    (httpx 的 ASGITransport 会缓存整个响应，无法反映串流的内存占用)
+    """
+    size = 0
+    scope = {
+        "type": "http",
+        "asgi": {
+            "version": "3.0"
+        },
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/tasks/export",
+        "raw_path": b"/tasks/export",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(k.lower().encode(), v.encode())
+                    for k, v in headers.items()],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+
+    request_sent = asyncio.Event()
+    response_done = asyncio.Event()
+
+    async def receive():
+        if not request_sent.is_set():
+            request_sent.set()
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # StreamingResponse 会同时等待客户端断线，响应结束后才返回
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    with open(path, "wb") as f:
+
+        async def send(message):
+            nonlocal size
+            if message["type"] == "http.response.start":
+                assert message["status"] == 200, message
+            elif message["type"] == "http.response.body":
+                f.write(message.get("body", b""))
+                size += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    response_done.set()
+
+        await app(scope, receive, send)
+    return size
+
+
+async def import_from_file(client, headers, path: str) -> dict:
+    """分块上传文件"""
+
+    async def body():
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                yield chunk
+
+    response = await client.post("/tasks/import",
+                                 content=body(),
+                                 headers=headers,
+                                 timeout=None)
+    response.raise_for_status()
+    return response.json()["imported"]
+
+
+async def measure(coro_func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = await coro_func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+async def main():
+    Base.metadata.create_all(bind=engine)
+    workdir = tempfile.mkdtemp()
+    async with api_client() as client:
+        print(f"{'rows':>7} {'export(s)':>10} {'peak(MB)':>9} "
+              f"{'import(s)':>10} {'peak(MB)':>9}")
+        for size in SIZES:
+            db = SessionLocal()
+            user_id = seed_user(db, f"bench_archive_{time.time_ns()}", size)
+            db.close()
+            path = os.path.join(workdir, f"tasks-{size}.ndjson")
+
+            _, export_time, export_peak = await measure(
+                export_to_file, client, auth_headers(user_id), path)
+            counts, import_time, import_peak = await measure(
+                import_from_file, client, auth_headers(new_user()), path)
+            assert sum(counts.values()) == size, counts
+
+            print(f"{size:>7} {export_time:>10.2f} "
+                  f"{export_peak / 2**20:>9.1f} {import_time:>10.2f} "
+                  f"{import_peak / 2**20:>9.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+批量新增任务进度基准测试
+
+在进程内通过 ASGI 调用 API，比较逐笔 POST /progresses/ 与一次
+POST /progresses/batch 写入 N 笔进度的吞吐量(rows/sec)。
+
+用法:
+    python benchmarks/bench_task_batch.py
+    DATABASE_URL=postgresql://... python benchmarks/bench_task_batch.py
+"""
+import asyncio
+import time
+
+from common import api_client, auth_headers  # 须在导入 app 之前完成环境设置
+from app import models
+from app.database import Base, SessionLocal, engine
+
+SIZES = [10, 100, 500]
+
+
+def seed_item() -> tuple:
+    db = SessionLocal()
+    try:
+        user = models.User(username=f"bench_batch_{time.time_ns()}",
+                           password_hash="x")
+        db.add(user)
+        db.flush()
+        category = models.TaskCategory(user_id=user.id,
+                                       category_name="bench",
+                                       content="")
+        db.add(category)
+        db.flush()
+        item = models.TaskItem(user_id=user.id,
+                               category_id=category.id,
+                               item_name="checklist",
+                               content="")
+        db.add(item)
+        db.commit()
+        return auth_headers(user.id), item.id
+    finally:
+        db.close()
+
+
+def progress_rows(item_id: int, n: int) -> list:
+    return [{
+        "item_id": item_id,
+        "progress_name": f"step {i}",
+        "content": "content"
+    } for i in range(n)]
+
+
+async def single_rows(client, headers, rows):
+    for row in rows:
+        response = await client.post("/progresses/", json=row, headers=headers)
+        response.raise_for_status()
+
+
+async def batch_rows(client, headers, rows):
+    response = await client.post("/progresses/batch",
+                                 json=rows,
+                                 headers=headers)
+    response.raise_for_status()
+
+
+async def main():
+    Base.metadata.create_all(bind=engine)
+    async with api_client() as client:
+        print(f"{'rows':>6} {'single(rows/s)':>15} {'batch(rows/s)':>14} "
+              f"{'speedup':>8}")
+        for size in SIZES:
+            headers, item_id = seed_item()
+            rows = progress_rows(item_id, size)
+
+            start = time.perf_counter()
+            await single_rows(client, headers, rows)
+            single = size / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await batch_rows(client, headers, rows)
+            batch = size / (time.perf_counter() - start)
+
+            print(f"{size:>6} {single:>15.0f} {batch:>14.0f} "
+                  f"{batch / single:>7.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+/tasks/all 读取路径基准测试
+
+比较旧的 ORM 实体 + model_to_dict 读取方式与 crud.get_task_tree_json
+列投影读取方式在每个用户 10 / 1k / 50k 行数据时的耗时。
+
+用法:
+    python benchmarks/bench_task_tree.py
+    DATABASE_URL=postgresql://... python benchmarks/bench_task_tree.py
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault(
+    "DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_task_tree.db"))
+
+from sqlalchemy import insert  # noqa: E402
+from app import crud, models  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+
+SIZES = [10, 1000, 50000]
+REPEAT = 5
+
+
+def seed_user(db, username: str, total_rows: int) -> int:
+    """按 分类 5% / 项目 20% / 进度 60% / 通知 15% 的比例写入 total_rows 行"""
+    user = models.User(username=username, password_hash="x")
+    db.add(user)
+    db.flush()
+    now = datetime.now(timezone.utc)
+
+    n_categories = max(1, total_rows * 5 // 100)
+    n_items = max(1, total_rows * 20 // 100)
+    n_progresses = max(1, total_rows * 60 // 100)
+    n_notifies = max(1, total_rows - n_categories - n_items - n_progresses)
+
+    category_ids = db.execute(
+        insert(models.TaskCategory).returning(models.TaskCategory.id),
+        [{
+            "user_id": user.id,
+            "category_name": f"category {i}",
+            "content": "content"
+        } for i in range(n_categories)]).scalars().all()
+    item_ids = db.execute(
+        insert(models.TaskItem).returning(models.TaskItem.id),
+        [{
+            "user_id": user.id,
+            "category_id": category_ids[i % n_categories],
+            "item_name": f"item {i}",
+            "content": "content"
+        } for i in range(n_items)]).scalars().all()
+    progress_ids = db.execute(
+        insert(models.TaskProgress).returning(models.TaskProgress.id),
+        [{
+            "user_id": user.id,
+            "item_id": item_ids[i % n_items],
+            "progress_name": f"progress {i}",
+            "content": "content"
+        } for i in range(n_progresses)]).scalars().all()
+    db.execute(insert(models.TaskNotify), [{
+        "user_id": user.id,
+        "category_id": category_ids[0],
+        "item_id": item_ids[0],
+        "progress_id": progress_ids[i % n_progresses],
+        "start_at": now,
+        "stop_at": now,
+        "run_mode": 0,
+        "run_code": 1
+    } for i in range(n_notifies)])
+    db.commit()
+    return user.id
+
+
+def legacy_load(db, user_id: int) -> str:
+    """旧实现: 四次 ORM 查询后逐个对象遍历 __table__.columns"""
+
+    def model_to_dict(model):
+        return {
+            c.name: getattr(model, c.name)
+            for c in model.__table__.columns
+        }
+
+    data = {}
+    for model, key in crud.TASK_ENTITIES.values():
+        rows = db.query(model).filter(model.user_id == user_id).all()
+        data[key] = [model_to_dict(row) for row in rows]
+    return json.dumps(data, default=crud.json_default)
+
+
+def projected_load(db, user_id: int) -> str:
+    version, data = crud.get_task_tree_json(db, user_id)
+    return "{" + ",".join(f'"{k}":{v}' for k, v in data.items()) + "}"
+
+
+def measure(func, user_id: int) -> float:
+    best = None
+    for _ in range(REPEAT):
+        db = SessionLocal()
+        try:
+            start = time.perf_counter()
+            func(db, user_id)
+            elapsed = time.perf_counter() - start
+        finally:
+            db.close()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    user_ids = {
+        size: seed_user(db, f"bench_tree_{size}_{time.time_ns()}", size)
+        for size in SIZES
+    }
+    db.close()
+
+    print(f"{'rows/user':>10} {'legacy(ms)':>12} {'projected(ms)':>14} "
+          f"{'speedup':>8}")
+    for size, user_id in user_ids.items():
+        legacy = measure(legacy_load, user_id)
+        projected = measure(projected_load, user_id)
+        print(f"{size:>10} {legacy * 1000:>12.2f} {projected * 1000:>14.2f} "
+              f"{legacy / projected:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
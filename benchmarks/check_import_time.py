@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+启动导入时间检查
+
+以 python -X importtime 在子进程中导入 api.main(即 serverless 冷启动时的导入)，
+以下情况以非零状态退出，tests/test_import_time.py 在测试中执行同样的检查:
+  1. 导入总耗时(多次运行取最小值)超过预算 IMPORT_BUDGET_MS
+  2. 应延迟加载的模块(Cloudinary SDK、passlib、jose.jwt、httpx)在启动时被导入
+
+用法:
+    python benchmarks/check_import_time.py
+    IMPORT_BUDGET_MS=1500 python benchmarks/check_import_time.py --runs 5
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGET = "api.main"
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", 1500))
+
+# 只在实际使用时才加载的模块，出现在启动导入中即视为回归
+DEFERRED_MODULES = ["cloudinary", "passlib", "jose.jwt", "httpx"]
+
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure() -> tuple:
+    """
+    导入一次 TARGET
+    返回:
+        tuple: (总耗时毫秒, {模块名: 累计耗时毫秒}, {TARGET 直接导入的模块: 累计耗时毫秒})
+    """
+    env = dict(os.environ)
+    env.setdefault(
+        "DATABASE_URL",
+        "sqlite:///" + os.path.join(tempfile.gettempdir(), "import_time.db"))
+    env.setdefault("SECRET_KEY", "import-time")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {TARGET}"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True)
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr[-2000:])
+        raise SystemExit(f"import {TARGET} failed")
+
+    modules = {}
+    depths = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            modules[match.group(4)] = int(match.group(2)) / 1000
+            depths[match.group(4)] = len(match.group(3))
+    # -X importtime 每深一层缩进两个空格
+    direct = {
+        name: ms
+        for name, ms in modules.items()
+        if depths[name] == depths[TARGET] + 2
+    }
+    return modules[TARGET], modules, direct
+
+
+def best_of(runs: int) -> tuple:
+    """多次导入取总耗时最短的一次(第一次可能包含编译 .pyc 的时间，不计入)"""
+    measure()
+    return min((measure() for _ in range(runs)), key=lambda run: run[0])
+
+
+def eager_imports(modules) -> list:
+    """启动时被导入的 DEFERRED_MODULES"""
+    return [
+        name for name in DEFERRED_MODULES
+        if name in modules or any(
+            module.startswith(name + ".") for module in modules)
+    ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    total, modules, direct = best_of(args.runs)
+
+    print(f"import {TARGET}: {total:.1f} ms "
+          f"(best of {args.runs}, budget {IMPORT_BUDGET_MS:.0f} ms)")
+    slowest = sorted(direct.items(), key=lambda item: item[1], reverse=True)
+    for name, ms in slowest[:args.top]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    failures = 0
+    eager = eager_imports(modules)
+    if eager:
+        print(f"FAIL  imported at startup: {', '.join(eager)}")
+        failures += 1
+    if total > IMPORT_BUDGET_MS:
+        print(f"FAIL  import time {total:.1f} ms exceeds budget "
+              f"{IMPORT_BUDGET_MS:.0f} ms")
+        failures += 1
+    if not failures:
+        print("ok")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+热点查询执行计划检查
+
+对 api/main.py、app/crud.py、app/task_notify.py 中的热点查询执行 EXPLAIN，
+任何一个查询对大表做全表扫描(Postgres 的 Seq Scan / SQLite 的 SCAN 且未使用索引)
+时以非零状态退出，可在迁移后运行；
+tests/test_query_plans.py 在测试中对模型和迁移建立的表结构执行同样的检查。
+
+Postgres 会在事务内关闭 enable_seqscan，使小数据量时也优先使用索引；
+若仍出现 Seq Scan，说明没有可用的索引。
+
+用法:
+    python benchmarks/check_query_plans.py
+    DATABASE_URL=postgresql://... python benchmarks/check_query_plans.py
+"""
+import json
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+USE_TEMP_DB = "DATABASE_URL" not in os.environ
+if USE_TEMP_DB:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(
+        tempfile.mkdtemp(), "check_query_plans.db")
+
+from sqlalchemy import select, text  # noqa: E402
+from app import crud, models  # noqa: E402
+from app.database import Base, engine  # noqa: E402
+
+USER_ID = 1
+PARENT_ID = 1
+
+
+def hot_queries():
+    """(名称, 查询) 列表，与应用中的查询形状一致"""
+    queries = [
+        ("messages page",
+         select(models.Message).order_by(
+             models.Message.created_at.desc()).offset(0).limit(100)),
+        ("messages by author",
+         select(models.Message.id).where(
+             models.Message.user_id == USER_ID).order_by(
+                 models.Message.created_at.desc()).limit(100)),
+        ("login records page", crud.login_records_query(0, 100)),
+        ("display name", select(models.DisplayName).where(
+            models.DisplayName.user_id == USER_ID)),
+        ("task changes since",
+         select(models.TaskChange.id, models.TaskChange.entity,
+                models.TaskChange.entity_id).where(
+                    models.TaskChange.user_id == USER_ID,
+                    models.TaskChange.id > 0).order_by(models.TaskChange.id)),
+    ]
+    # 调度器加载通知
+    queries.append(("scheduler load set",
+                    crud.scheduler_notifies_query(datetime.now(timezone.utc))))
+    # /tasks/all 按用户读取四类任务数据
+    for model, key in crud.TASK_ENTITIES.values():
+        queries.append(
+            (f"{key} by user",
+             select(*model.__table__.columns).where(model.user_id == USER_ID)))
+    # 删除上级时连带删除下级
+    for model, column in [
+        (models.TaskItem, models.TaskItem.category_id),
+        (models.TaskProgress, models.TaskProgress.item_id),
+        (models.TaskNotify, models.TaskNotify.category_id),
+        (models.TaskNotify, models.TaskNotify.item_id),
+        (models.TaskNotify, models.TaskNotify.progress_id),
+    ]:
+        queries.append((f"{model.__tablename__} by {column.key}",
+                        select(model.id).where(column == PARENT_ID)))
+    return queries
+
+
+def explain_postgres(conn, sql: str, params) -> list:
+    """返回计划中做 Seq Scan 的表"""
+    conn.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql,
+                                params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    scans = []
+
+    def walk(node):
+        if node.get("Node Type") == "Seq Scan":
+            scans.append(node.get("Relation Name"))
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return scans
+
+
+SQLITE_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def explain_sqlite(conn, sql: str, params) -> list:
+    """返回计划中未使用索引而全表扫描的表"""
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, params).all()
+    scans = []
+    for row in rows:
+        match = SQLITE_FULL_SCAN.match(row[-1])
+        if match:
+            scans.append(match.group(1))
+    return scans
+
+
+def compile_query(query):
+    compiled = query.compile(dialect=engine.dialect)
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+    return str(compiled), params
+
+
+def full_scans(conn, query) -> list:
+    """返回查询计划中全表扫描的表(在单独的事务中执行 EXPLAIN)"""
+    explain = (explain_postgres
+               if conn.dialect.name == "postgresql" else explain_sqlite)
+    sql, params = compile_query(query)
+    with conn.begin():
+        return explain(conn, sql, params)
+
+
+def main() -> int:
+    if USE_TEMP_DB:
+        Base.metadata.create_all(bind=engine)
+
+    queries = hot_queries()
+    failures = 0
+    with engine.connect() as conn:
+        for name, query in queries:
+            scans = full_scans(conn, query)
+            status = "FAIL" if scans else "ok"
+            detail = f" (full scan: {', '.join(scans)})" if scans else ""
+            print(f"{status:>4}  {name}{detail}")
+            failures += bool(scans)
+
+    print(f"{failures} of {len(queries)} queries fall back to a "
+          f"full table scan ({engine.dialect.name})")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试共用设置
+
+导入本模块即完成环境设置(须在导入 app / api 之前):
+  - 未指定 DATABASE_URL 时使用临时目录中的 SQLite 数据库
+  - ENV=test，不启动通知服务、图片上传等后台任务
+另提供以进程内 ASGI 调用 API 的客户端、替换 LINE / Cloudinary 的桩函数、
+JWT 请求头和延迟分位数统计。
+"""
+import asyncio
+import itertools
+import math
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault(
+    "DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ["ENV"] = "test"
+
+
+def api_client():
+    """在进程内通过 ASGI 调用 api.main.app 的 httpx 客户端"""
+    import httpx
+    from api.main import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                             base_url="http://bench",
+                             timeout=None)
+
+
+def auth_headers(user_id: int) -> dict:
+    """为已存在的用户签发 access token"""
+    from app import auth, models
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        user = db.get(models.User, user_id)
+        token = auth.create_access_token({
+            "sub": user.username,
+            "user_id": user.id
+        })
+    finally:
+        db.close()
+    return {"Authorization": f"Bearer {token}"}
+
+
+class StubUploader:
+    """代替 cloudinary.uploader，读完文件后返回固定格式的上传结果"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self._ids = itertools.count(1)
+
+    def upload_large(self, file_obj, **options):
+        try:
+            while file_obj.read(1024 * 1024):
+                pass
+        finally:
+            file_obj.close()
+        if self.latency:
+            time.sleep(self.latency)
+        self.calls += 1
+        public_id = f"bench/{next(self._ids)}"
+        return {
+            "public_id": public_id,
+            "secure_url": f"https://res.cloudinary.invalid/{public_id}.jpg"
+        }
+
+
+class StubAdminApi:
+    """代替 cloudinary.api，删除请求一律视为成功"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def delete_resources(self, public_ids, **options):
+        self.calls += 1
+        return {"deleted": {public_id: "deleted" for public_id in public_ids}}
+
+
+class StubLine:
+    """代替 send_line_notification，可模拟 LINE API 的网络延迟"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    async def __call__(self, user_id: str, message: str) -> bool:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.calls += 1
+        return True
+
+
+def install_stubs(line_latency: float = 0.0,
+                  cloudinary_latency: float = 0.0) -> dict:
+    """
+    以桩函数替换 LINE 和 Cloudinary，基准测试不会发出任何外部请求
+    返回:
+        dict: {"line": StubLine, "uploader": StubUploader, "api": StubAdminApi}
+    """
+    import api.main
+    from app import cloudinary_service, task_notify
+    stubs = {
+        "line": StubLine(line_latency),
+        "uploader": StubUploader(cloudinary_latency),
+        "api": StubAdminApi()
+    }
+    # api.main 和 task_notify 以名称导入 send_line_notification，两处都要替换
+    api.main.send_line_notification = stubs["line"]
+    task_notify.send_line_notification = stubs["line"]
+    cloudinary_service.uploader = lambda: stubs["uploader"]
+    cloudinary_service.api = lambda: stubs["api"]
+    return stubs
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """已排序数据的分位数(最近秩法)"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies: list, elapsed: float) -> dict:
+    """
+    汇总一组请求的延迟(秒)
+    返回:
+        dict: 请求数、吞吐量(req/s) 和 p50/p95/p99/max 延迟(毫秒)
+    """
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "rps": len(values) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": (values[-1] if values else 0.0) * 1000
+    }
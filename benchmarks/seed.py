@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试数据生成
+
+以固定随机种子和批量 INSERT 生成可重复的数据集:用户(含显示名称)、留言、
+每个用户的 分类 -> 项目 -> 进度 任务树和通知。相同参数与种子生成的数据完全相同，
+不同次运行、不同分支之间的基准结果可以直接比较。
+
+用法:
+    python benchmarks/seed.py --users 50 --messages 5000
+    DATABASE_URL=postgresql://localhost/bench python benchmarks/seed.py --reset
+"""
+import argparse
+import random
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, time as dt_time, timedelta, timezone
+from typing import List
+
+import common  # noqa: F401  须在导入 app 之前完成环境设置
+from sqlalchemy import insert
+from app import auth, models
+from app.database import Base, SessionLocal, engine
+
+# 数据中的时间以固定起点推算，不随运行时间变化
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+PASSWORD = "bench"
+ADMIN_USERNAME = "bench_admin"
+
+WORDS = [
+    "deploy", "invoice", "meeting", "report", "schedule", "backup", "review",
+    "release", "budget", "customer", "server", "database", "design", "travel",
+    "contract", "payment", "training", "inventory", "support", "upgrade",
+    "network", "audit", "printer", "holiday", "shipment", "quotation",
+    "warranty", "checklist", "migration", "reminder"
+]
+
+
+@dataclass
+class Volumes:
+    users: int = 50
+    messages: int = 5000
+    categories: int = 5
+    items: int = 10
+    progresses: int = 5
+    notifies: int = 20
+
+
+@dataclass
+class Dataset:
+    """生成结果，基准测试据此构造请求"""
+    admin_id: int
+    user_ids: List[int]
+    progress_ids: dict = field(default_factory=dict)
+    search_terms: List[str] = field(default_factory=list)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    defaults = Volumes()
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--users",
+                        type=int,
+                        default=defaults.users,
+                        help="用户数(另有一个管理员)")
+    parser.add_argument("--messages",
+                        type=int,
+                        default=defaults.messages,
+                        help="留言总数")
+    parser.add_argument("--categories",
+                        type=int,
+                        default=defaults.categories,
+                        help="每个用户的分类数")
+    parser.add_argument("--items",
+                        type=int,
+                        default=defaults.items,
+                        help="每个分类的项目数")
+    parser.add_argument("--progresses",
+                        type=int,
+                        default=defaults.progresses,
+                        help="每个项目的进度数")
+    parser.add_argument("--notifies",
+                        type=int,
+                        default=defaults.notifies,
+                        help="每个用户的通知数")
+    parser.add_argument("--reset",
+                        action="store_true",
+                        help="先删除并重建所有数据表")
+
+
+def volumes_from_args(args) -> Volumes:
+    return Volumes(**{
+        name: getattr(args, name)
+        for name in asdict(Volumes()).keys()
+    })
+
+
+def sentence(rng: random.Random, low: int, high: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def insert_returning_ids(db, model, rows: list) -> list:
+    if not rows:
+        return []
+    # executemany 的 RETURNING 默认不保证顺序，按参数顺序返回才能对应 rows
+    return db.execute(
+        insert(model).returning(model.id, sort_by_parameter_order=True),
+        rows).scalars().all()
+
+
+def seed_users(db, count: int) -> tuple:
+    # bcrypt 只计算一次，所有用户共用同一密码
+    password_hash = auth.get_password_hash(PASSWORD)
+    rows = [{
+        "username": ADMIN_USERNAME,
+        "password_hash": password_hash,
+        "is_admin": True,
+        "created_at": BASE_TIME
+    }]
+    rows.extend({
+        "username": f"bench_user_{i}",
+        "password_hash": password_hash,
+        "is_admin": False,
+        "created_at": BASE_TIME
+    } for i in range(count))
+    ids = insert_returning_ids(db, models.User, rows)
+    db.execute(insert(models.DisplayName), [{
+        "user_id": user_id,
+        "displayname": f"Bench {i}",
+        "updated_at": BASE_TIME
+    } for i, user_id in enumerate(ids)])
+    return ids[0], ids[1:]
+
+
+def seed_messages(db, rng: random.Random, user_ids: list, count: int):
+    db.execute(insert(models.Message), [{
+        "content": sentence(rng, 6, 20),
+        "user_id": rng.choice(user_ids),
+        "created_at": BASE_TIME + timedelta(minutes=i)
+    } for i in range(count)])
+
+
+def seed_task_tree(db, rng: random.Random, user_id: int,
+                   volumes: Volumes) -> list:
+    """写入一个用户的任务树，返回其进度 id"""
+    category_ids = insert_returning_ids(db, models.TaskCategory, [{
+        "user_id": user_id,
+        "category_name": f"{rng.choice(WORDS)} {i}",
+        "content": sentence(rng, 0, 8),
+        "created_at": BASE_TIME
+    } for i in range(volumes.categories)])
+    item_ids = insert_returning_ids(db, models.TaskItem, [{
+        "user_id": user_id,
+        "category_id": category_id,
+        "item_name": f"{rng.choice(WORDS)} {i}",
+        "content": sentence(rng, 0, 12),
+        "item_at": BASE_TIME,
+        "created_at": BASE_TIME
+    } for category_id in category_ids for i in range(volumes.items)])
+    item_categories = [(item_id, category_ids[i // volumes.items])
+                       for i, item_id in enumerate(item_ids)]
+    progress_rows = [{
+        "user_id": user_id,
+        "item_id": item_id,
+        "progress_name": f"{rng.choice(WORDS)} {i}",
+        "content": sentence(rng, 0, 16),
+        "progress_at": BASE_TIME + timedelta(hours=i),
+        "created_at": BASE_TIME,
+        "status": rng.randint(0, 2)
+    } for item_id, _ in item_categories for i in range(volumes.progresses)]
+    progress_ids = insert_returning_ids(db, models.TaskProgress,
+                                        progress_rows)
+    if not progress_ids:
+        return []
+
+    notify_rows = []
+    for i in range(volumes.notifies):
+        index = rng.randrange(len(progress_ids))
+        item_id, category_id = item_categories[index // volumes.progresses]
+        notify_rows.append({
+            "user_id": user_id,
+            "category_id": category_id,
+            "item_id": item_id,
+            "progress_id": progress_ids[index],
+            "start_at": BASE_TIME,
+            "stop_at": BASE_TIME + timedelta(days=3650),
+            "created_at": BASE_TIME,
+            "run_mode": rng.randint(0, 2),
+            "run_code": i,
+            "time_at": dt_time(rng.randint(0, 23), rng.choice((0, 30))),
+            "week_at": rng.randint(0, 6)
+        })
+    if notify_rows:
+        db.execute(insert(models.TaskNotify), notify_rows)
+    return progress_ids
+
+
+def seed(volumes: Volumes, seed: int = 1, reset: bool = False) -> Dataset:
+    """生成数据集；数据库已有基准数据且未指定 reset 时退出"""
+    if reset:
+        Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    rng = random.Random(seed)
+    db = SessionLocal()
+    try:
+        if db.query(models.User.id).filter(
+                models.User.username == ADMIN_USERNAME).first():
+            raise SystemExit("數據庫中已有基準測試數據，請使用 --reset 重建")
+
+        admin_id, user_ids = seed_users(db, volumes.users)
+        seed_messages(db, rng, [admin_id] + user_ids, volumes.messages)
+        dataset = Dataset(admin_id=admin_id, user_ids=user_ids)
+        for user_id in user_ids:
+            dataset.progress_ids[user_id] = seed_task_tree(
+                db, rng, user_id, volumes)
+        db.commit()
+    finally:
+        db.close()
+
+    dataset.search_terms = rng.sample(WORDS, 5)
+    return dataset
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    volumes = volumes_from_args(args)
+    dataset = seed(volumes, seed=args.seed, reset=args.reset)
+    progresses = sum(len(ids) for ids in dataset.progress_ids.values())
+    print(f"seeded {engine.url.render_as_string(hide_password=True)}: "
+          f"{volumes.users + 1} users, {volumes.messages} messages, "
+          f"{progresses} progresses")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""add sync-version, task-change and image pipeline tables
+
+Revision ID: 0000
+Revises:
+Create Date: 2026-10-19 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0000'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 增量同步变更日志(/tasks/all?since=)
+    op.create_table(
+        "task_changes",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id",
+                  sa.Integer(),
+                  sa.ForeignKey("users.id", ondelete="CASCADE"),
+                  nullable=False),
+        sa.Column("entity", sa.String(20), nullable=False),
+        sa.Column("entity_id", sa.Integer(), nullable=False),
+        sa.Column("op", sa.String(10), nullable=False),
+        sa.Column("created_at",
+                  sa.DateTime(timezone=True),
+                  server_default=sa.func.now()))
+    op.create_index("ix_task_changes_id", "task_changes", ["id"])
+    op.create_index("ix_task_changes_user_id_id", "task_changes",
+                    ["user_id", "id"])
+
+    # ETag 使用的数据版本计数器
+    op.create_table(
+        "sync_versions",
+        sa.Column("scope", sa.String(50), primary_key=True),
+        sa.Column("version",
+                  sa.Integer(),
+                  nullable=False,
+                  server_default="0"))
+
+    # 延迟上传的留言图片
+    op.create_table(
+        "pending_image_uploads",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("message_id",
+                  sa.Integer(),
+                  sa.ForeignKey("messages.id", ondelete="CASCADE"),
+                  unique=True,
+                  nullable=False),
+        sa.Column("file_path", sa.String(500), nullable=False),
+        sa.Column("filename", sa.String(255)),
+        sa.Column("digest", sa.String(64)),
+        sa.Column("status",
+                  sa.String(10),
+                  nullable=False,
+                  server_default="pending"),
+        sa.Column("attempts",
+                  sa.Integer(),
+                  nullable=False,
+                  server_default="0"),
+        sa.Column("last_error", sa.Text()),
+        sa.Column("created_at",
+                  sa.DateTime(timezone=True),
+                  server_default=sa.func.now()))
+    op.create_index("ix_pending_image_uploads_id", "pending_image_uploads",
+                    ["id"])
+
+    # 按内容摘要去重的已上传图片
+    op.create_table(
+        "image_assets",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("digest", sa.String(64), unique=True, nullable=False),
+        sa.Column("secure_url", sa.String(255), unique=True, nullable=False),
+        sa.Column("public_id", sa.String(255), nullable=False),
+        sa.Column("ref_count",
+                  sa.Integer(),
+                  nullable=False,
+                  server_default="1"),
+        sa.Column("created_at",
+                  sa.DateTime(timezone=True),
+                  server_default=sa.func.now()))
+    op.create_index("ix_image_assets_id", "image_assets", ["id"])
+
+    # 待从 Cloudinary 删除的图片
+    op.create_table(
+        "pending_image_deletions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("public_id", sa.String(255), nullable=False),
+        sa.Column("attempts",
+                  sa.Integer(),
+                  nullable=False,
+                  server_default="0"),
+        sa.Column("last_error", sa.Text()),
+        sa.Column("created_at",
+                  sa.DateTime(timezone=True),
+                  server_default=sa.func.now()))
+    op.create_index("ix_pending_image_deletions_id", "pending_image_deletions",
+                    ["id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_pending_image_deletions_id",
+                  table_name="pending_image_deletions")
+    op.drop_table("pending_image_deletions")
+    op.drop_index("ix_image_assets_id", table_name="image_assets")
+    op.drop_table("image_assets")
+    op.drop_index("ix_pending_image_uploads_id",
+                  table_name="pending_image_uploads")
+    op.drop_table("pending_image_uploads")
+    op.drop_table("sync_versions")
+    op.drop_index("ix_task_changes_user_id_id", table_name="task_changes")
+    op.drop_index("ix_task_changes_id", table_name="task_changes")
+    op.drop_table("task_changes")
@@ -0,0 +1,44 @@
+"""add foreign-key and lookup indexes
+
+Revision ID: 0001
+Revises: 0000
+Create Date: 2026-10-19 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = '0000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (索引名, 表, 列)，与 app/models.py 中的定义一致
+INDEXES = [
+    ("ix_messages_created_at_id", "messages", ["created_at", "id"]),
+    ("ix_messages_user_id_created_at", "messages", ["user_id", "created_at"]),
+    ("ix_login_records_login_datetime_id", "login_records",
+     ["login_datetime", "id"]),
+    ("ix_login_records_user_id", "login_records", ["user_id"]),
+    ("ix_task_categories_user_id", "task_categories", ["user_id"]),
+    ("ix_task_items_user_id", "task_items", ["user_id"]),
+    ("ix_task_items_category_id", "task_items", ["category_id"]),
+    ("ix_task_progresses_user_id", "task_progresses", ["user_id"]),
+    ("ix_task_progresses_item_id", "task_progresses", ["item_id"]),
+    ("ix_task_notifies_user_id", "task_notifies", ["user_id"]),
+    ("ix_task_notifies_category_id", "task_notifies", ["category_id"]),
+    ("ix_task_notifies_item_id", "task_notifies", ["item_id"]),
+    ("ix_task_notifies_progress_id", "task_notifies", ["progress_id"]),
+]
+
+def upgrade() -> None:
+    # 已由 create_all 建立的索引会被跳过
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade() -> None:
+    for name, table, _ in INDEXES:
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,43 @@
+"""add partial indexes for the scheduler load set
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 与 app/models.py 的 NOTIFY_ONCE_PENDING_SQL / NOTIFY_REPEATING_SQL 一致
+ONCE_PENDING = "run_mode = 0 AND last_executed IS NULL"
+REPEATING = "run_mode IN (1, 2)"
+
+
+def upgrade() -> None:
+    op.create_index("ix_task_notifies_once_pending",
+                    "task_notifies", ["id"],
+                    postgresql_where=sa.text(ONCE_PENDING),
+                    sqlite_where=sa.text(ONCE_PENDING),
+                    if_not_exists=True)
+    op.create_index("ix_task_notifies_repeat_stop_at",
+                    "task_notifies", ["stop_at"],
+                    postgresql_where=sa.text(REPEATING),
+                    sqlite_where=sa.text(REPEATING),
+                    if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_task_notifies_repeat_stop_at",
+                  table_name="task_notifies",
+                  if_exists=True)
+    op.drop_index("ix_task_notifies_once_pending",
+                  table_name="task_notifies",
+                  if_exists=True)
@@ -0,0 +1,59 @@
+"""add archive tables for the retention job
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "task_notifies_archive",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("category_id", sa.Integer(), nullable=False),
+        sa.Column("item_id", sa.Integer(), nullable=False),
+        sa.Column("progress_id", sa.Integer(), nullable=False),
+        sa.Column("start_at", sa.DateTime(timezone=True)),
+        sa.Column("stop_at", sa.DateTime(timezone=True)),
+        sa.Column("created_at", sa.DateTime(timezone=True)),
+        sa.Column("run_mode", sa.Integer(), nullable=False),
+        sa.Column("run_code", sa.Integer(), nullable=False),
+        sa.Column("time_at", sa.Time()),
+        sa.Column("week_at", sa.Integer()),
+        sa.Column("last_executed", sa.DateTime(timezone=True)),
+        sa.Column("archived_at",
+                  sa.DateTime(timezone=True),
+                  server_default=sa.func.now()))
+    op.create_index("ix_task_notifies_archive_user_id",
+                    "task_notifies_archive", ["user_id"])
+    op.create_table(
+        "login_records_archive",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("login_datetime", sa.DateTime(timezone=True)),
+        sa.Column("archived_at",
+                  sa.DateTime(timezone=True),
+                  server_default=sa.func.now()))
+    op.create_index("ix_login_records_archive_user_id",
+                    "login_records_archive", ["user_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_login_records_archive_user_id",
+                  table_name="login_records_archive")
+    op.drop_table("login_records_archive")
+    op.drop_index("ix_task_notifies_archive_user_id",
+                  table_name="task_notifies_archive")
+    op.drop_table("task_notifies_archive")
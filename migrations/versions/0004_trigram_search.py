@@ -0,0 +1,84 @@
+"""switch full-text search to trigram indexes for CJK content
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 与 app/models.py 中的定义一致
+# (表, 检索列, Postgres pg_trgm 索引名)
+SEARCH_TABLES = [
+    ("messages", ["content"], "ix_messages_content_trgm"),
+    ("task_categories", ["category_name", "content"],
+     "ix_task_categories_trgm"),
+    ("task_items", ["item_name", "content"], "ix_task_items_trgm"),
+    ("task_progresses", ["progress_name", "content"],
+     "ix_task_progresses_trgm"),
+]
+
+
+def document(columns) -> str:
+    return " || ' ' || ".join(columns)
+
+
+def sqlite_fts(table: str, columns, tokenize: str) -> list:
+    """重建 SQLite FTS5 外部内容表及同步触发器，并为已有数据建立索引"""
+    fts = f"{table}_fts"
+    cols = ", ".join(columns)
+    new_values = ", ".join(f"new.{c}" for c in columns)
+    old_values = ", ".join(f"old.{c}" for c in columns)
+    options = f", tokenize='{tokenize}'" if tokenize else ""
+    return [
+        f"DROP TRIGGER IF EXISTS {fts}_ai",
+        f"DROP TRIGGER IF EXISTS {fts}_ad",
+        f"DROP TRIGGER IF EXISTS {fts}_au",
+        f"DROP TABLE IF EXISTS {fts}",
+        f"CREATE VIRTUAL TABLE {fts} USING fts5("
+        f"{cols}, content='{table}', content_rowid='id'{options})",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} "
+        f"BEGIN INSERT INTO {fts}(rowid, {cols}) "
+        f"VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} "
+        f"BEGIN INSERT INTO {fts}({fts}, rowid, {cols}) "
+        f"VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) "
+        f"VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {cols}) "
+        f"VALUES (new.id, {new_values}); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for table, columns, index in SEARCH_TABLES:
+            op.execute(f"CREATE INDEX IF NOT EXISTS {index} ON {table} "
+                       f"USING gin (({document(columns)}) gin_trgm_ops)")
+    elif dialect == "sqlite":
+        for table, columns, _ in SEARCH_TABLES:
+            for statement in sqlite_fts(table, columns, "trigram"):
+                op.execute(statement)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        for _, _, index in SEARCH_TABLES:
+            op.execute(f"DROP INDEX IF EXISTS {index}")
+    elif dialect == "sqlite":
+        for table, columns, _ in SEARCH_TABLES:
+            for statement in sqlite_fts(table, columns, None):
+                op.execute(statement)
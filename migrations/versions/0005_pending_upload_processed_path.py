@@ -0,0 +1,27 @@
+"""record the preprocessed file of pending image uploads
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("pending_image_uploads",
+                  sa.Column("processed_path", sa.String(500)))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("pending_image_uploads") as batch_op:
+        batch_op.drop_column("processed_path")
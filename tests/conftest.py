@@ -0,0 +1,137 @@
+"""
+测试设置
+
+使用临时目录中的 SQLite 数据库，ENV=test(不启动通知服务等后台任务)。
+环境变量必须在导入 app 之前设置。
+异步测试使用 anyio 插件(@pytest.mark.anyio)，在进程内通过 ASGI 调用 API。
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(
+    tempfile.mkdtemp(), "test.db")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ["ENV"] = "test"
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from alembic import command  # noqa: E402
+from alembic.config import Config as AlembicConfig  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+from app import auth, models  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+
+
+def drop_all():
+    """删除所有表(包括 SQLite 的 FTS 虚拟表和 Alembic 版本表)"""
+    Base.metadata.drop_all(bind=engine)
+    with engine.begin() as conn:
+        for name in Base.metadata.tables:
+            conn.execute(
+                text(f"DROP TABLE IF EXISTS {models.fts_table_name(name)}"))
+        conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def schema():
+    """每个测试使用空数据库"""
+    drop_all()
+    Base.metadata.create_all(bind=engine)
+    yield
+    drop_all()
+
+
+# 引入迁移之前已存在的表
+BASELINE_TABLES = [
+    "users", "displaynames", "messages", "login_records", "task_categories",
+    "task_items", "task_progresses", "task_notifies"
+]
+
+
+def alembic_config() -> AlembicConfig:
+    # 不读取 alembic.ini，避免 fileConfig 改动测试进程的日志设置
+    config = AlembicConfig()
+    config.set_main_option("script_location", os.path.join(ROOT, "migrations"))
+    return config
+
+
+@pytest.fixture
+def migrated():
+    """原始表结构(含迁移前的数据)升级到 head"""
+    drop_all()
+    Base.metadata.create_all(
+        bind=engine,
+        tables=[Base.metadata.tables[name] for name in BASELINE_TABLES])
+    with engine.begin() as conn:
+        # 原始表结构没有 FTS 表，由迁移建立
+        for name in BASELINE_TABLES:
+            fts = models.fts_table_name(name)
+            for suffix in ("ai", "ad", "au"):
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {fts}_{suffix}"))
+            conn.execute(text(f"DROP TABLE IF EXISTS {fts}"))
+        # 迁移前已有的数据
+        conn.execute(
+            text("INSERT INTO users (id, username, password_hash, is_admin) "
+                 "VALUES (100, 'legacy', 'x', 0)"))
+        conn.execute(
+            text("INSERT INTO messages (content, user_id) "
+                 "VALUES ('升級前留下的舊留言', 100)"))
+    command.upgrade(alembic_config(), "head")
+    yield
+    drop_all()
+
+
+@pytest.fixture
+def db(schema):
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def line_calls(monkeypatch):
+    """以桩函数替换 LINE 推送，返回调用记录"""
+    import api.main
+    from app import task_notify
+    calls = []
+
+    async def fake_send(user_id: str, message: str) -> bool:
+        calls.append((user_id, message))
+        return True
+
+    monkeypatch.setattr(api.main, "send_line_notification", fake_send)
+    monkeypatch.setattr(task_notify, "send_line_notification", fake_send)
+    return calls
+
+
+@pytest.fixture
+async def client(line_calls):
+    from api.main import app
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                 base_url="http://test") as client:
+        yield client
+
+
+def create_user(db, username: str, is_admin: bool = False) -> models.User:
+    user = models.User(username=username,
+                       password_hash="x",
+                       is_admin=is_admin)
+    db.add(user)
+    db.commit()
+    return user
+
+
+def auth_headers(user: models.User) -> dict:
+    token = auth.create_access_token({
+        "sub": user.username,
+        "user_id": user.id
+    })
+    return {"Authorization": f"Bearer {token}"}
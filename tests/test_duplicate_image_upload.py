@@ -0,0 +1,134 @@
+"""并发上传相同内容的图片: 多出的 Cloudinary 图片登记删除后立即安排删除"""
+import io
+
+import pytest
+
+from app import crud, models
+from app.image_upload_worker import ImageUploadWorker
+from conftest import auth_headers, create_user
+
+pytestmark = pytest.mark.anyio
+
+IMAGE = b"same image bytes"
+EXISTING_URL = "https://cdn.invalid/img/first.jpg"
+DUPLICATE = {
+    "public_id": "img/duplicate",
+    "secure_url": "https://cdn.invalid/img/duplicate.jpg"
+}
+
+
+@pytest.fixture
+def raced_asset(db, monkeypatch):
+    """另一个请求在本次查找之后、登记之前上传并登记了相同内容的图片"""
+    digest = crud.compute_file_digest(io.BytesIO(IMAGE))
+    db.add(
+        models.ImageAsset(digest=digest,
+                          secure_url=EXISTING_URL,
+                          public_id="img/first",
+                          ref_count=1))
+    db.commit()
+
+    acquire = crud.acquire_image_asset
+    lookups = []
+
+    def acquire_after_race(session, digest):
+        lookups.append(digest)
+        # 第一次查找时另一个请求尚未登记
+        return None if len(lookups) == 1 else acquire(session, digest)
+
+    monkeypatch.setattr(crud, "acquire_image_asset", acquire_after_race)
+    return digest
+
+
+def pending_deletions(db):
+    db.expire_all()
+    return [
+        row.public_id for row in db.query(models.PendingImageDeletion.public_id)
+    ]
+
+
+async def test_create_message_schedules_deletion(db, raced_asset, client,
+                                                 monkeypatch):
+    import api.main
+
+    async def upload(file):
+        return DUPLICATE
+
+    drains = []
+    monkeypatch.setattr(crud, "upload_image_to_cloudinary", upload)
+    monkeypatch.setattr(api.main, "delete_pending_images",
+                        lambda: drains.append(pending_deletions(db)))
+    user = create_user(db, "alice")
+
+    response = await client.post("/messages/",
+                                 data={"content": "附圖留言"},
+                                 files={"file": ("a.jpg", IMAGE)},
+                                 headers=auth_headers(user))
+
+    assert response.status_code == 200, response.text
+    assert response.json()["data"]["image_url"] == EXISTING_URL
+    # 响应后执行了一次批量删除，删除的是本次多上传的图片
+    assert drains == [["img/duplicate"]]
+
+
+async def test_create_message_without_duplicate_skips_drain(
+        db, client, monkeypatch):
+    import api.main
+
+    async def upload(file):
+        return DUPLICATE
+
+    drains = []
+    monkeypatch.setattr(crud, "upload_image_to_cloudinary", upload)
+    monkeypatch.setattr(api.main, "delete_pending_images",
+                        lambda: drains.append(True))
+    user = create_user(db, "alice")
+
+    response = await client.post("/messages/",
+                                 data={"content": "附圖留言"},
+                                 files={"file": ("a.jpg", IMAGE)},
+                                 headers=auth_headers(user))
+
+    assert response.status_code == 200, response.text
+    assert drains == []
+
+
+class FakeDeletionWorker:
+
+    def __init__(self):
+        self.notified = 0
+
+    def notify(self):
+        self.notified += 1
+
+
+async def test_worker_notifies_deletion_worker(db, tmp_path, raced_asset,
+                                               monkeypatch):
+
+    async def upload(file_obj, filename=None):
+        file_obj.close()
+        return DUPLICATE
+
+    monkeypatch.setattr(crud, "upload_stream_to_cloudinary", upload)
+    user = create_user(db, "alice")
+    message = models.Message(content="附圖留言", user_id=user.id)
+    db.add(message)
+    db.flush()
+    path = tmp_path / "upload"
+    path.write_bytes(IMAGE)
+    pending = models.PendingImageUpload(message_id=message.id,
+                                        file_path=str(path),
+                                        filename="a.jpg",
+                                        digest=raced_asset,
+                                        attempts=1)
+    db.add(pending)
+    db.commit()
+    deletion_worker = FakeDeletionWorker()
+    worker = ImageUploadWorker(deletion_worker)
+    monkeypatch.setattr(worker, "publish", lambda *args: None)
+
+    await worker.process(pending.id)
+
+    assert deletion_worker.notified == 1
+    assert pending_deletions(db) == ["img/duplicate"]
+    assert db.get(models.Message, message.id).image_url == EXISTING_URL
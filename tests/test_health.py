@@ -0,0 +1,45 @@
+"""健康检查缓存: 后台刷新间隔可配置，没有探测请求时不频繁连接数据库"""
+import asyncio
+
+import pytest
+
+from app.health import HealthMonitor
+
+pytestmark = pytest.mark.anyio
+
+
+def counting_monitor(monkeypatch, **kwargs) -> HealthMonitor:
+    monitor = HealthMonitor(lambda: None, **kwargs)
+    monitor.refreshes = 0
+
+    def refresh():
+        monitor.refreshes += 1
+        monitor.snapshot = {"components": {"database": {}}}
+
+    monkeypatch.setattr(monitor, "refresh", refresh)
+    return monitor
+
+
+def test_default_refresh_interval_is_longer_than_ttl():
+    monitor = HealthMonitor(lambda: None)
+    assert monitor.refresh_interval == 60
+    assert monitor.refresh_interval > monitor.ttl
+
+
+async def test_background_refresh_interval(monkeypatch):
+    monitor = counting_monitor(monkeypatch, ttl=10, refresh_interval=0.05)
+    task = asyncio.create_task(monitor.start())
+    await asyncio.sleep(0.175)
+    monitor.stop()
+    await task
+    # 启动时一次，之后每 0.05 秒一次
+    assert 3 <= monitor.refreshes <= 5
+
+
+async def test_background_refresh_disabled(monkeypatch):
+    monitor = counting_monitor(monkeypatch, refresh_interval=0)
+    await asyncio.wait_for(monitor.start(), 1)
+    assert monitor.refreshes == 0
+    # 请求时仍会刷新
+    monitor.get()
+    assert monitor.refreshes == 1
@@ -0,0 +1,307 @@
+"""延迟图片上传: 重试间隔、重试用尽后失败、启动时恢复未完成的上传"""
+import asyncio
+import os
+
+import pytest
+
+from app import crud, image_deletion, image_processing, models
+from app.database import SessionLocal
+from app.image_upload_worker import ImageUploadWorker
+from conftest import create_user
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeUpload:
+    """代替 crud.upload_stream_to_cloudinary，前 failures 次抛出异常"""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.calls = 0
+        self.paths = []
+
+    async def __call__(self, file_obj, filename=None):
+        self.paths.append(file_obj.name)
+        file_obj.close()
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError(f"upload failed #{self.calls}")
+        return {
+            "public_id": f"img/{self.calls}",
+            "secure_url": f"https://cdn.invalid/img/{self.calls}.jpg"
+        }
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    worker = ImageUploadWorker()
+    worker.delays = []
+    worker.published = []
+
+    async def retry_now(pending_id: int, delay: float):
+        # 记录等待时间后立即重新入队，测试不实际等待
+        worker.delays.append(delay)
+        worker.enqueue(pending_id)
+
+    monkeypatch.setattr(worker, "_retry_later", retry_now)
+    monkeypatch.setattr(
+        worker, "publish", lambda message_id, image_url, image_status: worker.
+        published.append((message_id, image_url, image_status)))
+    return worker
+
+
+@pytest.fixture
+def fake_upload(monkeypatch):
+
+    def install(failures: int = 0) -> FakeUpload:
+        upload = FakeUpload(failures)
+        monkeypatch.setattr(crud, "upload_stream_to_cloudinary", upload)
+        return upload
+
+    return install
+
+
+@pytest.fixture
+def preprocess_calls(monkeypatch):
+    """以桩函数代替图片预处理，返回调用记录"""
+    calls = []
+
+    async def fake_preprocess(src_path, dst_path):
+        calls.append(src_path)
+        with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+            dst.write(b"processed " + src.read())
+        return True
+
+    monkeypatch.setattr(image_processing, "preprocess_image_to",
+                        fake_preprocess)
+    return calls
+
+
+def add_pending(db, tmp_path, name: str = "photo.jpg", status="pending"):
+    user = db.query(models.User).first() or create_user(db, "alice")
+    message = models.Message(content="有圖片的留言", user_id=user.id)
+    db.add(message)
+    db.flush()
+    path = tmp_path / f"{message.id}.upload"
+    path.write_bytes(b"image bytes")
+    pending = models.PendingImageUpload(message_id=message.id,
+                                        file_path=str(path),
+                                        filename=name,
+                                        digest=f"digest-{message.id}",
+                                        status=status)
+    db.add(pending)
+    db.commit()
+    return message.id, pending.id, path
+
+
+async def drain(worker):
+    """依次处理队列中的上传(包括失败后重新入队的)"""
+    while not worker.queue.empty():
+        await worker.process(worker.queue.get_nowait())
+        # 让重试任务执行并重新入队
+        await asyncio.sleep(0)
+
+
+async def test_retries_with_backoff_then_succeeds(db, tmp_path, worker,
+                                                  fake_upload):
+    upload = fake_upload(failures=3)
+    message_id, pending_id, path = add_pending(db, tmp_path)
+
+    worker.enqueue(pending_id)
+    await drain(worker)
+
+    assert worker.delays == ImageUploadWorker.RETRY_DELAYS == [5, 30, 120]
+    assert upload.calls == 4
+    db.expire_all()
+    message = db.get(models.Message, message_id)
+    assert message.image_url == "https://cdn.invalid/img/4.jpg"
+    assert db.get(models.PendingImageUpload, pending_id) is None
+    assert not path.exists()
+    assert worker.published == [(message_id, message.image_url, None)]
+
+
+async def test_records_attempts_between_retries(db, tmp_path, worker,
+                                                fake_upload):
+    fake_upload(failures=1)
+    _, pending_id, path = add_pending(db, tmp_path)
+
+    await worker.process(pending_id)
+    await asyncio.sleep(0)
+
+    db.expire_all()
+    pending = db.get(models.PendingImageUpload, pending_id)
+    assert pending.status == "pending"
+    assert pending.attempts == 1
+    assert pending.last_error == "upload failed #1"
+    assert path.exists()
+    assert worker.delays == [5]
+
+
+async def test_fails_after_retries_exhausted(db, tmp_path, worker,
+                                             fake_upload):
+    upload = fake_upload(failures=100)
+    message_id, pending_id, path = add_pending(db, tmp_path)
+    version = crud.get_sync_version(db, crud.MESSAGES_SCOPE)
+
+    worker.enqueue(pending_id)
+    await drain(worker)
+
+    assert upload.calls == len(ImageUploadWorker.RETRY_DELAYS) + 1
+    db.expire_all()
+    pending = db.get(models.PendingImageUpload, pending_id)
+    assert pending.status == "failed"
+    assert pending.last_error == f"upload failed #{upload.calls}"
+    assert db.get(models.Message, message_id).image_url is None
+    assert not path.exists()
+    assert worker.published == [(message_id, None, "failed")]
+    # 客户端的留言列表缓存失效，能看到失败状态
+    assert crud.get_sync_version(db, crud.MESSAGES_SCOPE) > version
+    assert crud.get_image_statuses(db, [message_id]) == {message_id: "failed"}
+
+
+async def test_missing_file_fails_without_retry(db, tmp_path, worker,
+                                                fake_upload):
+    upload = fake_upload()
+    _, pending_id, path = add_pending(db, tmp_path)
+    path.unlink()
+
+    await worker.process(pending_id)
+
+    assert upload.calls == 0
+    assert worker.delays == []
+    db.expire_all()
+    assert db.get(models.PendingImageUpload, pending_id).status == "failed"
+
+
+async def test_recover_pending_on_start(db, tmp_path, worker, fake_upload):
+    fake_upload()
+    # 上次运行时未完成(含已重试过)的上传，以及已失败的上传
+    first_message, first, _ = add_pending(db, tmp_path)
+    second_message, second, _ = add_pending(db, tmp_path)
+    db.get(models.PendingImageUpload, second).attempts = 2
+    db.commit()
+    _, failed, failed_path = add_pending(db, tmp_path, status="failed")
+
+    task = asyncio.create_task(worker.start())
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if len(worker.published) == 2:
+            break
+    worker.stop()
+    await task
+
+    assert sorted(message_id for message_id, _, _ in worker.published) == [
+        first_message, second_message
+    ]
+    db.expire_all()
+    assert db.get(models.PendingImageUpload, first) is None
+    assert db.get(models.PendingImageUpload, second) is None
+    assert db.get(models.Message, first_message).image_url
+    # 已失败的上传不会自动重试
+    assert db.get(models.PendingImageUpload, failed).status == "failed"
+    assert failed_path.exists()
+
+
+async def test_deleted_message_discards_upload(db, tmp_path, worker,
+                                               fake_upload):
+    upload = fake_upload()
+    message_id, pending_id, path = add_pending(db, tmp_path)
+    # 模拟留言在上传前被删除(SQLite 未启用外键级联)
+    pending = db.get(models.PendingImageUpload, pending_id)
+    pending.message_id = message_id + 1000
+    db.commit()
+
+    await worker.process(pending_id)
+
+    assert upload.calls == 0
+    db.expire_all()
+    assert db.get(models.PendingImageUpload, pending_id) is None
+    assert not path.exists()
+
+
+async def test_message_deleted_during_upload(db, tmp_path, worker,
+                                             fake_upload, monkeypatch):
+    upload = fake_upload()
+    message_id, pending_id, path = add_pending(db, tmp_path)
+    deletions = []
+    monkeypatch.setattr(image_deletion, "delete_pending_images",
+                        lambda: deletions.append(True))
+
+    async def upload_then_delete(file_obj, filename=None):
+        # 上传期间用户删除了留言
+        other = SessionLocal()
+        try:
+            assert crud.delete_message(other, message_id)
+        finally:
+            other.close()
+        return await upload(file_obj, filename)
+
+    monkeypatch.setattr(crud, "upload_stream_to_cloudinary",
+                        upload_then_delete)
+
+    await worker.process(pending_id)
+
+    db.expire_all()
+    assert db.get(models.PendingImageUpload, pending_id) is None
+    assert db.get(models.Message, message_id) is None
+    # 刚上传的图片已无留言引用，登记删除并触发批量删除
+    assert [row.public_id for row in db.query(models.PendingImageDeletion)
+            ] == ["img/1"]
+    assert db.query(models.ImageAsset).count() == 0
+    assert deletions == [True]
+    assert worker.published == []
+    assert not path.exists()
+
+
+async def test_preprocesses_once_across_retries(db, tmp_path, worker,
+                                                fake_upload,
+                                                preprocess_calls):
+    upload = fake_upload(failures=2)
+    _, pending_id, path = add_pending(db, tmp_path)
+
+    worker.enqueue(pending_id)
+    await drain(worker)
+
+    processed = f"{path}.processed"
+    assert preprocess_calls == [str(path)]
+    assert upload.paths == [processed] * 3
+    assert not path.exists()
+    assert not os.path.exists(processed)
+
+
+async def test_recovery_reuses_preprocessed_file(db, tmp_path, worker,
+                                                 fake_upload,
+                                                 preprocess_calls):
+    upload = fake_upload()
+    # 上次运行已完成预处理，上传前进程退出
+    message_id, pending_id, path = add_pending(db, tmp_path)
+    processed = tmp_path / "processed.webp"
+    processed.write_bytes(b"processed")
+    db.get(models.PendingImageUpload, pending_id).processed_path = str(
+        processed)
+    db.commit()
+
+    task = asyncio.create_task(worker.start())
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if worker.published:
+            break
+    worker.stop()
+    await task
+
+    assert preprocess_calls == []
+    assert upload.paths == [str(processed)]
+    assert [m for m, _, _ in worker.published] == [message_id]
+    assert not path.exists()
+    assert not processed.exists()
+
+
+def test_executor_shutdown():
+    executor = image_processing.get_executor()
+    image_processing.shutdown()
+    assert image_processing._executor is None
+    with pytest.raises(RuntimeError):
+        executor.submit(print)
+    # 关闭后再次使用时重新建立
+    assert image_processing.get_executor() is not executor
+    image_processing.shutdown()
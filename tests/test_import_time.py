@@ -0,0 +1,25 @@
+"""冷启动导入: 延迟加载的模块不在启动时导入，导入耗时不超过预算"""
+import os
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+import check_import_time  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def startup_import():
+    return check_import_time.best_of(3)
+
+
+def test_deferred_modules_not_imported(startup_import):
+    _, modules, _ = startup_import
+    assert check_import_time.eager_imports(modules) == []
+
+
+def test_import_time_within_budget(startup_import):
+    total, _, _ = startup_import
+    assert total <= check_import_time.IMPORT_BUDGET_MS
@@ -0,0 +1,51 @@
+"""日志输出: serverless 环境同步写 stdout，长驻进程经由队列写出"""
+import atexit
+import logging
+from logging.handlers import QueueHandler
+
+import pytest
+
+from app import log
+
+
+@pytest.fixture
+def fresh_logging(monkeypatch):
+    """在未设置的状态下调用 setup_logging，结束后还原 app logger"""
+    logger = logging.getLogger(log.ROOT_LOGGER)
+    handlers = logger.handlers[:]
+    monkeypatch.setattr(log, "_configured", False)
+    monkeypatch.setattr(log, "_listener", None)
+    logger.handlers = []
+    yield logger
+    if log._listener:
+        atexit.unregister(log._listener.stop)
+        log._listener.stop()
+    logger.handlers = handlers
+
+
+def setup_handlers(logger, **kwargs) -> list:
+    """调用 setup_logging，返回新加入的 handler 类型(不含 pytest 的日志捕获)"""
+    existing = logger.handlers[:]
+    log.setup_logging(**kwargs)
+    return [type(h) for h in logger.handlers if h not in existing]
+
+
+def test_unqueued_logging_writes_before_returning(fresh_logging, capsys):
+    assert setup_handlers(fresh_logging,
+                          queued=False) == [logging.StreamHandler]
+
+    log.get_logger("api.main").warning("留言新增失敗 %s", 1)
+
+    # 日志调用返回时已写到 stdout，不依赖后台线程
+    assert "留言新增失敗 1" in capsys.readouterr().out
+    assert log._listener is None
+
+
+def test_queued_logging_uses_listener(fresh_logging):
+    assert setup_handlers(fresh_logging) == [QueueHandler]
+    assert log._listener is not None
+
+
+def test_setup_is_idempotent(fresh_logging):
+    assert len(setup_handlers(fresh_logging, queued=False)) == 1
+    assert setup_handlers(fresh_logging, queued=False) == []
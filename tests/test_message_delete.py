@@ -0,0 +1,47 @@
+"""删除留言: 尚未上传的暂存图片(原文件和预处理后的文件)一并删除"""
+from app import crud, models
+from conftest import create_user
+
+
+def add_pending_message(db, tmp_path, user):
+    message = models.Message(content="附圖留言", user_id=user.id)
+    db.add(message)
+    db.flush()
+    source = tmp_path / f"{message.id}.upload"
+    processed = tmp_path / f"{message.id}.upload.processed"
+    source.write_bytes(b"image bytes")
+    processed.write_bytes(b"processed bytes")
+    db.add(
+        models.PendingImageUpload(message_id=message.id,
+                                  file_path=str(source),
+                                  processed_path=str(processed),
+                                  filename="a.jpg"))
+    db.commit()
+    return message.id, source, processed
+
+
+def test_delete_message_removes_upload_files(db, tmp_path):
+    user = create_user(db, "alice")
+    message_id, source, processed = add_pending_message(db, tmp_path, user)
+
+    assert crud.delete_message(db, message_id)
+
+    assert not source.exists()
+    assert not processed.exists()
+    assert db.query(models.PendingImageUpload).count() == 0
+
+
+def test_bulk_delete_removes_upload_files(db, tmp_path):
+    user = create_user(db, "alice")
+    other = create_user(db, "bob")
+    deleted = [add_pending_message(db, tmp_path, user) for _ in range(2)]
+    kept = add_pending_message(db, tmp_path, other)
+
+    assert crud.bulk_delete_messages(db, user_id=user.id) == 2
+
+    for _, source, processed in deleted:
+        assert not source.exists()
+        assert not processed.exists()
+    _, source, processed = kept
+    assert source.exists() and processed.exists()
+    assert db.query(models.PendingImageUpload).count() == 1
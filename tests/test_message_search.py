@@ -0,0 +1,93 @@
+"""留言检索: 中文子字符串、多词、通配符转义与游标翻页"""
+import pytest
+
+from app import crud, models
+from conftest import auth_headers, create_user
+
+MESSAGES = [
+    "今天下午開會討論明年的預算",
+    "備份伺服器的資料",
+    "Budget review 100% done",
+    "snake_case 命名規則",
+]
+
+
+@pytest.fixture
+def author(db):
+    user = create_user(db, "alice")
+    for content in MESSAGES:
+        db.add(models.Message(content=content, user_id=user.id))
+    db.commit()
+    return user
+
+
+def search(db, q, **kwargs):
+    messages, _ = crud.search_messages(db, q, **kwargs)
+    return [m.content for m in messages]
+
+
+@pytest.mark.parametrize("order", ["rank", "recent"])
+@pytest.mark.parametrize(
+    "q, expected",
+    [
+        # 两个字的词(短于三字组，走 LIKE 过滤)
+        ("預算", ["今天下午開會討論明年的預算"]),
+        # 句子中间的词
+        ("開會討論", ["今天下午開會討論明年的預算"]),
+        ("伺服器", ["備份伺服器的資料"]),
+        # 多个词须同时出现
+        ("伺服器 資料", ["備份伺服器的資料"]),
+        ("伺服器 預算", []),
+        # 不区分大小写
+        ("BUDGET", ["Budget review 100% done"]),
+        # 通配符按字面匹配
+        ("%", ["Budget review 100% done"]),
+        ("_", ["snake_case 命名規則"]),
+        ("不存在", []),
+    ])
+def test_search_substrings(db, author, q, expected, order):
+    assert search(db, q, order=order) == expected
+
+
+def test_search_updated_and_deleted_messages(db, author):
+    message = db.query(models.Message).filter(
+        models.Message.content == MESSAGES[1]).one()
+    message.content = "還原資料庫備份"
+    db.commit()
+    assert search(db, "伺服器") == []
+    assert search(db, "資料庫") == ["還原資料庫備份"]
+
+    db.delete(message)
+    db.commit()
+    assert search(db, "資料庫") == []
+
+
+def test_search_pagination(db, author):
+    for i in range(5):
+        db.add(models.Message(content=f"第{i}則公告：停車場整修", user_id=author.id))
+    db.commit()
+
+    for q, order in (("停車場", "rank"), ("停車場", "recent"),
+                     ("公告", "rank"), ("公告", "recent")):
+        seen, cursor = [], None
+        while True:
+            messages, cursor = crud.search_messages(db,
+                                                    q,
+                                                    order=order,
+                                                    cursor=cursor,
+                                                    limit=2)
+            seen.extend(m.id for m in messages)
+            if cursor is None:
+                break
+        assert len(seen) == len(set(seen)) == 5
+
+
+@pytest.mark.anyio
+async def test_search_route(db, author, client):
+    response = await client.get("/messages/search",
+                                params={"q": "預算"},
+                                headers=auth_headers(author))
+    assert response.status_code == 200
+    items = response.json()["items"]
+    assert [m["content"] for m in items] == [MESSAGES[0]]
+    assert items[0]["display_name"] == "Anonymous"
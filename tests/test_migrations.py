@@ -0,0 +1,65 @@
+"""Alembic 迁移: 从原始表结构升级到 head 后主要路由可正常使用"""
+import pytest
+from alembic import command
+from sqlalchemy import inspect
+
+from app.database import Base, SessionLocal, engine
+from conftest import alembic_config, auth_headers, create_user
+
+
+def test_upgrade_creates_all_model_tables(migrated):
+    tables = set(inspect(engine).get_table_names())
+    assert set(Base.metadata.tables) <= tables
+
+
+@pytest.mark.anyio
+async def test_main_routes_after_upgrade(migrated, client):
+    db = SessionLocal()
+    user = create_user(db, "alice")
+    admin = create_user(db, "admin", is_admin=True)
+    headers, admin_headers = auth_headers(user), auth_headers(admin)
+    db.close()
+
+    response = await client.post("/messages/",
+                                 data={"content": "hello"},
+                                 headers=headers)
+    assert response.status_code == 200, response.text
+    message_id = response.json()["data"]["id"]
+    response = await client.get("/messages/", headers=headers)
+    assert response.status_code == 200
+    assert message_id in [m["id"] for m in response.json()]
+    # 迁移前后写入的留言都能以中文子字符串检索
+    for q, expected in (("舊留言", "升級前留下的舊留言"), ("hel", "hello")):
+        response = await client.get("/messages/search",
+                                    params={"q": q},
+                                    headers=headers)
+        assert response.status_code == 200, response.text
+        assert [m["content"] for m in response.json()["items"]] == [expected]
+    response = await client.delete(f"/messages/{message_id}",
+                                   headers=admin_headers)
+    assert response.status_code == 200
+
+    response = await client.post("/categories/",
+                                 json={
+                                     "category_name": "work",
+                                     "content": ""
+                                 },
+                                 headers=headers)
+    assert response.status_code == 200, response.text
+    response = await client.get("/tasks/all", headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["version"] > 0
+    assert [c["category_name"] for c in body["categories"]] == ["work"]
+    response = await client.get("/tasks/all",
+                                params={"since": 0},
+                                headers=headers)
+    assert response.status_code == 200
+
+
+def test_downgrade_to_base(migrated):
+    command.downgrade(alembic_config(), "base")
+    tables = set(inspect(engine).get_table_names())
+    assert "task_changes" not in tables
+    assert "sync_versions" not in tables
+    assert "users" in tables
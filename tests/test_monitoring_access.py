@@ -0,0 +1,68 @@
+"""监控端点的存取验证: 管理员或配置的监控 token"""
+import pytest
+
+from app.config import Config
+from conftest import auth_headers, create_user
+
+pytestmark = pytest.mark.anyio
+
+METRICS_TOKEN = "scrape-secret"
+
+
+@pytest.fixture
+def metrics_token(monkeypatch):
+    monkeypatch.setattr(Config, "METRICS_TOKEN", METRICS_TOKEN)
+    return {"Authorization": f"Bearer {METRICS_TOKEN}"}
+
+
+async def test_metrics_requires_credentials(db, client, metrics_token):
+    response = await client.get("/metrics")
+    assert response.status_code == 403
+    response = await client.get("/metrics",
+                                headers={"Authorization": "Bearer wrong"})
+    assert response.status_code == 401
+
+
+async def test_metrics_rejects_regular_user(db, client, metrics_token):
+    user = create_user(db, "alice")
+    response = await client.get("/metrics", headers=auth_headers(user))
+    assert response.status_code == 403
+
+
+async def test_metrics_allows_admin_and_token(db, client, metrics_token):
+    admin = create_user(db, "admin", is_admin=True)
+    for headers in (auth_headers(admin), metrics_token):
+        response = await client.get("/metrics", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+
+
+async def test_metrics_token_unset(db, client, monkeypatch):
+    monkeypatch.setattr(Config, "METRICS_TOKEN", None)
+    response = await client.get("/metrics",
+                                headers={"Authorization": "Bearer "})
+    assert response.status_code == 403
+
+
+async def test_health_liveness_is_public(db, client):
+    response = await client.get("/api/health")
+    assert response.status_code in (200, 503)
+    assert "scheduler" not in response.json()["components"]
+
+
+async def test_deep_health_requires_credentials(db, client, metrics_token):
+    user = create_user(db, "alice")
+    response = await client.get("/api/health", params={"deep": 1})
+    assert response.status_code == 403
+    response = await client.get("/api/health",
+                                params={"deep": 1},
+                                headers=auth_headers(user))
+    assert response.status_code == 403
+
+    admin = create_user(db, "admin", is_admin=True)
+    for headers in (auth_headers(admin), metrics_token):
+        response = await client.get("/api/health",
+                                    params={"deep": 1},
+                                    headers=headers)
+        assert response.status_code in (200, 503)
+        assert "scheduler" in response.json()["components"]
@@ -0,0 +1,27 @@
+"""热点查询执行计划: 模型和迁移建立的表结构都不对大表做全表扫描"""
+import os
+import sys
+
+import pytest
+
+from app.database import engine
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+import check_query_plans  # noqa: E402
+
+HOT_QUERIES = check_query_plans.hot_queries()
+
+
+@pytest.fixture(params=["schema", "migrated"])
+def any_schema(request):
+    """模型直接建立的表结构，以及从原始表结构迁移到 head 的表结构"""
+    request.getfixturevalue(request.param)
+
+
+@pytest.mark.parametrize("query",
+                         [query for _, query in HOT_QUERIES],
+                         ids=[name for name, _ in HOT_QUERIES])
+def test_hot_query_uses_index(any_schema, query):
+    with engine.connect() as conn:
+        assert check_query_plans.full_scans(conn, query) == []
@@ -0,0 +1,38 @@
+"""数据版本号: 首次递增建立记录，并发递增不会冲突或遗漏"""
+from concurrent.futures import ThreadPoolExecutor
+
+from app import crud
+from app.database import SessionLocal
+
+
+def bump(scope: str):
+    db = SessionLocal()
+    try:
+        crud.bump_sync_version(db, scope)
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_bump_creates_and_increments(db):
+    assert crud.get_sync_version(db, "messages") == 0
+    crud.bump_sync_version(db, "messages")
+    crud.bump_sync_version(db, "messages")
+    crud.bump_sync_version(db, "tasks")
+    db.commit()
+    assert crud.get_sync_version(db, "messages") == 2
+    assert crud.get_sync_version(db, "tasks") == 1
+
+
+def test_bump_rolls_back_with_transaction(db):
+    crud.bump_sync_version(db, "messages")
+    db.commit()
+    crud.bump_sync_version(db, "messages")
+    db.rollback()
+    assert crud.get_sync_version(db, "messages") == 1
+
+
+def test_concurrent_bumps(db):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(bump, ["messages"] * 40))
+    assert crud.get_sync_version(db, "messages") == 40
@@ -0,0 +1,74 @@
+"""批量更新任务数据: 与单项更新相同，可清空内容，未提供的时间和状态保持原值"""
+import pytest
+
+from app import crud, models, schemas
+from conftest import auth_headers, create_user
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def tasks(db):
+    user = create_user(db, "alice")
+    category = crud.create_task_category(
+        db, schemas.TaskCategoryCreate(category_name="工作", content=""),
+        user.id)
+    item = crud.create_task_item(
+        db,
+        schemas.TaskItemCreate(category_id=category.id,
+                               item_name="報告",
+                               content="舊內容"), user.id)
+    progresses = crud.create_task_progresses(db, [
+        schemas.TaskProgressCreate(item_id=item.id,
+                                   progress_name=name,
+                                   content="舊內容",
+                                   status=1) for name in ("初稿", "定稿")
+    ], user.id)
+    return user, item.id, [p["id"] for p in progresses]
+
+
+async def test_batch_update_items_clears_content(db, client, tasks):
+    user, item_id, _ = tasks
+    item_at = db.get(models.TaskItem, item_id).item_at
+
+    response = await client.put("/items/batch",
+                                json=[{
+                                    "id": item_id,
+                                    "item_name": "報告",
+                                    "content": ""
+                                }],
+                                headers=auth_headers(user))
+
+    assert response.status_code == 200
+    assert response.json()[0]["content"] == ""
+    db.expire_all()
+    item = db.get(models.TaskItem, item_id)
+    assert item.content == ""
+    assert item.item_at == item_at
+
+
+async def test_batch_update_progresses_like_single_update(db, client, tasks):
+    user, _, (first, second) = tasks
+
+    response = await client.put("/progresses/batch",
+                                json=[{
+                                    "id": first,
+                                    "progress_name": "初稿",
+                                    "content": ""
+                                }, {
+                                    "id": second,
+                                    "progress_name": "定稿",
+                                    "status": 2
+                                }],
+                                headers=auth_headers(user))
+
+    assert response.status_code == 200
+    db.expire_all()
+    rows = {
+        p.id: p
+        for p in db.query(models.TaskProgress).filter(
+            models.TaskProgress.id.in_([first, second]))
+    }
+    # 与 PUT /progresses/{id} 相同: 未提供 content 时清空，未提供 status 时保持
+    assert (rows[first].content, rows[first].status) == ("", 1)
+    assert (rows[second].content, rows[second].status) == ("", 2)
@@ -0,0 +1,149 @@
+"""任务变更记录的清理: 保留每个用户最新的一条，过旧的增量同步改为全量同步"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import update
+
+from app import crud, models, retention, schemas
+from conftest import auth_headers, create_user
+
+NOW = datetime(2026, 10, 19, tzinfo=timezone.utc)
+OLD = NOW - timedelta(days=90)
+
+
+def add_category(db, user, name):
+    return crud.create_task_category(
+        db, schemas.TaskCategoryCreate(category_name=name), user.id)
+
+
+def age_changes(db, up_to_id):
+    """把 id 不大于 up_to_id 的变更记录改为 90 天前"""
+    db.execute(
+        update(models.TaskChange).where(
+            models.TaskChange.id <= up_to_id).values(created_at=OLD))
+    db.commit()
+
+
+def change_ids(db, user):
+    return [
+        row.id for row in db.query(models.TaskChange.id).filter(
+            models.TaskChange.user_id == user.id).order_by(
+                models.TaskChange.id)
+    ]
+
+
+@pytest.fixture
+def users(db):
+    alice, bob = create_user(db, "alice"), create_user(db, "bob")
+    for name in ("工作", "家務", "學習"):
+        add_category(db, alice, name)
+    # bob 只有一条旧的变更，须保留以维持版本号
+    add_category(db, bob, "旅行")
+    return alice, bob
+
+
+def test_prune_keeps_latest_change_per_user(db, users):
+    alice, bob = users
+    alice_ids, bob_ids = change_ids(db, alice), change_ids(db, bob)
+    age_changes(db, max(alice_ids + bob_ids))
+    versions = (crud.get_task_version(db, alice.id),
+                crud.get_task_version(db, bob.id))
+
+    deleted = retention.prune_task_changes(db,
+                                           NOW - timedelta(days=30),
+                                           batch_size=1)
+
+    assert deleted == 2
+    assert change_ids(db, alice) == alice_ids[-1:]
+    assert change_ids(db, bob) == bob_ids
+    assert (crud.get_task_version(db, alice.id),
+            crud.get_task_version(db, bob.id)) == versions
+    assert crud.get_sync_version(db, crud.TASK_CHANGES_PRUNED_SCOPE) == (
+        alice_ids[1])
+
+
+def test_prune_skips_recent_changes(db, users):
+    alice, _ = users
+    before = change_ids(db, alice)
+    assert retention.prune_task_changes(db, NOW - timedelta(days=30),
+                                        100) == 0
+    assert change_ids(db, alice) == before
+    assert crud.task_changes_available(db, 1, 3)
+
+
+def test_pruned_watermark_never_decreases(db):
+    crud.raise_sync_version(db, crud.TASK_CHANGES_PRUNED_SCOPE, 10)
+    crud.raise_sync_version(db, crud.TASK_CHANGES_PRUNED_SCOPE, 4)
+    db.commit()
+    assert crud.get_sync_version(db, crud.TASK_CHANGES_PRUNED_SCOPE) == 10
+    assert not crud.task_changes_available(db, 9, 12)
+    assert crud.task_changes_available(db, 10, 12)
+    # since 已是用户的最新版本时不需要全量同步
+    assert crud.task_changes_available(db, 9, 9)
+
+
+def test_run_retention_reports_task_changes(db, users, monkeypatch):
+    alice, _ = users
+    age_changes(db, max(change_ids(db, alice)))
+    monkeypatch.setattr(retention.Config, "RETENTION_TASK_CHANGE_DAYS", 30)
+    report = retention.run_retention(now=NOW)
+    assert report["task_changes"] == 2
+
+
+@pytest.mark.anyio
+async def test_stale_since_gets_full_resync(db, users, client):
+    alice, _ = users
+    stale_since = change_ids(db, alice)[0]
+    age_changes(db, change_ids(db, alice)[-1])
+    retention.prune_task_changes(db, NOW - timedelta(days=30), 100)
+    add_category(db, alice, "新分類")
+    current = crud.get_task_version(db, alice.id)
+
+    response = await client.get("/tasks/all",
+                                params={"since": stale_since},
+                                headers=auth_headers(alice))
+    assert response.status_code == 200
+    body = response.json()
+    assert body["full_resync"] is True
+    assert body["version"] == current
+    assert sorted(c["category_name"] for c in body["categories"]) == sorted(
+        ["工作", "家務", "學習", "新分類"])
+
+    # since 不早于已清理的记录时照常增量同步
+    watermark = crud.get_sync_version(db, crud.TASK_CHANGES_PRUNED_SCOPE)
+    response = await client.get("/tasks/all",
+                                params={"since": watermark},
+                                headers=auth_headers(alice))
+    body = response.json()
+    assert "full_resync" not in body
+    assert body["since"] == watermark
+    # 保留下来的最新变更(學習)在 watermark 之后，同样返回
+    assert sorted(c["category_name"]
+                  for c in body["categories"]) == sorted(["學習", "新分類"])
+
+
+@pytest.mark.anyio
+async def test_idle_user_polls_settle_after_full_resync(db, users, client):
+    alice, bob = users
+    # bob 之后 alice 仍有变更，清理位置越过 bob 仅保留的最新变更
+    for name in ("運動", "閱讀"):
+        add_category(db, alice, name)
+    age_changes(db, max(change_ids(db, alice) + change_ids(db, bob)))
+    retention.prune_task_changes(db, NOW - timedelta(days=30), 100)
+    version = crud.get_task_version(db, bob.id)
+    assert version < crud.get_sync_version(db,
+                                           crud.TASK_CHANGES_PRUNED_SCOPE)
+
+    bodies = []
+    for _ in range(2):
+        response = await client.get("/tasks/all",
+                                    params={"since": version},
+                                    headers=auth_headers(bob))
+        assert response.status_code == 200
+        bodies.append(response.json())
+        version = bodies[-1]["version"]
+
+    for body in bodies:
+        assert "full_resync" not in body
+        assert body["version"] == crud.get_task_version(db, bob.id)
+        assert body["categories"] == []
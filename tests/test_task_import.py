@@ -0,0 +1,100 @@
+"""任务树导入: 整批提交或回滚，导入的通知加入调度"""
+from datetime import datetime, timezone
+
+import pytest
+
+from app import models
+from app.task_notify import TaskNotify
+from conftest import auth_headers, create_user
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def archive_owner(db):
+    user = create_user(db, "alice")
+    category = models.TaskCategory(user_id=user.id,
+                                   category_name="每週例行",
+                                   content="")
+    db.add(category)
+    db.flush()
+    item = models.TaskItem(user_id=user.id,
+                           category_id=category.id,
+                           item_name="備份",
+                           content="")
+    db.add(item)
+    db.flush()
+    progress = models.TaskProgress(user_id=user.id,
+                                   item_id=item.id,
+                                   progress_name="檢查備份",
+                                   content="確認備份檔可以還原")
+    db.add(progress)
+    db.flush()
+    for last_executed in (None, datetime(2026, 1, 1, tzinfo=timezone.utc)):
+        db.add(
+            models.TaskNotify(user_id=user.id,
+                              category_id=category.id,
+                              item_id=item.id,
+                              progress_id=progress.id,
+                              run_mode=0,
+                              run_code=1,
+                              last_executed=last_executed))
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def scheduler(db, monkeypatch):
+    import api.main
+    service = TaskNotify(db)
+    monkeypatch.setattr(api.main, "task_notify_service", service)
+    return service
+
+
+async def export(client, user) -> bytes:
+    response = await client.get("/tasks/export", headers=auth_headers(user))
+    assert response.status_code == 200
+    return response.content
+
+
+async def test_import_registers_notifies(db, archive_owner, scheduler,
+                                         client):
+    archive = await export(client, archive_owner)
+    importer = create_user(db, "bob")
+
+    response = await client.post("/tasks/import",
+                                 content=archive,
+                                 headers=auth_headers(importer))
+
+    assert response.status_code == 200, response.text
+    assert response.json()["imported"] == {
+        "categories": 1,
+        "items": 1,
+        "progresses": 1,
+        "notifies": 2
+    }
+    db.expire_all()
+    imported = db.query(models.TaskNotify).filter(
+        models.TaskNotify.user_id == importer.id,
+        models.TaskNotify.last_executed.is_(None)).one()
+    # 只有调度器会加载的通知(未执行过的单次通知)加入调度
+    assert [(n["id"], n["user_id"], n["username"])
+            for n in scheduler.notifies] == [(imported.id, importer.id,
+                                              "bob")]
+    assert scheduler.notifies[0]["progress_id"] == imported.progress_id
+
+
+async def test_import_rolls_back_on_error(db, archive_owner, scheduler,
+                                          client):
+    archive = await export(client, archive_owner)
+    importer = create_user(db, "bob")
+
+    response = await client.post("/tasks/import",
+                                 content=archive + b"{not json}\n",
+                                 headers=auth_headers(importer))
+
+    assert response.status_code == 422
+    db.expire_all()
+    assert db.query(models.TaskCategory).filter(
+        models.TaskCategory.user_id == importer.id).count() == 0
+    assert scheduler.notifies == []
@@ -0,0 +1,73 @@
+"""任务树检索: 中文名称和内容中的子字符串"""
+import pytest
+
+from app import crud, models
+from conftest import auth_headers, create_user
+
+
+@pytest.fixture
+def tree(db):
+    user = create_user(db, "alice")
+    other = create_user(db, "bob")
+    category = models.TaskCategory(user_id=user.id,
+                                   category_name="年度預算規劃",
+                                   content="")
+    db.add(category)
+    db.flush()
+    item = models.TaskItem(user_id=user.id,
+                           category_id=category.id,
+                           item_name="伺服器採購",
+                           content="比較三家廠商的報價")
+    db.add(item)
+    db.flush()
+    progress = models.TaskProgress(user_id=user.id,
+                                   item_id=item.id,
+                                   progress_name="已寄出詢價單",
+                                   content="等待廠商回覆報價")
+    db.add(progress)
+    # 其他用户的同名数据不应出现在结果中
+    db.add(
+        models.TaskCategory(user_id=other.id,
+                            category_name="年度預算規劃",
+                            content=""))
+    db.commit()
+    return user, category, item, progress
+
+
+def search(db, user, q):
+    return [(r["entity"], r["id"])
+            for r in crud.search_task_tree(db, user_id=user.id, q=q)]
+
+
+def test_search_chinese_names(db, tree):
+    user, category, item, progress = tree
+    # 名称中间的两个字、三个字以上的词
+    assert search(db, user, "預算") == [("category", category.id)]
+    assert search(db, user, "預算規劃") == [("category", category.id)]
+    assert search(db, user, "採購") == [("item", item.id)]
+    assert search(db, user, "詢價") == [("progress", progress.id)]
+    # 名称和内容一起检索
+    assert sorted(search(db, user, "廠商")) == sorted([("item", item.id),
+                                                     ("progress",
+                                                      progress.id)])
+    assert search(db, user, "廠商 回覆") == [("progress", progress.id)]
+    assert search(db, user, "不存在") == []
+
+
+def test_search_result_path(db, tree):
+    user, category, item, progress = tree
+    [result] = crud.search_task_tree(db, user_id=user.id, q="寄出")
+    assert result["category"] == {"id": category.id, "name": "年度預算規劃"}
+    assert result["item"] == {"id": item.id, "name": "伺服器採購"}
+    assert result["progress"] == {"id": progress.id, "name": "已寄出詢價單"}
+
+
+@pytest.mark.anyio
+async def test_search_route(db, tree, client):
+    user, category, _, _ = tree
+    response = await client.get("/tasks/search",
+                                params={"q": "預算"},
+                                headers=auth_headers(user))
+    assert response.status_code == 200
+    assert [(r["entity"], r["id"])
+            for r in response.json()] == [("category", category.id)]